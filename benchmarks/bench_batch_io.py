@@ -0,0 +1,35 @@
+"""Compares count of SYN probes per second, sent and matched
+ by SynProber with different batch sizes. Probes go to closed port
+ on loopback, so every probe is answered by RST. Requires root.
+
+ python -m benchmarks.bench_batch_io -n 20000"""
+
+import argparse
+import time
+from tcping import ping
+from tcping import syn_prober
+
+BATCH_SIZES = (1, 8, 64, 256)
+
+
+def bench_prober(count: int, batch_size: int, port: int) -> float:
+    prober = syn_prober.SynProber(batch_size=batch_size)
+    start = time.perf_counter()
+    prober.probe_many(('127.0.0.1', port, ping.RAW_SOCKET_TIMEOUT)
+                      for _ in range(count))
+    result = count / (time.perf_counter() - start)
+    prober.close()
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--count', default='20000', dest='count',
+                        help='count of probes')
+    parser.add_argument('-p', '--port', default='1', dest='port',
+                        help='closed port on loopback')
+    args = parser.parse_args()
+    for batch_size in BATCH_SIZES:
+        print('batch of {:>3}: {:>12,.0f} probes/s'.format(
+            batch_size,
+            bench_prober(int(args.count), batch_size, int(args.port))))
@@ -0,0 +1,41 @@
+"""Compares throughput of internet_checksum and of checksum,
+ calculated over characters of str two at a time.
+
+ python -m benchmarks.bench_checksum -n 20000 -s 1500"""
+
+import argparse
+import os
+import time
+from tcping import tcp_package
+
+
+def character_checksum(message: str) -> int:
+    sum = 0
+    for i in range(0, len(message), 2):
+        sum += (ord(message[i]) << 8) + (ord(message[i + 1]))
+    sum = (sum >> 16) + (sum & 0xffff)
+    sum += sum >> 16
+    return ~sum & 0xffff
+
+
+def bench(name: str, checksum, data, count: int):
+    start = time.perf_counter()
+    for _ in range(count):
+        checksum(data)
+    duration = time.perf_counter() - start
+    print('{:<18} {:>10.1f} MB/s'.format(
+        name, len(data) * count / duration / 2 ** 20))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--count', default='20000', dest='count',
+                        help='count of checksums')
+    parser.add_argument('-s', '--size', default='1500', dest='size',
+                        help='size of data in bytes')
+    args = parser.parse_args()
+    data = os.urandom(int(args.size) & ~1)
+    bench('str characters', character_checksum,
+          data.decode('latin-1'), int(args.count))
+    bench('internet_checksum', tcp_package.internet_checksum,
+          memoryview(data), int(args.count))
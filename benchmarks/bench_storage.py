@@ -0,0 +1,50 @@
+"""Compares memory and summary time of list of StatisticsData objects
+ and MeasureStore.
+
+ python -m benchmarks.bench_storage -n 10000000"""
+
+import argparse
+import random
+import time
+import tracemalloc
+from tcping import statistics
+from tcping.measures import MeasureStore, StatisticsData
+
+
+def iter_samples(count: int):
+    random.seed(0)
+    for _ in range(count):
+        if random.random() < 0.01:
+            rtt = -1
+        else:
+            rtt = random.uniform(0.001, 0.1)
+        yield StatisticsData(rtt, ip='127.0.0.1', port=80)
+
+
+def bench(name: str, make_container, count: int):
+    tracemalloc.start()
+    container = make_container(iter_samples(count))
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # list is converted to store by Statistics, so it is timed apart
+    start = time.perf_counter()
+    stat = statistics.Statistics(container, '127.0.0.1', 80)
+    load_time = time.perf_counter() - start
+    start = time.perf_counter()
+    str(stat)
+    summary_time = time.perf_counter() - start
+    print('{:<14} memory: {:>10.1f} MB ({:.1f} bytes/sample), '
+          'load: {:.3f} s, summary: {:.3f} s'.format(name,
+                                                     memory / 2 ** 20,
+                                                     memory / count,
+                                                     load_time,
+                                                     summary_time))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--count', default='10000000', dest='count',
+                        help='count of samples')
+    count = int(parser.parse_args().count)
+    bench('list', list, count)
+    bench('MeasureStore', MeasureStore.from_measures, count)
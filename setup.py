@@ -9,5 +9,6 @@ setup(name='tcp_ping',
       packages=find_packages(),
       test_suite='tests',
       install_requires=requirements,
+      extras_require={'numpy': ['numpy']},
       python_requires=">=3.8",
       )
@@ -1,9 +1,11 @@
 import argparse
+import socket
 from tcping import errors
+from tcping import pacing
 from tcping import ping
-from tcping import statistics
+from tcping import sample_log
+from tcping import socket_pool
 import logging
-import time
 
 
 def create_cmd_parser():
@@ -20,8 +22,30 @@ def create_cmd_parser():
                         help='to set port')
     parser.add_argument('-d', '--delay', default='0.5', dest='delay',
                         help='delay between pings in seconds')
+    parser.add_argument('--overrun', default='skip', dest='overrun',
+                        choices=pacing.OVERRUN_POLICIES,
+                        help='skip - to skip pings, which missed their time; '
+                             'catchup - to do them immediately')
     parser.add_argument('-6', '--ipv6', action='store_true', dest="use_ipv6",
                         help='to use ipv6')
+    parser.add_argument('--phases', action='store_true',
+                        dest='measure_phases',
+                        help='to measure duration of resolve, '
+                             'socket creation, connect and close separately')
+    parser.add_argument('--kernel-rtt', action='store_true',
+                        dest='kernel_rtt',
+                        help='to read rtt, estimated by kernel, '
+                             'by TCP_INFO (Linux only)')
+    parser.add_argument('--socket-pool', default='0', dest='socket_pool',
+                        help='count of sockets, created in advance '
+                             'and closed by RST; 0 - to create socket '
+                             'for every ping')
+    parser.add_argument('--source-ports', default=None, dest='source_ports',
+                        help='range of source ports of socket pool, '
+                             'like 40000-40999')
+    parser.add_argument('--export', default=None, dest='export',
+                        help='file to append every ping to, '
+                             'in binary log of fixed-size records')
     parser.add_argument('-o', '--output-level',
                         default='2',
                         dest="output_level",
@@ -31,22 +55,44 @@ def create_cmd_parser():
     return parser
 
 
+def create_socket_pool(args):
+    """Return SocketPool, configured by command line arguments,
+     or None, if pool is not requested."""
+
+    size = int(args.socket_pool)
+    if size <= 0 and args.source_ports is None:
+        return None
+    source_ports = None
+    if args.source_ports is not None:
+        source_ports = socket_pool.parse_port_range(args.source_ports)
+    family = socket.AF_INET6 if args.use_ipv6 else socket.AF_INET
+    return socket_pool.SocketPool(family, max(size, 1), source_ports)
+
+
 if __name__ == '__main__':
     cmd_parser = create_cmd_parser()
     args = cmd_parser.parse_args()
-    tcp_ping = ping.TCPing(destination=args.destination, port=args.port,
-                           timeout=args.timeout, use_ipv6=args.use_ipv6)
     pings_count = int(args.pings_count)
-    delay = float(args.delay)
+    schedule = pacing.DeadlineSchedule(float(args.delay), args.overrun)
     output_level = int(args.output_level)
+    writer = None
     try:
+        tcp_ping = ping.TCPing(destination=args.destination, port=args.port,
+                               timeout=args.timeout, use_ipv6=args.use_ipv6,
+                               keep_measures=False,
+                               measure_phases=args.measure_phases,
+                               kernel_rtt=args.kernel_rtt,
+                               socket_pool=create_socket_pool(args))
+        if args.export is not None:
+            writer = sample_log.SampleWriter(args.export)
         i = 0
         while i != pings_count:
-            measure = tcp_ping.do_ping()
+            lateness = schedule.wait()
+            measure = tcp_ping.do_ping(lateness=lateness)
             if output_level > 0:
                 print(str(measure))
-            if delay > measure:
-                time.sleep(delay - measure)
+            if writer is not None:
+                writer.write(measure)
             i += 1
     except errors.PingError as e:
         logging.basicConfig(level=logging.INFO)
@@ -54,10 +100,11 @@ if __name__ == '__main__':
         exit(1)
     except KeyboardInterrupt:
         pass
-    if output_level in (0, 2):
+    if tcp_ping.socket_pool is not None:
+        tcp_ping.socket_pool.close()
+    if writer is not None:
+        writer.close()
+    if output_level in (0, 2) and tcp_ping.statistics.benchmarks_count > 0:
         if output_level == 2:
             print()
-        stat = statistics.Statistics(tcp_ping.measures,
-                                     tcp_ping.ip,
-                                     tcp_ping.port)
-        print(stat)
+        print(tcp_ping.statistics)
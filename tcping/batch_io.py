@@ -0,0 +1,296 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import socket
+import struct
+from typing import Optional
+
+# messages per sendmmsg and recvmmsg call
+DEFAULT_BATCH_SIZE = 64
+# bytes of one message buffer
+DEFAULT_BUFFER_SIZE = 128
+# size of sockaddr_in6, enough for sockaddr_in too
+SOCKADDR_SIZE = 28
+
+# family field of sockaddr is in host byte order, the rest is in network one
+SOCKADDR_FAMILY = struct.Struct('=H')
+SOCKADDR_IN = struct.Struct('!H4s')
+SOCKADDR_IN6 = struct.Struct('!HL16s')
+SOCKADDR_IN6_SCOPE = struct.Struct('=L')
+# fields of iovec and msghdr, which are written for every message
+SIZE_T = struct.Struct('@N')
+UINT32 = struct.Struct('@I')
+# maximum count of cached sockaddr of destinations
+MAX_SOCKADDRS = 65536
+
+
+class IOVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t)]
+
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(IOVec)),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', MsgHdr),
+                ('msg_len', ctypes.c_uint)]
+
+
+def load_libc() -> Optional[ctypes.CDLL]:
+    """Return libc with sendmmsg and recvmmsg
+     or None, if platform does not have them."""
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, 'sendmmsg') or not hasattr(libc, 'recvmmsg'):
+        return None
+    libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p,
+                              ctypes.c_uint, ctypes.c_int]
+    libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p,
+                              ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    return libc
+
+
+libc = load_libc()
+
+
+def pack_sockaddr(buffer, offset: int, address: tuple):
+    """Write sockaddr_in or sockaddr_in6 of address into buffer
+     at offset and return its length."""
+
+    if ':' in address[0]:
+        SOCKADDR_FAMILY.pack_into(buffer, offset, socket.AF_INET6)
+        SOCKADDR_IN6.pack_into(buffer, offset + 2, address[1],
+                               address[2] if len(address) > 2 else 0,
+                               socket.inet_pton(socket.AF_INET6,
+                                                address[0]))
+        SOCKADDR_IN6_SCOPE.pack_into(buffer, offset + 24,
+                                     address[3] if len(address) > 3 else 0)
+        return SOCKADDR_SIZE
+    SOCKADDR_FAMILY.pack_into(buffer, offset, socket.AF_INET)
+    SOCKADDR_IN.pack_into(buffer, offset + 2, address[1],
+                          socket.inet_aton(address[0]))
+    # sin_zero is left zero
+    return 16
+
+
+def unpack_sockaddr(buffer, offset: int, length: int) -> Optional[tuple]:
+    """Return address tuple of sockaddr in buffer at offset,
+     or None, if it is not IPv4 or IPv6 address."""
+
+    if length < 2:
+        return None
+    family = SOCKADDR_FAMILY.unpack_from(buffer, offset)[0]
+    if family == socket.AF_INET and length >= 8:
+        port, addr = SOCKADDR_IN.unpack_from(buffer, offset + 2)
+        return socket.inet_ntoa(addr), port
+    if family == socket.AF_INET6 and length >= SOCKADDR_SIZE:
+        port, flowinfo, addr = SOCKADDR_IN6.unpack_from(buffer, offset + 2)
+        scope_id = SOCKADDR_IN6_SCOPE.unpack_from(buffer, offset + 24)[0]
+        return (socket.inet_ntop(socket.AF_INET6, addr),
+                port, flowinfo, scope_id)
+    return None
+
+
+def raise_errno():
+    error = ctypes.get_errno()
+    raise OSError(error, os.strerror(error))
+
+
+class MessageBatch:
+    """Preallocated buffers, addresses and mmsghdr array
+     for batch_size messages of at most buffer_size bytes.
+     Lengths are written through memoryviews by offsets,
+     because setting of ctypes fields is slow."""
+
+    def __init__(self, batch_size: int, buffer_size: int):
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.data = (ctypes.c_char * (batch_size * buffer_size))()
+        self.names = (ctypes.c_char * (batch_size * SOCKADDR_SIZE))()
+        self.iovecs = (IOVec * batch_size)()
+        self.messages = (MMsgHdr * batch_size)()
+        data_view = memoryview(self.data).cast('B')
+        self.names_view = memoryview(self.names).cast('B')
+        self.iovecs_view = memoryview(self.iovecs).cast('B')
+        self.messages_view = memoryview(self.messages).cast('B')
+        self.iov_len_offsets = [i * ctypes.sizeof(IOVec) +
+                                IOVec.iov_len.offset
+                                for i in range(batch_size)]
+        self.namelen_offsets = [i * ctypes.sizeof(MMsgHdr) +
+                                MsgHdr.msg_namelen.offset
+                                for i in range(batch_size)]
+        self.msg_len_offsets = [i * ctypes.sizeof(MMsgHdr) +
+                                MMsgHdr.msg_len.offset
+                                for i in range(batch_size)]
+        self.views = [data_view[i * buffer_size:(i + 1) * buffer_size]
+                      for i in range(batch_size)]
+        data_address = ctypes.addressof(self.data)
+        names_address = ctypes.addressof(self.names)
+        for i in range(batch_size):
+            self.iovecs[i].iov_base = data_address + i * buffer_size
+            self.iovecs[i].iov_len = buffer_size
+            header = self.messages[i].msg_hdr
+            header.msg_name = names_address + i * SOCKADDR_SIZE
+            header.msg_namelen = SOCKADDR_SIZE
+            header.msg_iov = ctypes.pointer(self.iovecs[i])
+            header.msg_iovlen = 1
+
+
+class BatchSender:
+    """Queues datagrams and sends them by one sendmmsg call per batch.
+     If platform has no sendmmsg or sock is not a real socket,
+     datagrams are sent by sendto one by one."""
+
+    def __init__(self, sock,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 use_mmsg: bool = True):
+        self.sock = sock
+        self.batch = MessageBatch(batch_size, buffer_size)
+        self.use_mmsg = use_mmsg and libc is not None \
+            and isinstance(sock, socket.socket)
+        self.count = 0
+        self.__addresses = []
+        self.__sockaddrs = {}
+
+    @property
+    def is_full(self) -> bool:
+        return self.count == self.batch.batch_size
+
+    def add(self, data, address: tuple):
+        """Copy datagram into the next buffer of batch.
+         Batch must be flushed, when it is full."""
+
+        if self.is_full:
+            raise BufferError('batch is full, it must be flushed')
+        i = self.count
+        batch = self.batch
+        size = len(data)
+        batch.views[i][:size] = data
+        SIZE_T.pack_into(batch.iovecs_view, batch.iov_len_offsets[i], size)
+        if self.use_mmsg:
+            sockaddr = self.__sockaddrs.get(address)
+            if sockaddr is None:
+                if len(self.__sockaddrs) >= MAX_SOCKADDRS:
+                    self.__sockaddrs.clear()
+                sockaddr = bytearray(SOCKADDR_SIZE)
+                del sockaddr[pack_sockaddr(sockaddr, 0, address):]
+                sockaddr = bytes(sockaddr)
+                self.__sockaddrs[address] = sockaddr
+            offset = i * SOCKADDR_SIZE
+            batch.names_view[offset:offset + len(sockaddr)] = sockaddr
+            UINT32.pack_into(batch.messages_view, batch.namelen_offsets[i],
+                             len(sockaddr))
+        else:
+            self.__addresses.append(address)
+        self.count += 1
+
+    def flush(self) -> int:
+        """Send all queued datagrams and return their count."""
+
+        count = self.count
+        if self.use_mmsg:
+            sent = 0
+            fileno = self.sock.fileno()
+            messages_address = ctypes.addressof(self.batch.messages)
+            while sent < count:
+                result = libc.sendmmsg(fileno,
+                                       messages_address +
+                                       sent * ctypes.sizeof(MMsgHdr),
+                                       count - sent, 0)
+                if result < 0:
+                    self.count = 0
+                    raise_errno()
+                sent += result
+        else:
+            try:
+                for i, address in enumerate(self.__addresses):
+                    size = SIZE_T.unpack_from(self.batch.iovecs_view,
+                                              self.batch.iov_len_offsets[i])[0]
+                    self.sock.sendto(self.batch.views[i][:size], address)
+            finally:
+                self.count = 0
+                self.__addresses.clear()
+        self.count = 0
+        return count
+
+
+class BatchReceiver:
+    """Receives up to batch_size datagrams by one recvmmsg call
+     into preallocated buffers, without blocking. If platform has
+     no recvmmsg, datagrams are received by recvfrom_into one by one.
+     Addresses are decoded only if with_addresses is set."""
+
+    def __init__(self, sock: socket.socket,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 with_addresses: bool = True,
+                 use_mmsg: bool = True):
+        self.sock = sock
+        self.batch = MessageBatch(batch_size, buffer_size)
+        self.with_addresses = with_addresses
+        self.use_mmsg = use_mmsg and libc is not None
+
+    @property
+    def views(self) -> list:
+        """Buffers of batch, reused by every receive."""
+
+        return self.batch.views
+
+    def receive(self) -> list:
+        """Return list of (buffer, size, address) of received datagrams;
+         buffers are reused by the next receive.
+         address is None, if with_addresses is not set."""
+
+        if not self.use_mmsg:
+            return self.__receive_one_by_one()
+        batch = self.batch
+        if self.with_addresses:
+            for offset in batch.namelen_offsets:
+                UINT32.pack_into(batch.messages_view, offset, SOCKADDR_SIZE)
+        count = libc.recvmmsg(self.sock.fileno(),
+                              ctypes.addressof(batch.messages),
+                              batch.batch_size, socket.MSG_DONTWAIT, None)
+        if count < 0:
+            if ctypes.get_errno() in (errno.EAGAIN, errno.EWOULDBLOCK,
+                                      errno.EINTR):
+                return []
+            raise_errno()
+        received = []
+        messages_view = batch.messages_view
+        for i in range(count):
+            size = UINT32.unpack_from(messages_view,
+                                      batch.msg_len_offsets[i])[0]
+            address = None
+            if self.with_addresses:
+                address = unpack_sockaddr(
+                    batch.names_view, i * SOCKADDR_SIZE,
+                    UINT32.unpack_from(messages_view,
+                                       batch.namelen_offsets[i])[0])
+            received.append((batch.views[i], size, address))
+        return received
+
+    def __receive_one_by_one(self) -> list:
+        received = []
+        for view in self.batch.views:
+            try:
+                size, address = self.sock.recvfrom_into(view, 0,
+                                                        socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                break
+            if not self.with_addresses:
+                address = None
+            received.append((view, size, address))
+        return received
@@ -0,0 +1,90 @@
+import ctypes
+import socket
+import struct
+from tcping import tcp_package
+
+# SO_ATTACH_FILTER of Linux, python socket module does not export it
+SO_ATTACH_FILTER = getattr(socket, 'SO_ATTACH_FILTER', 26)
+
+# opcodes of classic BPF, linux/filter.h
+BPF_LD = 0x00
+BPF_LDX = 0x01
+BPF_ALU = 0x04
+BPF_JMP = 0x05
+BPF_RET = 0x06
+BPF_W = 0x00
+BPF_H = 0x08
+BPF_B = 0x10
+BPF_IMM = 0x00
+BPF_ABS = 0x20
+BPF_IND = 0x40
+BPF_MSH = 0xa0
+BPF_AND = 0x50
+BPF_JEQ = 0x10
+BPF_JGT = 0x20
+BPF_JGE = 0x30
+BPF_JSET = 0x40
+BPF_K = 0x00
+
+# struct sock_filter: code, jt, jf, k
+SOCK_FILTER = struct.Struct('=HBBI')
+# struct sock_fprog: len and pointer to instructions
+SOCK_FPROG = struct.Struct('@HP')
+
+SYN_ACK = tcp_package.TCPPackageType.SYN | tcp_package.TCPPackageType.ACK
+# offsets of destination port and flags in tcp header
+TCP_DEST_PORT_OFFSET = 2
+TCP_FLAGS_OFFSET = 13
+
+
+def get_reply_filter(first_port: int, stop_port: int,
+                     snap_length: int = 0xffff,
+                     use_ipv6: bool = False) -> list:
+    """Return program of (code, jt, jf, k) instructions, which passes
+     only SYN-ACK and RST segments to destination ports
+     from first_port up to stop_port exclusive;
+     passed packets are truncated to snap_length bytes.
+     Raw IPv6 socket receives segments without IP header,
+     so for IPv6 offsets of TCP fields are not shifted."""
+
+    if use_ipv6:
+        load_header_size = (BPF_LDX | BPF_W | BPF_IMM, 0, 0, 0)
+    else:
+        # x = length of IPv4 header
+        load_header_size = (BPF_LDX | BPF_B | BPF_MSH, 0, 0, 0)
+    return [
+        load_header_size,
+        (BPF_LD | BPF_H | BPF_IND, 0, 0, TCP_DEST_PORT_OFFSET),
+        (BPF_JMP | BPF_JGE | BPF_K, 0, 6, first_port),
+        (BPF_JMP | BPF_JGE | BPF_K, 5, 0, stop_port),
+        (BPF_LD | BPF_B | BPF_IND, 0, 0, TCP_FLAGS_OFFSET),
+        (BPF_JMP | BPF_JSET | BPF_K, 2, 0,
+         tcp_package.TCPPackageType.RST),
+        (BPF_ALU | BPF_AND | BPF_K, 0, 0, SYN_ACK),
+        (BPF_JMP | BPF_JEQ | BPF_K, 0, 1, SYN_ACK),
+        (BPF_RET | BPF_K, 0, 0, snap_length),
+        (BPF_RET | BPF_K, 0, 0, 0),
+    ]
+
+
+def get_reject_filter() -> list:
+    """Return program, which rejects every packet; raw TCP socket,
+     which only sends, gets it, so kernel does not queue to it
+     copies of all inbound TCP segments."""
+
+    return [(BPF_RET | BPF_K, 0, 0, 0)]
+
+
+def attach_filter(sock: socket.socket, program: list) -> bool:
+    """Attach BPF program to socket by SO_ATTACH_FILTER.
+     Return False, if platform does not support socket filters."""
+
+    code = b''.join(SOCK_FILTER.pack(*instruction)
+                    for instruction in program)
+    instructions = ctypes.create_string_buffer(code, len(code))
+    fprog = SOCK_FPROG.pack(len(program), ctypes.addressof(instructions))
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+    except OSError:
+        return False
+    return True
@@ -16,3 +16,27 @@ class StatisticsError(PingError):
 
 class InvalidPort(PingError):
     message = 'Invalid port'
+
+
+class IncompatibleSketches(PingError):
+    message = 'sketches with different accuracy can not be merged'
+
+
+class RawSocketNotPermitted(PingError):
+    message = 'raw sockets require root privileges'
+
+
+class SourcePortsExhausted(PingError):
+    message = 'all source ports of range are in use'
+
+
+class InvalidSampleLog(PingError):
+    message = 'file is not a sample log of supported version'
+
+
+class InvalidTarget(PingError):
+    message = 'Invalid target'
+
+
+class InvalidInterval(PingError):
+    message = 'Invalid interval'
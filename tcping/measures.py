@@ -0,0 +1,193 @@
+import math
+import time
+from array import array
+from typing import Optional
+
+# phases of ping, which are measured in precise timing mode
+PHASES = ('resolve', 'socket', 'connect', 'close')
+
+
+class StatisticsData(float):
+    """Contains information about ping duration, destination ip and port
+    in case of exception in ping,
+     time equals -1 and field is_failed equals True.
+     In precise timing mode, phases contains duration of every phase.
+     kernel_rtt and kernel_rttvar contain rtt, estimated by kernel,
+     if it was read. lateness contains delay of start of ping
+     after its scheduled deadline, if ping was scheduled."""
+
+    def __init__(self, time: float, ip: str, port: int,
+                 timestamp: Optional[float] = None,
+                 phases: Optional[dict] = None,
+                 kernel_rtt: Optional[float] = None,
+                 kernel_rttvar: Optional[float] = None,
+                 lateness: Optional[float] = None):
+        super().__init__()
+        self.ip = ip
+        self.port = port
+        self.timestamp = timestamp
+        self.phases = phases
+        self.kernel_rtt = kernel_rtt
+        self.kernel_rttvar = kernel_rttvar
+        self.lateness = lateness
+        self.is_failed = False
+        if time < 0:
+            self.is_failed = True
+
+    def __str__(self):
+        """Return string with information about duration,
+         destination ip and por and status of a single ping"""
+
+        answer = 'From: [{}:{}];'.format(str(self.ip),
+                                         str(self.port))
+        if self.is_failed:
+            answer = ' '.join((answer, 'Failed;'))
+        else:
+            answer = ' '.join((answer, 'Time: {}ms;'
+                               .format(str(round(self * 1000, 3)))))
+        if self.phases:
+            answer = ' '.join((answer, 'Phases: {};'.format(', '.join(
+                '{} {}ms'.format(phase, round(self.phases[phase] * 1000, 3))
+                for phase in PHASES if phase in self.phases))))
+        if self.kernel_rtt is not None:
+            answer = ' '.join((answer, 'Kernel RTT: {}ms;'
+                               .format(round(self.kernel_rtt * 1000, 3))))
+        return answer
+
+
+class MeasureStore:
+    """Columnar storage of measures of one destination.
+     Time and timestamp of every ping are kept in arrays of doubles,
+     failures are kept in bitmap, ip and port are kept once.
+     Durations of phases are kept in separate arrays,
+     made when the first measure with phases is added;
+     missing durations are NaN. Rtt and rttvar, estimated by kernel,
+     and lateness of scheduled pings are kept the same way.
+     StatisticsData objects are made on demand, when store is indexed."""
+
+    def __init__(self, ip: Optional[str] = None, port: Optional[int] = None):
+        self.ip = ip
+        self.port = port
+        self.times = array('d')
+        self.timestamps = array('d')
+        self.failures = bytearray()
+        self.failed_count = 0
+        self.phases = {}
+        self.kernel = {}
+        self.schedule = {}
+
+    @staticmethod
+    def from_measures(all_measures) -> 'MeasureStore':
+        """Make store from iterable of StatisticsData objects."""
+
+        store = MeasureStore()
+        for measure in all_measures:
+            store.append(measure)
+        return store
+
+    def append(self, measure: StatisticsData):
+        """Add StatisticsData object to store."""
+
+        index = len(self.times)
+        if self.ip is None:
+            self.ip = measure.ip
+            self.port = measure.port
+        timestamp = getattr(measure, 'timestamp', None)
+        if timestamp is None:
+            timestamp = time.time()
+        self.times.append(measure)
+        self.timestamps.append(timestamp)
+        if index & 7 == 0:
+            self.failures.append(0)
+        if measure.is_failed:
+            self.failures[index >> 3] |= 1 << (index & 7)
+            self.failed_count += 1
+        MeasureStore.__append_optional(self.phases,
+                                       getattr(measure, 'phases', None),
+                                       index)
+        kernel_rtt = getattr(measure, 'kernel_rtt', None)
+        kernel_info = None
+        if kernel_rtt is not None:
+            kernel_info = {'rtt': kernel_rtt,
+                           'rttvar': measure.kernel_rttvar}
+        MeasureStore.__append_optional(self.kernel, kernel_info, index)
+        lateness = getattr(measure, 'lateness', None)
+        MeasureStore.__append_optional(
+            self.schedule,
+            {'lateness': lateness} if lateness is not None else None,
+            index)
+
+    @staticmethod
+    def __append_optional(columns: dict, values: Optional[dict], index: int):
+        if values:
+            for name in values:
+                if name not in columns:
+                    columns[name] = array('d', [math.nan]) * index
+        for name, column in columns.items():
+            value = values.get(name) if values else None
+            column.append(math.nan if value is None else value)
+
+    def is_failed(self, index: int) -> bool:
+        """Return True, if ping with index is failed."""
+
+        return bool(self.failures[index >> 3] & (1 << (index & 7)))
+
+    def phase_durations(self, phase: str) -> array:
+        """Return array with all measured durations of phase."""
+
+        return array('d', (duration
+                           for duration in self.phases.get(phase, ())
+                           if not math.isnan(duration)))
+
+    def kernel_values(self, name: str) -> array:
+        """Return array with all values of rtt or rttvar,
+         estimated by kernel."""
+
+        return array('d', (value
+                           for value in self.kernel.get(name, ())
+                           if not math.isnan(value)))
+
+    def lateness_values(self) -> array:
+        """Return array with lateness of all scheduled pings."""
+
+        return array('d', (value
+                           for value in self.schedule.get('lateness', ())
+                           if not math.isnan(value)))
+
+    def successful_times(self) -> array:
+        """Return array with time of all successful pings."""
+
+        if self.failed_count == 0:
+            return self.times
+        return array('d', (benchmark for benchmark in self.times
+                           if benchmark >= 0))
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, index: int) -> StatisticsData:
+        if index < 0:
+            index += len(self.times)
+        if not 0 <= index < len(self.times):
+            raise IndexError('measure index out of range')
+        measure = StatisticsData(self.times[index],
+                                 ip=self.ip,
+                                 port=self.port,
+                                 timestamp=self.timestamps[index])
+        measure.is_failed = self.is_failed(index)
+        phases = {phase: durations[index]
+                  for phase, durations in self.phases.items()
+                  if not math.isnan(durations[index])}
+        if phases:
+            measure.phases = phases
+        if 'rtt' in self.kernel and not math.isnan(self.kernel['rtt'][index]):
+            measure.kernel_rtt = self.kernel['rtt'][index]
+            measure.kernel_rttvar = self.kernel['rttvar'][index]
+        if 'lateness' in self.schedule \
+                and not math.isnan(self.schedule['lateness'][index]):
+            measure.lateness = self.schedule['lateness'][index]
+        return measure
+
+    def __iter__(self):
+        for index in range(len(self.times)):
+            yield self[index]
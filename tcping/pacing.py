@@ -0,0 +1,183 @@
+import asyncio
+import math
+import time
+from typing import Optional
+
+# count of per-destination buckets, after which idle ones are removed
+MAX_BUCKETS = 4096
+# what DeadlineSchedule does with deadlines, missed by overrun
+OVERRUN_POLICIES = ('skip', 'catchup')
+
+
+class TokenBucket:
+    """Rate limit of rate events per second with bursts of burst events,
+     implemented as GCRA: only theoretical arrival time is kept.
+     It is advanced by exact emission interval, not by time
+     of actual events, so schedule does not drift."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = float(rate)
+        self.interval = 1 / self.rate
+        self.tolerance = (max(1, int(burst)) - 1) * self.interval
+        self.tat = float('-inf')
+
+    def earliest(self, now: float) -> float:
+        """Return the earliest time, when the next event is allowed."""
+
+        return max(now, self.tat - self.tolerance)
+
+    def consume(self, at: float):
+        """Account event, which happens at time at."""
+
+        self.tat = max(self.tat, at) + self.interval
+
+    def is_idle(self, now: float) -> bool:
+        """Return True, if bucket is full, so it equals to new one."""
+
+        return self.tat <= now
+
+
+class Pacer:
+    """Paces probes by global rate and by rate of every destination;
+     zero rate is unlimited. reserve_destination and reserve return
+     delays, after which probe may be sent, so pacer serves both
+     blocking and asyncio loops. Probe waits for slot of its destination
+     first and reserves global slot only then, at actual send time,
+     so destination limited by its own rate does not hold global slots
+     of other destinations. Achieved rate is counted by times
+     of mark_sent calls; wait and wait_async call it after waiting."""
+
+    def __init__(self,
+                 rate: float = 0,
+                 per_destination_rate: float = 0,
+                 burst: int = 1,
+                 clock=time.monotonic):
+        self.rate = float(rate)
+        self.per_destination_rate = float(per_destination_rate)
+        self.burst = burst
+        self.clock = clock
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.buckets = {}
+        self.count = 0
+        self.first_at = None
+        self.last_at = None
+
+    def reserve_destination(self, destination) -> float:
+        """Reserve slot of probe to destination by per-destination rate
+         and return seconds to wait until it."""
+
+        if self.per_destination_rate <= 0 or destination is None:
+            return 0
+        now = self.clock()
+        bucket = self.__get_bucket(destination, now)
+        at = bucket.earliest(now)
+        bucket.consume(at)
+        return at - now
+
+    def reserve(self) -> float:
+        """Reserve send time of probe by global rate
+         and return seconds to wait until it."""
+
+        if self.bucket is None:
+            return 0
+        now = self.clock()
+        at = self.bucket.earliest(now)
+        self.bucket.consume(at)
+        return at - now
+
+    def mark_sent(self):
+        """Account probe, which is sent right now."""
+
+        now = self.clock()
+        self.count += 1
+        if self.first_at is None:
+            self.first_at = now
+        self.last_at = now
+
+    def wait(self, destination=None, sleep=time.sleep):
+        """Block until probe to destination may be sent."""
+
+        delay = self.reserve_destination(destination)
+        if delay > 0:
+            sleep(delay)
+        delay = self.reserve()
+        if delay > 0:
+            sleep(delay)
+        self.mark_sent()
+
+    async def wait_async(self, destination=None):
+        """Wait on running event loop until probe to destination
+         may be sent."""
+
+        delay = self.reserve_destination(destination)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.mark_sent()
+
+    @property
+    def achieved_rate(self) -> Optional[float]:
+        """Return probes per second, sent since the first probe,
+         or None, if less than two probes were sent."""
+
+        if self.count < 2 or self.last_at == self.first_at:
+            return None
+        return (self.count - 1) / (self.last_at - self.first_at)
+
+    def __get_bucket(self, destination, now: float) -> TokenBucket:
+        bucket = self.buckets.get(destination)
+        if bucket is None:
+            if len(self.buckets) >= MAX_BUCKETS:
+                self.buckets = {key: value
+                                for key, value in self.buckets.items()
+                                if not value.is_idle(now)}
+            bucket = TokenBucket(self.per_destination_rate, self.burst)
+            self.buckets[destination] = bucket
+        return bucket
+
+    def __str__(self) -> str:
+        requested = '{:.1f}/s'.format(self.rate) if self.rate > 0 \
+            else 'unlimited'
+        achieved = self.achieved_rate
+        achieved = '{:.1f}/s'.format(achieved) if achieved is not None \
+            else 'unknown'
+        return 'Rate: requested {}, achieved {}'.format(requested, achieved)
+
+
+class DeadlineSchedule:
+    """Deadlines of periodic probes on monotonic clock:
+     n-th deadline is start + n * interval, so time of work
+     between probes does not shift the next ones.
+     If probe overruns its slot, in skip mode missed deadlines
+     are dropped; in catchup mode they are kept, so probes
+     are sent back to back, until schedule is caught up."""
+
+    def __init__(self, interval: float,
+                 overrun: str = 'skip',
+                 clock=time.monotonic):
+        if overrun not in OVERRUN_POLICIES:
+            raise ValueError('overrun must be one of {}'
+                             .format(', '.join(OVERRUN_POLICIES)))
+        self.interval = float(interval)
+        self.overrun = overrun
+        self.clock = clock
+        self.deadline = None
+
+    def wait(self, sleep=time.sleep) -> float:
+        """Sleep until the next deadline and
+         return lateness of wake up after it in seconds."""
+
+        now = self.clock()
+        if self.deadline is None or self.interval <= 0:
+            self.deadline = now
+        elif self.overrun == 'skip' and now - self.deadline >= self.interval:
+            missed = math.floor((now - self.deadline) / self.interval)
+            self.deadline += missed * self.interval
+        deadline = self.deadline
+        if now < deadline:
+            sleep(deadline - now)
+            now = self.clock()
+        self.deadline = deadline + self.interval
+        return max(0.0, now - deadline)
@@ -1,57 +1,71 @@
+import asyncio
 import gc
 import socket
+import struct
 from tcping import errors
+from tcping import pacing
+from tcping import socket_pool as tcping_socket_pool
+from tcping import resolver as tcping_resolver
+from tcping import statistics
+from tcping.measures import MeasureStore, StatisticsData
 import time
 from enum import Enum
-import tcping.tcp_package as tcp_package
+from tcping import syn_prober
 from typing import Optional
 
 
+# seconds to wait for reply to SYN, if timeout is not set
+RAW_SOCKET_TIMEOUT = 1
+
+# tcpi_rtt and tcpi_rttvar fields of Linux struct tcp_info, in microseconds
+TCP_INFO_RTT = struct.Struct('=68xII')
+
+
 class ConnectionType(Enum):
     CONNECT = 1
     RAW_SOCKET = 2
 
 
-class StatisticsData(float):
-    """Contains information about ping duration, destination ip and port
-    in case of exception in ping,
-     time equals -1 and field is_failed equals True."""
-
-    def __init__(self, time: float, ip: str, port: int):
-        super().__init__()
-        self.ip = ip
-        self.port = port
-        self.is_failed = False
-        if time < 0:
-            self.is_failed = True
+def get_kernel_info(sock: socket.socket) -> dict:
+    """Return dict with kernel_rtt and kernel_rttvar in seconds,
+     estimated by kernel
+     for connected socket, read by getsockopt(TCP_INFO).
+     If platform does not support it, return empty dict."""
 
-    def __str__(self):
-        """Return string with information about duration,
-         destination ip and por and status of a single ping"""
-
-        answer = 'From: [{}:{}];'.format(str(self.ip),
-                                         str(self.port))
-        if self.is_failed:
-            return ' '.join((answer, 'Failed;'))
-        return ' '.join((answer, 'Time: {}ms;'
-                         .format(str(round(self * 1000, 3)))))
+    if not hasattr(socket, 'TCP_INFO'):
+        return {}
+    try:
+        tcp_info = sock.getsockopt(socket.IPPROTO_TCP,
+                                   socket.TCP_INFO,
+                                   TCP_INFO_RTT.size)
+    except OSError:
+        return {}
+    if len(tcp_info) < TCP_INFO_RTT.size:
+        return {}
+    rtt, rttvar = TCP_INFO_RTT.unpack(tcp_info)
+    return {'kernel_rtt': rtt / 10 ** 6, 'kernel_rttvar': rttvar / 10 ** 6}
 
 
 class TimeMeasure:
-    """Context manager for ping duration measuring."""
+    """Context manager for ping duration measuring.
+     Garbage collector is disabled inside of measuring by default;
+     coroutines, which share one event loop, should not toggle it."""
 
-    def __init__(self):
+    def __init__(self, disable_gc: bool = True):
         self.start_time = 0
         self.work_time = 0
+        self.disable_gc = disable_gc
 
     def __enter__(self):
-        gc.disable()
+        if self.disable_gc:
+            gc.disable()
         self.start_time = time.perf_counter()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.work_time = time.perf_counter() - self.start_time
-        gc.enable()
+        if self.disable_gc:
+            gc.enable()
 
 
 class TCPing:
@@ -61,93 +75,288 @@ class TCPing:
                  destination: Optional[str] = None,
                  port: int = 80,
                  timeout: float = 0,
-                 use_ipv6: bool = False):
+                 use_ipv6: bool = False,
+                 keep_measures: bool = True,
+                 resolver: Optional[tcping_resolver.Resolver] = None,
+                 measure_phases: bool = False,
+                 kernel_rtt: bool = False,
+                 socket_pool: Optional[
+                     tcping_socket_pool.SocketPool] = None):
         self.destination = destination
         self.port = int(port)
         self.timeout = float(timeout)
         self.ip = None
         self.use_ipv6: bool = use_ipv6
-        self.measures = []
+        self.keep_measures = keep_measures
+        self.measure_phases = measure_phases
+        self.kernel_rtt = kernel_rtt
+        self.measures = MeasureStore()
+        self.statistics = statistics.StreamingStatistics()
+        if resolver is None:
+            resolver = tcping_resolver.default_resolver
+        self.resolver = resolver
+        self.socket_pool = socket_pool
+
+    @property
+    def family(self) -> int:
+        """Return address family of ping."""
+
+        if self.use_ipv6:
+            return socket.AF_INET6
+        return socket.AF_INET
+
+    @property
+    def raw_socket_timeout(self) -> float:
+        """Return seconds to wait for reply to SYN."""
+
+        return self.timeout if self.timeout > 0 else RAW_SOCKET_TIMEOUT
+
+    def create_socket(self) -> socket.socket:
+        """Return socket for ping, taken from socket pool, if it is set."""
+
+        if self.socket_pool is not None:
+            return self.socket_pool.acquire()
+        return socket.socket(self.family, socket.SOCK_STREAM)
+
+    def refill_socket_pool(self):
+        """Replace used socket in pool by new one, if pool is set."""
 
-    def do_ping(self, option=ConnectionType.CONNECT) -> StatisticsData:
-        """Do one ping and return StatisticsData object."""
+        if self.socket_pool is not None:
+            self.socket_pool.fill()
 
+    def get_address(self) -> tuple:
+        """Return socket address of destination, resolved by resolver."""
+
+        addr = self.resolver.resolve(self.destination, self.port, self.family)
+        self.ip = addr[0]
+        return addr
+
+    def do_ping(self, option=ConnectionType.CONNECT,
+                lateness: Optional[float] = None) -> StatisticsData:
+        """Do one ping and return StatisticsData object.
+         lateness of scheduled ping is saved in measure."""
+
+        phases = {} if self.measure_phases else None
+        kernel_info = {} if self.kernel_rtt else None
         if option == ConnectionType.CONNECT:
-            work_time = self.ping_with_connect()
+            work_time = self.ping_with_connect(phases, kernel_info)
         else:
             work_time = self.ping_with_raw_socket()
-        measure = StatisticsData(work_time, ip=self.ip, port=self.port)
-        self.measures.append(measure)
+        measure = StatisticsData(work_time, ip=self.ip, port=self.port,
+                                 phases=phases,
+                                 lateness=lateness,
+                                 **(kernel_info or {}))
+        self.add_measure(measure)
+        return measure
+
+    def add_measure(self, measure: StatisticsData):
+        """Add measure to streaming statistics and,
+         if keep_measures is set, to store of measures."""
+
+        self.statistics.add(measure)
+        if self.keep_measures:
+            self.measures.append(measure)
+
+    def add_failed_measure(self, lateness: Optional[float] = None
+                           ) -> StatisticsData:
+        """Add failed measure of ping, which could not be started,
+         like ping of destination, which was not resolved,
+         and return it."""
+
+        measure = StatisticsData(-1, ip=self.ip, port=self.port,
+                                 lateness=lateness)
+        self.add_measure(measure)
         return measure
 
     def ping_with_raw_socket(self) -> float:
-        """Does TCP handshake by raw socket.
+        """Does TCP handshake by raw socket of shared SYN prober.
          Return duration of handshake; in case of exception return -1."""
 
-        source_ip: str = "192.168.0.1"
-        source_port: int = 0
-        dest_ip: str = socket.gethostbyname(self.destination)
-        if self.ip is None:
-            self.ip = dest_ip
-        seq: int = 0
-        ack_seq: int = 0
-        syn_pack = bytes(
-            tcp_package.TCPPackage(flags=tcp_package.TCPPackageType.SYN,
-                                   source_ip=source_ip,
-                                   dest_ip=dest_ip,
-                                   dest_port=self.port,
-                                   seq=seq,
-                                   ack_seq=ack_seq,
-                                   source_port=source_port))
-        try:
-            sock = socket.socket(socket.AF_INET,
-                                 socket.SOCK_RAW,
-                                 socket.IPPROTO_TCP)
-            sock.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
-            sock.settimeout(self.timeout)
-            with TimeMeasure() as measure:
-                # send syn
-                sock.sendto(syn_pack, (dest_ip, self.port))
-                response = None
-                # recive ack
-                while measure.work_time <= self.timeout and response is None:
-                    response = sock.recvfrom(4096)[0]
-                    if response is not None:
-                        if not (response[1] == socket.inet_aton(dest_ip)):
-                            response = None
-                if response is None:
-                    return -1
-                syn_ack_pack = tcp_package \
-                    .TCPPackage \
-                    .parse_tcp_ipv4_package(response)
-                if syn_ack_pack.seq != seq + 1:
-                    return -1
-            return measure.work_time
-        except (socket.gaierror, socket.herror):
-            raise errors.InvalidIpOrDomain
+        dest_ip: str = self.get_address()[0]
+        prober = syn_prober.get_default_prober(self.family)
+        return prober.ping(dest_ip, self.port, self.raw_socket_timeout)
 
-    def ping_with_connect(self) -> float:
+    def ping_with_connect(self,
+                          phases: Optional[dict] = None,
+                          kernel_info: Optional[dict] = None) -> float:
         """Do one ping and return time of ping duration.
-         In case of exception, return -1."""
+         In case of exception, return -1.
+         Only connect is measured; if phases dict is given,
+         durations of resolve, socket creation, connect and close
+         are written to it. If kernel_info dict is given,
+         rtt and rttvar, estimated by kernel, are written to it."""
 
-        addr = (self.destination, self.port)
-        family_addr = socket.AF_INET
-        if self.use_ipv6:
-            family_addr = socket.AF_INET6
-            addr = (*addr, 0, 0)
-        sock = socket.socket(family_addr, socket.SOCK_STREAM)
-        if self.timeout > 0:
-            sock.settimeout(self.timeout)
+        with TimeMeasure() as resolve_measure:
+            addr = self.get_address()
+        with TimeMeasure() as socket_measure:
+            sock = self.create_socket()
+            if self.timeout > 0:
+                sock.settimeout(self.timeout)
         try:
-            if self.ip is None:
-                self.ip = socket.gethostbyname(self.destination)
             with TimeMeasure() as measure:
                 sock.connect(addr)
-                sock.shutdown(socket.SHUT_RD)
+            if kernel_info is not None:
+                kernel_info.update(get_kernel_info(sock))
             return measure.work_time
-        except (socket.gaierror, socket.herror):
-            raise errors.InvalidIpOrDomain
-        except (ConnectionRefusedError, socket.timeout):
+        except OSError:
             return -1
         finally:
-            sock.close()
+            with TimeMeasure() as close_measure:
+                sock.close()
+            self.refill_socket_pool()
+            if phases is not None:
+                phases.update(resolve=resolve_measure.work_time,
+                              socket=socket_measure.work_time,
+                              connect=measure.work_time,
+                              close=close_measure.work_time)
+
+
+class AsyncTCPing(TCPing):
+    """Contains methods to do ping on asyncio event loop.
+     Handshake is done by non-blocking socket, so thousands of pings
+     can wait for connection at the same time in one thread."""
+
+    def do_ping(self, option=ConnectionType.CONNECT,
+                lateness: Optional[float] = None) -> StatisticsData:
+        """Do one ping and return StatisticsData object.
+         Thin synchronous wrapper over do_ping_async."""
+
+        if option != ConnectionType.CONNECT:
+            return super().do_ping(option, lateness)
+        return asyncio.run(self.do_ping_async(lateness))
+
+    async def do_ping_async(self, lateness: Optional[float] = None
+                            ) -> StatisticsData:
+        """Do one ping on running event loop
+         and return StatisticsData object."""
+
+        phases = {} if self.measure_phases else None
+        kernel_info = {} if self.kernel_rtt else None
+        work_time = await self.ping_with_connect_async(phases, kernel_info)
+        measure = StatisticsData(work_time, ip=self.ip, port=self.port,
+                                 phases=phases,
+                                 lateness=lateness,
+                                 **(kernel_info or {}))
+        self.add_measure(measure)
+        return measure
+
+    async def ping_with_connect_async(
+            self,
+            phases: Optional[dict] = None,
+            kernel_info: Optional[dict] = None) -> float:
+        """Do one ping by loop.sock_connect and return time
+         of ping duration. In case of exception, return -1.
+         Phases and kernel rtt are measured like in ping_with_connect."""
+
+        loop = asyncio.get_running_loop()
+        with TimeMeasure(disable_gc=False) as resolve_measure:
+            addr = await self.resolver.resolve_async(self.destination,
+                                                     self.port,
+                                                     self.family)
+        self.ip = addr[0]
+        timeout = self.timeout if self.timeout > 0 else None
+        with TimeMeasure(disable_gc=False) as socket_measure:
+            sock = self.create_socket()
+            sock.setblocking(False)
+        try:
+            with TimeMeasure(disable_gc=False) as measure:
+                await asyncio.wait_for(loop.sock_connect(sock, addr),
+                                       timeout)
+            if kernel_info is not None:
+                kernel_info.update(get_kernel_info(sock))
+            return measure.work_time
+        except (OSError, asyncio.TimeoutError):
+            return -1
+        finally:
+            with TimeMeasure(disable_gc=False) as close_measure:
+                sock.close()
+            self.refill_socket_pool()
+            if phases is not None:
+                phases.update(resolve=resolve_measure.work_time,
+                              socket=socket_measure.work_time,
+                              connect=measure.work_time,
+                              close=close_measure.work_time)
+
+
+async def run_pings(pings: list,
+                    count: int = 1,
+                    concurrency: int = 1000,
+                    pacer: Optional[pacing.Pacer] = None) -> list:
+    """Do count pings for every AsyncTCPing from pings,
+     keeping at most concurrency handshakes in flight;
+     if pacer is given, pings are started at its rate.
+     Measures are appended to measures of each ping;
+     ping, which raised PingError, gets failed measure.
+     Return list of all measures in order of pings."""
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited_ping(tcp_ping: AsyncTCPing) -> StatisticsData:
+        if pacer is not None:
+            await pacer.wait_async(tcp_ping.destination)
+        async with semaphore:
+            try:
+                return await tcp_ping.do_ping_async()
+            except errors.PingError:
+                return tcp_ping.add_failed_measure()
+
+    return await asyncio.gather(*(limited_ping(tcp_ping)
+                                  for tcp_ping in pings
+                                  for _ in range(count)))
+
+
+def do_pings(pings: list,
+             count: int = 1,
+             concurrency: int = 1000,
+             pacer: Optional[pacing.Pacer] = None) -> list:
+    """Synchronous wrapper over run_pings."""
+
+    return asyncio.run(run_pings(pings, count, concurrency, pacer))
+
+
+def do_raw_pings(pings: list,
+                 count: int = 1,
+                 pacer: Optional[pacing.Pacer] = None) -> list:
+    """Do count pings with raw socket for every TCPing from pings.
+     SYN segments of all pings are sent by batches
+     through shared probers, at rate of pacer, if it is given.
+     Ping, which raised PingError, like unresolved name, gets
+     failed measure and is not probed, so others are still pinged.
+     Measures are appended to measures of each ping;
+     return list of all measures in order of pings."""
+
+    pings = [tcp_ping for tcp_ping in pings for _ in range(count)]
+    indices_by_family = {}
+    for i, tcp_ping in enumerate(pings):
+        indices_by_family.setdefault(tcp_ping.family, []).append(i)
+    probes = [None] * len(pings)
+    for family, indices in indices_by_family.items():
+        probed_indices = []
+        targets = []
+        for i in indices:
+            tcp_ping = pings[i]
+            try:
+                dest_ip = tcp_ping.get_address()[0]
+            except errors.PingError:
+                continue
+            probed_indices.append(i)
+            targets.append((dest_ip,
+                            tcp_ping.port,
+                            tcp_ping.raw_socket_timeout))
+        if not targets:
+            continue
+        prober = syn_prober.get_default_prober(family)
+        for i, probe in zip(probed_indices,
+                            prober.probe_many(targets, pacer)):
+            probes[i] = probe
+    measures = []
+    for tcp_ping, probe in zip(pings, probes):
+        if probe is None:
+            measures.append(tcp_ping.add_failed_measure())
+            continue
+        work_time = probe.rtt if probe.is_open else -1
+        measure = StatisticsData(work_time, ip=probe.dest_ip,
+                                 port=tcp_ping.port)
+        tcp_ping.add_measure(measure)
+        measures.append(measure)
+    return measures
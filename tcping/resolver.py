@@ -0,0 +1,94 @@
+import asyncio
+import collections
+import socket
+import threading
+import time
+from tcping import errors
+from typing import Callable, Optional
+
+
+class Resolver:
+    """Caches results of name resolution, shared by all pings.
+     Address of name is kept for ttl seconds,
+     at most maxsize names are kept, least recently used are evicted.
+     Counts hits and misses of cache."""
+
+    def __init__(self,
+                 ttl: float = 300,
+                 maxsize: int = 4096,
+                 resolve_func: Optional[Callable] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.resolve_func = resolve_func or socket.getaddrinfo
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.__cache = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def resolve(self, host: str, port: int,
+                family: int = socket.AF_INET) -> tuple:
+        """Return socket address of host for connect,
+         resolving it only if it is not in cache."""
+
+        sockaddr = self.__get_cached((host, port, family))
+        if sockaddr is not None:
+            return sockaddr
+        try:
+            addr_info = self.resolve_func(host, port, family,
+                                          socket.SOCK_STREAM)
+        except (socket.gaierror, socket.herror, UnicodeError):
+            raise errors.InvalidIpOrDomain
+        return self.__put((host, port, family), addr_info)
+
+    async def resolve_async(self, host: str, port: int,
+                            family: int = socket.AF_INET) -> tuple:
+        """Like resolve, but does not block event loop in case of miss."""
+
+        sockaddr = self.__get_cached((host, port, family))
+        if sockaddr is not None:
+            return sockaddr
+        loop = asyncio.get_running_loop()
+        try:
+            addr_info = await loop.run_in_executor(None,
+                                                   self.resolve_func,
+                                                   host, port, family,
+                                                   socket.SOCK_STREAM)
+        except (socket.gaierror, socket.herror, UnicodeError):
+            raise errors.InvalidIpOrDomain
+        return self.__put((host, port, family), addr_info)
+
+    def clear(self):
+        """Remove all names from cache."""
+
+        with self.__lock:
+            self.__cache.clear()
+
+    def __len__(self):
+        return len(self.__cache)
+
+    def __get_cached(self, key: tuple) -> Optional[tuple]:
+        with self.__lock:
+            entry = self.__cache.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self.__cache.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def __put(self, key: tuple, addr_info: list) -> tuple:
+        if not addr_info:
+            raise errors.InvalidIpOrDomain
+        sockaddr = addr_info[0][4]
+        with self.__lock:
+            self.__cache[key] = (self.clock() + self.ttl, sockaddr)
+            self.__cache.move_to_end(key)
+            while len(self.__cache) > self.maxsize:
+                self.__cache.popitem(last=False)
+        return sockaddr
+
+
+# resolver, used by pings by default
+default_resolver = Resolver()
@@ -0,0 +1,219 @@
+import bisect
+import mmap
+import os
+import socket
+import struct
+import time
+from tcping import errors
+from tcping import measures
+from tcping import statistics
+from typing import Optional
+
+# magic, version and size of record
+HEADER = struct.Struct('<4sHH8x')
+MAGIC = b'TCPL'
+VERSION = 1
+# timestamp, time (-1 for failed ping), ip as IPv6 or IPv4-mapped
+# address, port and flags
+RECORD = struct.Struct('<dd16sHB5x')
+TIMESTAMP = struct.Struct('<d')
+
+FLAG_FAILED = 1
+FLAG_IPV6 = 2
+IPV4_MAPPED_PREFIX = bytes(10) + b'\xff\xff'
+
+
+def pack_ip(ip: Optional[str]) -> tuple:
+    """Return tuple (16 bytes of ip, flags of its family)."""
+
+    if not ip:
+        return bytes(16), 0
+    if ':' in ip:
+        return socket.inet_pton(socket.AF_INET6, ip), FLAG_IPV6
+    return IPV4_MAPPED_PREFIX + socket.inet_aton(ip), 0
+
+
+def unpack_ip(packed: bytes, flags: int) -> Optional[str]:
+    """Return ip, packed by pack_ip, or None, if it was not set."""
+
+    if flags & FLAG_IPV6:
+        return socket.inet_ntop(socket.AF_INET6, packed)
+    if packed == bytes(16):
+        return None
+    return socket.inet_ntoa(packed[12:])
+
+
+class SampleWriter:
+    """Appends measures to binary log of fixed-size records:
+     timestamp, time, destination ip and port and status of every ping.
+     Log is append-only, so it is written while it is read;
+     records are expected to be appended in order of timestamps."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+            return
+        try:
+            check_header(path)
+        except errors.InvalidSampleLog:
+            self.file.close()
+            raise
+
+    def write(self, measure: measures.StatisticsData):
+        """Append measure to log."""
+
+        timestamp = getattr(measure, 'timestamp', None)
+        if timestamp is None:
+            timestamp = time.time()
+        packed_ip, flags = pack_ip(measure.ip)
+        if measure.is_failed:
+            flags |= FLAG_FAILED
+        self.file.write(RECORD.pack(timestamp,
+                                    -1.0 if measure.is_failed
+                                    else float(measure),
+                                    packed_ip,
+                                    int(measure.port or 0),
+                                    flags))
+
+    def flush(self):
+        """Write buffered records to file."""
+
+        self.file.flush()
+
+    def close(self):
+        """Flush records and close log."""
+
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def check_header(path: str):
+    """Raise InvalidSampleLog, if file is not sample log of this version."""
+
+    with open(path, 'rb') as file:
+        header = file.read(HEADER.size)
+    if len(header) < HEADER.size or \
+            HEADER.unpack(header) != (MAGIC, VERSION, RECORD.size):
+        raise errors.InvalidSampleLog
+
+
+class RecordTimestamps:
+    """Sequence of timestamps of records, read from mapped log
+     on demand, so records can be found by bisect."""
+
+    def __init__(self, reader: 'SampleReader'):
+        self.reader = reader
+
+    def __len__(self):
+        return len(self.reader)
+
+    def __getitem__(self, index: int) -> float:
+        return TIMESTAMP.unpack_from(self.reader.data,
+                                     HEADER.size + index * RECORD.size)[0]
+
+
+class SampleReader:
+    """Reads log of SampleWriter by memory mapping.
+     Records are decoded on demand, and records of time window
+     are found by binary search over timestamps, so only
+     the window is read from disk. Records, appended after
+     opening, are seen after refresh."""
+
+    def __init__(self, path: str):
+        check_header(path)
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = None
+        self.count = 0
+        self.refresh()
+
+    def refresh(self):
+        """Map the current size of log."""
+
+        size = os.fstat(self.file.fileno()).st_size
+        count = (size - HEADER.size) // RECORD.size
+        if self.data is not None:
+            self.data.close()
+        self.data = mmap.mmap(self.file.fileno(), 0,
+                              access=mmap.ACCESS_READ)
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index: int) -> measures.StatisticsData:
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('record index out of range')
+        timestamp, work_time, packed_ip, port, flags = RECORD.unpack_from(
+            self.data, HEADER.size + index * RECORD.size)
+        measure = measures.StatisticsData(work_time,
+                                          ip=unpack_ip(packed_ip, flags),
+                                          port=port,
+                                          timestamp=timestamp)
+        measure.is_failed = bool(flags & FLAG_FAILED)
+        return measure
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def find_window(self, start: Optional[float] = None,
+                    end: Optional[float] = None) -> range:
+        """Return range of indices of records with timestamp
+         from start inclusive to end exclusive."""
+
+        timestamps = RecordTimestamps(self)
+        first = 0 if start is None else bisect.bisect_left(timestamps, start)
+        stop = self.count if end is None \
+            else bisect.bisect_left(timestamps, end)
+        return range(first, max(first, stop))
+
+    def get_measures(self, start: Optional[float] = None,
+                     end: Optional[float] = None,
+                     ip: Optional[str] = None,
+                     port: Optional[int] = None):
+        """Yield measures of time window;
+         if ip or port is given, only measures of that destination."""
+
+        for index in self.find_window(start, end):
+            measure = self[index]
+            if ip is not None and measure.ip != ip:
+                continue
+            if port is not None and measure.port != port:
+                continue
+            yield measure
+
+    def get_statistics(self, start: Optional[float] = None,
+                       end: Optional[float] = None,
+                       ip: Optional[str] = None,
+                       port: Optional[int] = None) -> statistics.Statistics:
+        """Return Statistics of measures of time window and destination;
+         raise StatisticsError, if there are no such measures."""
+
+        store = measures.MeasureStore.from_measures(
+            self.get_measures(start, end, ip, port))
+        return statistics.Statistics(store,
+                                     store.ip if ip is None else ip,
+                                     store.port if port is None else port)
+
+    def close(self):
+        """Unmap and close log."""
+
+        if self.data is not None:
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,68 @@
+import math
+from tcping import errors
+
+
+class QuantileSketch:
+    """Bounded-memory sketch of distribution of values, like DDSketch.
+     Value is put into bucket with index ceil(log(value, gamma)),
+     so every quantile is returned with relative error
+     not greater than relative_accuracy.
+     Sketches with the same accuracy can be merged."""
+
+    def __init__(self,
+                 relative_accuracy: float = 0.01,
+                 max_buckets: int = 2048,
+                 min_value: float = 1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.__log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float, count: int = 1):
+        """Add value to sketch count times."""
+
+        self.count += count
+        if value <= self.min_value:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / self.__log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+        if len(self.buckets) > self.max_buckets:
+            self.__collapse()
+
+    def merge(self, other: 'QuantileSketch'):
+        """Add all values of other sketch to this sketch."""
+
+        if other.gamma != self.gamma:
+            raise errors.IncompatibleSketches
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        while len(self.buckets) > self.max_buckets:
+            self.__collapse()
+
+    def quantile(self, q: float) -> float:
+        """Return estimation of q-quantile, 0 <= q <= 1.
+         In case of empty sketch, return 0."""
+
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def __collapse(self):
+        # the lowest buckets are merged, so tail quantiles stay accurate
+        lowest, second = sorted(self.buckets)[:2]
+        self.buckets[second] += self.buckets.pop(lowest)
@@ -0,0 +1,98 @@
+import errno
+import socket
+import struct
+from collections import deque
+from tcping import errors
+from typing import Optional
+
+# l_onoff = 1, l_linger = 0: close sends RST and skips TIME_WAIT
+LINGER_RESET = struct.pack('ii', 1, 0)
+
+
+def parse_port_range(text: str) -> tuple:
+    """Return tuple (first port, stop port) of range like '40000-40999',
+     last port is included. Raise InvalidPort, if range is invalid."""
+
+    first, _, last = text.partition('-')
+    try:
+        first = int(first)
+        last = int(last) if last else first
+    except ValueError:
+        raise errors.InvalidPort
+    if not 0 < first <= last <= 65535:
+        raise errors.InvalidPort
+    return first, last + 1
+
+
+class SocketPool:
+    """Keeps size TCP sockets, created and configured in advance,
+     so socket setup is out of measured path of ping.
+     Every socket has SO_LINGER 0, TCP_NODELAY and SO_REUSEADDR;
+     if source_ports range is given, sockets are bound
+     to its ports in rotation, skipping ports, which can not be bound.
+     Connected socket can not be reused, so it is just closed
+     by RST after ping, and the pool is refilled by fill,
+     when nothing is measured."""
+
+    def __init__(self, family: int = socket.AF_INET,
+                 size: int = 16,
+                 source_ports: Optional[tuple] = None,
+                 source_ip: str = ''):
+        self.family = family
+        self.size = int(size)
+        self.source_ports = range(*source_ports) if source_ports else None
+        self.source_ip = source_ip
+        self.__next_port = 0
+        self.__sockets = deque()
+        self.fill()
+
+    def fill(self):
+        """Create sockets, until pool has size of them."""
+
+        while len(self.__sockets) < self.size:
+            self.__sockets.append(self.create_socket())
+
+    def create_socket(self) -> socket.socket:
+        """Return new configured socket."""
+
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                            LINGER_RESET)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.source_ports is not None:
+                self.__bind(sock)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def acquire(self) -> socket.socket:
+        """Return socket from pool; if pool is empty,
+         create new socket."""
+
+        if self.__sockets:
+            return self.__sockets.popleft()
+        return self.create_socket()
+
+    def close(self):
+        """Close all sockets of pool."""
+
+        while self.__sockets:
+            self.__sockets.popleft().close()
+
+    def __len__(self):
+        return len(self.__sockets)
+
+    def __bind(self, sock: socket.socket):
+        for _ in range(len(self.source_ports)):
+            port = self.source_ports[self.__next_port]
+            self.__next_port = (self.__next_port + 1) % len(self.source_ports)
+            try:
+                sock.bind((self.source_ip, port))
+                return
+            except OSError as e:
+                if e.errno != errno.EADDRINUSE:
+                    raise
+        raise errors.SourcePortsExhausted
@@ -1,80 +1,192 @@
 from tcping import errors
+from tcping import measures
+from tcping import sketch
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# quantiles, shown in summary
+PERCENTILES = (50, 90, 99, 99.9)
 
 
 class Statistics:
     """Contains methods and properties for get statistics about group of pings.
-     Use StatisticsData objects."""
+     Use MeasureStore or list of StatisticsData objects;
+     aggregates are calculated over arrays of store in one pass
+     and recalculated only when new measures are added.
+     If NumPy is installed, the pass is vectorized
+     over buffer of store without copying."""
 
-    def __init__(self, all_measures: list, ip: str, port: int):
+    def __init__(self, all_measures, ip: str, port: int):
         if len(all_measures) == 0:
             raise errors.StatisticsError
-        self.__all_statistics_data = all_measures
+        if not isinstance(all_measures, measures.MeasureStore):
+            all_measures = measures.MeasureStore.from_measures(all_measures)
+        self.__store = all_measures
         self.__ip = ip
         self.__port = port
+        self.__summary = None
+        self.__summary_size = 0
+
+    def __get_summary(self) -> tuple:
+        """Return tuple (count of successful pings, sum, min, max time,
+         time of successful pings for percentiles or None,
+         if it was not collected yet),
+         calculated over time of successful pings."""
+
+        if self.__summary is None or \
+                self.__summary_size != len(self.__store):
+            if numpy is not None:
+                self.__summary = self.__get_summary_numpy()
+            else:
+                self.__summary = self.__get_summary_python()
+            self.__summary_size = len(self.__store)
+        return self.__summary
+
+    def __get_summary_numpy(self) -> tuple:
+        times = numpy.frombuffer(self.__store.times, dtype=numpy.float64)
+        successful_times = times[times >= 0]
+        # view of buffer is dropped, so store can grow again
+        del times
+        if len(successful_times) == 0:
+            return 0, 0.0, 0.0, 0.0, successful_times
+        return (len(successful_times),
+                float(successful_times.sum()),
+                float(successful_times.min()),
+                float(successful_times.max()),
+                successful_times)
+
+    def __get_summary_python(self) -> tuple:
+        successful_times = self.__store.successful_times()
+        if len(successful_times) == 0:
+            return 0, 0.0, 0.0, 0.0, []
+        return (len(successful_times),
+                sum(successful_times),
+                min(successful_times),
+                max(successful_times),
+                None)
 
     @property
     def benchmarks_count(self):
         """return count of measures"""
 
-        return len(self.__all_statistics_data)
+        return len(self.__store)
 
     @property
     def successful_benchmarks(self):
         """returns list, contains all successful measures."""
 
-        successful_benchmarks = []
-        for benchmark in self.__all_statistics_data:
-            if not benchmark.is_failed:
-                successful_benchmarks.append(benchmark)
-        return successful_benchmarks
+        return [benchmark for benchmark in self.__store
+                if not benchmark.is_failed]
 
     @property
     def successful_pings_count(self):
         """returns count of successful pings."""
 
-        return len(self.successful_benchmarks)
+        return self.__get_summary()[0]
 
     @property
     def failed_pings_count(self):
         """returns count of failed pings."""
-        return self.benchmarks_count - len(self.successful_benchmarks)
+        return self.benchmarks_count - self.successful_pings_count
 
     @property
     def average_time(self):
         """returns average time of all successful pings.
         In case of all pings are failed, return 0."""
 
-        try:
-            time = 0
-            for benchmark in self.successful_benchmarks:
-                time += benchmark
-            return time / self.successful_pings_count * 1000
-        except ZeroDivisionError:
+        count, time, _, _, _ = self.__get_summary()
+        if count == 0:
             return 0.0
+        return time / count * 1000
 
     @property
     def min_time(self):
         """Return minimum time of all successful pings."""
 
-        if len(self.successful_benchmarks) > 0:
-            min_time = self.successful_benchmarks[0]
-            for benchmark in self.successful_benchmarks:
-                min_time = min(min_time, benchmark)
-        else:
-            min_time = 0.0
-        return min_time * 1000
+        return self.__get_summary()[2] * 1000
 
     @property
     def max_time(self):
         """Return maximum time of all successful pings."""
 
-        if len(self.successful_benchmarks) > 0:
-            max_time = self.successful_benchmarks[0]
-            for benchmark in self.successful_benchmarks:
-                max_time = max(max_time, benchmark)
-        else:
-            max_time = 0.0
-        return max_time * 1000
+        return self.__get_summary()[3] * 1000
+
+    def percentile(self, percent: float) -> float:
+        """Return percentile of time of all successful pings,
+         interpolated linearly between the closest ranks.
+         In case of all pings are failed, return 0."""
+
+        summary = self.__get_summary()
+        if summary[0] == 0:
+            return 0.0
+        if numpy is not None:
+            return float(numpy.percentile(summary[4], percent)) * 1000
+        sorted_times = summary[4]
+        if sorted_times is None:
+            sorted_times = sorted(self.__store.successful_times())
+            self.__summary = summary[:4] + (sorted_times,)
+        rank = percent / 100 * (len(sorted_times) - 1)
+        lower = int(rank)
+        upper = min(lower + 1, len(sorted_times) - 1)
+        time = sorted_times[lower] + \
+            (sorted_times[upper] - sorted_times[lower]) * (rank - lower)
+        return time * 1000
+
+    @property
+    def phases(self) -> list:
+        """Return list of phases, which were measured."""
+
+        return [phase for phase in measures.PHASES
+                if phase in self.__store.phases]
+
+    def phase_average(self, phase: str) -> float:
+        """Return average duration of phase of pings.
+         In case of phase was not measured, return 0."""
+
+        return get_average(self.__store.phase_durations(phase)) * 1000
+
+    @property
+    def kernel_rtt_count(self) -> int:
+        """Return count of pings with rtt, estimated by kernel."""
+
+        return len(self.__store.kernel_values('rtt'))
+
+    @property
+    def kernel_rtt_average(self) -> float:
+        """Return average rtt, estimated by kernel.
+         In case of it was not read, return 0."""
+
+        return get_average(self.__store.kernel_values('rtt')) * 1000
+
+    @property
+    def kernel_rttvar_average(self) -> float:
+        """Return average rttvar, estimated by kernel.
+         In case of it was not read, return 0."""
+
+        return get_average(self.__store.kernel_values('rttvar')) * 1000
+
+    @property
+    def lateness_count(self) -> int:
+        """Return count of scheduled pings."""
+
+        return len(self.__store.lateness_values())
+
+    @property
+    def lateness_average(self) -> float:
+        """Return average lateness of scheduled pings.
+         In case of pings were not scheduled, return 0."""
+
+        return get_average(self.__store.lateness_values()) * 1000
+
+    @property
+    def lateness_max(self) -> float:
+        """Return maximum lateness of scheduled pings.
+         In case of pings were not scheduled, return 0."""
+
+        return max(self.__store.lateness_values(), default=0.0) * 1000
 
     @property
     def looses_percentage(self):
@@ -84,7 +196,9 @@ class Statistics:
 
     def __str__(self):
         """Return string, contains information about max, min, average time
-         and percentage of fails for all pings."""
+         and percentage of fails for all pings
+         and average duration of phases, rtt, estimated by kernel,
+         and lateness of scheduled pings, if they were measured."""
 
         return "Statistic tcping for [{}:{}]:\n" \
                "Pings count: {}, Successful: {}, Failed: {}\n" \
@@ -97,4 +211,259 @@ class Statistics:
                     round(self.looses_percentage, 3),
                     round(self.max_time, 3),
                     round(self.min_time, 3),
-                    round(self.average_time, 3))
+                    round(self.average_time, 3)) + \
+            get_phases_line(self) + get_kernel_rtt_line(self) + \
+            get_lateness_line(self)
+
+
+class StreamingStatistics:
+    """Accumulates statistics about group of pings incrementally,
+     in constant memory, so summary costs the same for any count of pings.
+     Mean and variance are calculated by Welford's algorithm,
+     jitter is calculated like interarrival jitter from RFC 3550,
+     percentiles are estimated by mergeable quantile sketch.
+     Use StatisticsData objects."""
+
+    def __init__(self, ip: str = None, port: int = None):
+        self.ip = ip
+        self.port = port
+        self.benchmarks_count = 0
+        self.successful_pings_count = 0
+        self.__min = 0.0
+        self.__max = 0.0
+        self.__mean = 0.0
+        self.__m2 = 0.0
+        self.__jitter = 0.0
+        self.__last = None
+        self.sketch = sketch.QuantileSketch()
+        self.__phase_sums = {}
+        self.kernel_rtt_count = 0
+        self.__kernel_rtt_sum = 0.0
+        self.__kernel_rttvar_sum = 0.0
+        self.lateness_count = 0
+        self.__lateness_sum = 0.0
+        self.__lateness_max = 0.0
+
+    def add(self, measure):
+        """Add StatisticsData object to statistics."""
+
+        if self.ip is None:
+            self.ip = measure.ip
+            self.port = measure.port
+        self.benchmarks_count += 1
+        phases = getattr(measure, 'phases', None)
+        if phases:
+            for phase, duration in phases.items():
+                phase_sum = self.__phase_sums.setdefault(phase, [0.0, 0])
+                phase_sum[0] += duration
+                phase_sum[1] += 1
+        kernel_rtt = getattr(measure, 'kernel_rtt', None)
+        if kernel_rtt is not None:
+            self.kernel_rtt_count += 1
+            self.__kernel_rtt_sum += kernel_rtt
+            self.__kernel_rttvar_sum += measure.kernel_rttvar
+        lateness = getattr(measure, 'lateness', None)
+        if lateness is not None:
+            self.lateness_count += 1
+            self.__lateness_sum += lateness
+            self.__lateness_max = max(self.__lateness_max, lateness)
+        if measure.is_failed:
+            return
+        value = float(measure)
+        self.successful_pings_count += 1
+        if self.successful_pings_count == 1:
+            self.__min = self.__max = value
+        else:
+            self.__min = min(self.__min, value)
+            self.__max = max(self.__max, value)
+        delta = value - self.__mean
+        self.__mean += delta / self.successful_pings_count
+        self.__m2 += delta * (value - self.__mean)
+        if self.__last is not None:
+            difference = abs(value - self.__last)
+            self.__jitter += (difference - self.__jitter) / 16
+        self.__last = value
+        self.sketch.add(value)
+
+    @property
+    def failed_pings_count(self):
+        """returns count of failed pings."""
+
+        return self.benchmarks_count - self.successful_pings_count
+
+    @property
+    def average_time(self):
+        """returns average time of all successful pings.
+        In case of all pings are failed, return 0."""
+
+        return self.__mean * 1000
+
+    @property
+    def min_time(self):
+        """Return minimum time of all successful pings."""
+
+        return self.__min * 1000
+
+    @property
+    def max_time(self):
+        """Return maximum time of all successful pings."""
+
+        return self.__max * 1000
+
+    @property
+    def variance(self):
+        """Return variance of time of all successful pings in ms^2."""
+
+        if self.successful_pings_count < 2:
+            return 0.0
+        return self.__m2 / (self.successful_pings_count - 1) * 1000 ** 2
+
+    @property
+    def std_deviation(self):
+        """Return standard deviation of time of all successful pings."""
+
+        return self.variance ** 0.5
+
+    @property
+    def jitter(self):
+        """Return smoothed difference between time of
+         consecutive successful pings."""
+
+        return self.__jitter * 1000
+
+    @property
+    def phases(self) -> list:
+        """Return list of phases, which were measured."""
+
+        return [phase for phase in measures.PHASES
+                if phase in self.__phase_sums]
+
+    def phase_average(self, phase: str) -> float:
+        """Return average duration of phase of pings.
+         In case of phase was not measured, return 0."""
+
+        if phase not in self.__phase_sums:
+            return 0.0
+        duration, count = self.__phase_sums[phase]
+        return duration / count * 1000
+
+    @property
+    def kernel_rtt_average(self) -> float:
+        """Return average rtt, estimated by kernel.
+         In case of it was not read, return 0."""
+
+        if self.kernel_rtt_count == 0:
+            return 0.0
+        return self.__kernel_rtt_sum / self.kernel_rtt_count * 1000
+
+    @property
+    def kernel_rttvar_average(self) -> float:
+        """Return average rttvar, estimated by kernel.
+         In case of it was not read, return 0."""
+
+        if self.kernel_rtt_count == 0:
+            return 0.0
+        return self.__kernel_rttvar_sum / self.kernel_rtt_count * 1000
+
+    @property
+    def lateness_average(self) -> float:
+        """Return average lateness of scheduled pings.
+         In case of pings were not scheduled, return 0."""
+
+        if self.lateness_count == 0:
+            return 0.0
+        return self.__lateness_sum / self.lateness_count * 1000
+
+    @property
+    def lateness_max(self) -> float:
+        """Return maximum lateness of scheduled pings."""
+
+        return self.__lateness_max * 1000
+
+    def percentile(self, percent: float) -> float:
+        """Return estimation of percentile of time
+         of all successful pings."""
+
+        return self.sketch.quantile(percent / 100) * 1000
+
+    @property
+    def looses_percentage(self):
+        """Return percentage of failed pings."""
+
+        if self.benchmarks_count == 0:
+            raise errors.StatisticsError
+        return (self.failed_pings_count / self.benchmarks_count) * 100
+
+    def __str__(self):
+        """Return string, contains information about max, min, average time,
+         deviation, jitter, percentiles
+          and percentage of fails for all pings
+          and average duration of phases, rtt, estimated by kernel,
+          and lateness of scheduled pings, if they were measured."""
+
+        percentiles = ', '.join('p{}: {}ms'.format(
+            percent, round(self.percentile(percent), 3))
+            for percent in PERCENTILES)
+        return "Statistic tcping for [{}:{}]:\n" \
+               "Pings count: {}, Successful: {}, Failed: {}\n" \
+               "Fails percentage: {}\n" \
+               "Max time: {}ms, Min time: {}ms, Average time {}ms\n" \
+               "Standard deviation: {}ms, Jitter: {}ms\n" \
+               "Percentiles: {}\n" \
+            .format(self.ip, self.port,
+                    self.benchmarks_count,
+                    self.successful_pings_count,
+                    self.failed_pings_count,
+                    round(self.looses_percentage, 3),
+                    round(self.max_time, 3),
+                    round(self.min_time, 3),
+                    round(self.average_time, 3),
+                    round(self.std_deviation, 3),
+                    round(self.jitter, 3),
+                    percentiles) + \
+            get_phases_line(self) + get_kernel_rtt_line(self) + \
+            get_lateness_line(self)
+
+
+def get_phases_line(stat) -> str:
+    """Return line with average duration of every measured phase
+     for Statistics or StreamingStatistics object;
+     if phases were not measured, return empty string."""
+
+    if not stat.phases:
+        return ""
+    return "Phases average: {}\n".format(', '.join(
+        '{} {}ms'.format(phase, round(stat.phase_average(phase), 3))
+        for phase in stat.phases))
+
+
+def get_kernel_rtt_line(stat) -> str:
+    """Return line with average rtt and rttvar, estimated by kernel,
+     for Statistics or StreamingStatistics object;
+     if they were not read, return empty string."""
+
+    if stat.kernel_rtt_count == 0:
+        return ""
+    return "Kernel RTT: average {}ms, rttvar {}ms\n".format(
+        round(stat.kernel_rtt_average, 3),
+        round(stat.kernel_rttvar_average, 3))
+
+
+def get_lateness_line(stat) -> str:
+    """Return line with average and maximum lateness of scheduled pings
+     for Statistics or StreamingStatistics object;
+     if pings were not scheduled, return empty string."""
+
+    if stat.lateness_count == 0:
+        return ""
+    return "Schedule lateness: average {}ms, max {}ms\n".format(
+        round(stat.lateness_average, 3),
+        round(stat.lateness_max, 3))
+
+
+def get_average(values) -> float:
+    """Return average of values; if there are no values, return 0."""
+
+    if len(values) == 0:
+        return 0.0
+    return sum(values) / len(values)
@@ -0,0 +1,359 @@
+import heapq
+import random
+import select
+import socket
+import time
+from tcping import batch_io
+from tcping import bpf
+from tcping import errors
+from tcping import pacing
+from tcping import tcp_package
+from typing import Optional
+
+SYN_ACK = tcp_package.TCPPackageType.SYN | tcp_package.TCPPackageType.ACK
+# maximum count of cached SYN templates
+MAX_TEMPLATES = 65536
+# source ports of SYN probes, first and stop; they are above
+# ephemeral range of Linux, 32768-60999, so kernel does not bind
+# own connections to them, which would take replies to probes;
+# custom range must be reserved by net.ipv4.ip_local_reserved_ports
+DEFAULT_SOURCE_PORTS = (61000, 65536)
+# bytes of received packet, enough for IPv4 header with options
+# and fixed part of TCP header; the rest of packet is not needed
+RECV_BUFFER_SIZE = 128
+
+
+class Probe:
+    """Contains information about one SYN probe.
+     rtt is None, while probe is in flight; -1, if probe was expired."""
+
+    __slots__ = ('dest_ip', 'dest_addr', 'dest_port', 'source_port', 'seq',
+                 'deadline', 'sent_at', 'rtt', 'is_open')
+
+    def __init__(self, dest_ip: str, dest_port: int,
+                 source_port: int, seq: int, deadline: float,
+                 family: int = socket.AF_INET):
+        self.dest_ip = dest_ip
+        self.dest_addr = int.from_bytes(socket.inet_pton(family, dest_ip),
+                                        'big')
+        self.dest_port = dest_port
+        self.source_port = source_port
+        self.seq = seq
+        self.deadline = deadline
+        self.sent_at = 0.0
+        self.rtt = None
+        self.is_open = False
+
+
+def get_source_ip(dest_ip: str, family: int = socket.AF_INET) -> str:
+    """Return ip of local interface, which is used to reach dest_ip."""
+
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    try:
+        sock.connect((dest_ip, 9))
+        return sock.getsockname()[0]
+    finally:
+        sock.close()
+
+
+def drain_socket(sock: socket.socket) -> int:
+    """Discard packets, queued to socket before its filter
+     was attached, and return count of them."""
+
+    count = 0
+    while True:
+        try:
+            sock.recv(RECV_BUFFER_SIZE, socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            return count
+        count += 1
+
+
+def make_raw_socket(include_headers: bool,
+                    family: int = socket.AF_INET) -> socket.socket:
+    """Return raw TCP socket; raise RawSocketNotPermitted,
+     if process has no privileges for it. IPv6 header is always
+     built by kernel, so include_headers is ignored for IPv6."""
+
+    try:
+        sock = socket.socket(family,
+                             socket.SOCK_RAW,
+                             socket.IPPROTO_TCP)
+    except PermissionError:
+        raise errors.RawSocketNotPermitted
+    if include_headers and family == socket.AF_INET:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
+    return sock
+
+
+class SynProber:
+    """Sends SYN segments by one raw socket and
+     matches SYN-ACK and RST replies, received by another raw socket.
+     Identity of probe is encoded into its sequence number,
+     so reply is matched to in-flight probe by dictionary lookup
+     of its acknowledgement number; it lets one prober keep
+     tens of thousands of probes in flight.
+     SYN segments are queued and sent by batches of batch_size
+     with one sendmmsg call, replies are received by recvmmsg
+     into preallocated buffers and
+     packets of other connections are rejected by their ports
+     before any object is made for them; own receive socket
+     is also filtered by BPF program in kernel, so only replies
+     to source ports of prober are copied to user space, and own
+     send socket rejects every packet, so inbound segments
+     are not queued to it.
+     One prober works with one address family; for IPv6
+     only TCP segments are sent and received by raw sockets,
+     and address of reply is taken from recvfrom."""
+
+    def __init__(self,
+                 source_ports: tuple = DEFAULT_SOURCE_PORTS,
+                 send_socket: Optional[socket.socket] = None,
+                 recv_socket: Optional[socket.socket] = None,
+                 batch_size: int = batch_io.DEFAULT_BATCH_SIZE,
+                 family: int = socket.AF_INET):
+        self.family = family
+        self.use_ipv6 = family == socket.AF_INET6
+        if send_socket is None:
+            send_socket = make_raw_socket(True, family)
+            if bpf.attach_filter(send_socket, bpf.get_reject_filter()):
+                drain_socket(send_socket)
+        self.send_socket = send_socket
+        self.source_ports = range(*source_ports)
+        if recv_socket is None:
+            recv_socket = make_raw_socket(False, family)
+            if bpf.attach_filter(recv_socket,
+                                 bpf.get_reply_filter(self.source_ports.start,
+                                                      self.source_ports.stop,
+                                                      RECV_BUFFER_SIZE,
+                                                      self.use_ipv6)):
+                # segments, received before filter, are not filtered
+                drain_socket(recv_socket)
+        self.recv_socket = recv_socket
+        self.recv_socket.setblocking(False)
+        self.in_flight = {}
+        self.__deadlines = []
+        self.__next_port = 0
+        self.__cookie = random.getrandbits(32)
+        self.__counter = 0
+        self.__source_ips = {}
+        self.__templates = {}
+        self.__queued = []
+        self.sender = batch_io.BatchSender(self.send_socket, batch_size)
+        self.receiver = batch_io.BatchReceiver(
+            self.recv_socket, batch_size, RECV_BUFFER_SIZE,
+            with_addresses=self.use_ipv6)
+
+    def get_template(self, dest_ip: str,
+                     dest_port: int) -> tcp_package.SynTemplate:
+        """Return cached SYN template for dest_ip:dest_port."""
+
+        template = self.__templates.get((dest_ip, dest_port))
+        if template is None:
+            if len(self.__templates) >= MAX_TEMPLATES:
+                self.__templates.clear()
+            template = tcp_package.SynTemplate(self.get_source_ip(dest_ip),
+                                               dest_ip,
+                                               dest_port,
+                                               use_ipv6=self.use_ipv6)
+            self.__templates[(dest_ip, dest_port)] = template
+        return template
+
+    def get_source_ip(self, dest_ip: str) -> str:
+        """Return cached ip of local interface for dest_ip."""
+
+        source_ip = self.__source_ips.get(dest_ip)
+        if source_ip is None:
+            source_ip = get_source_ip(dest_ip, self.family)
+            self.__source_ips[dest_ip] = source_ip
+        return source_ip
+
+    def queue(self, dest_ip: str, dest_port: int, timeout: float) -> Probe:
+        """Queue SYN to dest_ip:dest_port and return in-flight probe.
+         Queued segments are sent, when batch is full or by flush."""
+
+        source_port = self.source_ports[self.__next_port]
+        self.__next_port = (self.__next_port + 1) % len(self.source_ports)
+        seq = self.__get_seq()
+        syn_pack = self.get_template(dest_ip, dest_port).build(seq,
+                                                               source_port)
+        probe = Probe(dest_ip, dest_port, source_port, seq,
+                      time.perf_counter() + timeout, self.family)
+        self.in_flight[seq] = probe
+        heapq.heappush(self.__deadlines, (probe.deadline, seq))
+        self.sender.add(syn_pack, (dest_ip, 0))
+        self.__queued.append(probe)
+        if self.sender.is_full:
+            self.flush()
+        return probe
+
+    def flush(self):
+        """Send all queued SYN segments."""
+
+        if not self.__queued:
+            return
+        sent_at = time.perf_counter()
+        for probe in self.__queued:
+            probe.sent_at = sent_at
+        try:
+            self.sender.flush()
+        finally:
+            self.__queued.clear()
+
+    def send(self, dest_ip: str, dest_port: int, timeout: float) -> Probe:
+        """Send SYN to dest_ip:dest_port and return in-flight probe."""
+
+        probe = self.queue(dest_ip, dest_port, timeout)
+        self.flush()
+        return probe
+
+    def probe_many(self, targets,
+                   pacer: Optional[pacing.Pacer] = None) -> list:
+        """Send SYN to every (dest_ip, dest_port, timeout) of targets
+         by batches, wait for all of them and return list of probes.
+         Replies are drained after every batch,
+         so receive queue of socket does not overflow.
+         If pacing.Pacer is given, SYN segments are sent at its rate;
+         queued batch is flushed before waiting for pacer."""
+
+        probes = []
+        for dest_ip, dest_port, timeout in targets:
+            if pacer is not None:
+                self.__wait_for(pacer.reserve_destination(dest_ip))
+                self.__wait_for(pacer.reserve())
+                pacer.mark_sent()
+            probes.append(self.queue(dest_ip, dest_port, timeout))
+            if not self.__queued:
+                self.receive()
+        self.flush()
+        for probe in probes:
+            while probe.rtt is None:
+                remaining = probe.deadline - time.perf_counter()
+                if remaining <= 0:
+                    self.expire()
+                    break
+                self.receive(remaining)
+        return probes
+
+    def __wait_for(self, delay: float):
+        if delay <= 0:
+            return
+        self.flush()
+        until = time.perf_counter() + delay
+        remaining = delay
+        while remaining > 0:
+            self.receive(remaining)
+            remaining = until - time.perf_counter()
+
+    def handle_packet(self, raw_data, size: int,
+                      received_at: float,
+                      address: Optional[tuple] = None) -> Optional[Probe]:
+        """Match the first size bytes of received packet
+         to in-flight probe. Return completed probe or None,
+         if packet is not a reply to probe.
+         For IPv6 packet is TCP segment and address is its source."""
+
+        if self.use_ipv6:
+            reply = tcp_package.unpack_tcp_reply(raw_data, size)
+            if reply is None:
+                return None
+            source_port, dest_port, _, ack_seq, flags = reply
+        else:
+            reply = tcp_package.unpack_ipv4_reply(raw_data, size)
+            if reply is None:
+                return None
+            source_addr, source_port, dest_port, _, ack_seq, flags = reply
+        if dest_port not in self.source_ports:
+            return None
+        is_rst = flags & tcp_package.TCPPackageType.RST
+        if not is_rst and flags & SYN_ACK != SYN_ACK:
+            return None
+        probe = self.in_flight.get((ack_seq - 1) & 0xffffffff)
+        if probe is not None and self.use_ipv6:
+            source_addr = int.from_bytes(
+                socket.inet_pton(socket.AF_INET6, address[0]), 'big')
+        if probe is None \
+                or probe.dest_addr != source_addr \
+                or probe.dest_port != source_port \
+                or probe.source_port != dest_port:
+            return None
+        del self.in_flight[probe.seq]
+        probe.rtt = received_at - probe.sent_at
+        probe.is_open = not is_rst
+        return probe
+
+    def receive(self, timeout: float = 0) -> list:
+        """Wait for replies at most timeout seconds
+         and return list of completed probes."""
+
+        completed = []
+        readable, _, _ = select.select([self.recv_socket], [], [], timeout)
+        while readable:
+            received = self.receiver.receive()
+            if not received:
+                break
+            received_at = time.perf_counter()
+            for buffer, size, address in received:
+                probe = self.handle_packet(buffer, size, received_at, address)
+                if probe is not None:
+                    completed.append(probe)
+        return completed
+
+    def expire(self, now: Optional[float] = None) -> list:
+        """Remove probes with passed deadline and return list of them."""
+
+        if now is None:
+            now = time.perf_counter()
+        expired = []
+        while self.__deadlines and self.__deadlines[0][0] <= now:
+            deadline, seq = heapq.heappop(self.__deadlines)
+            probe = self.in_flight.get(seq)
+            if probe is not None and probe.deadline == deadline:
+                del self.in_flight[seq]
+                probe.rtt = -1
+                expired.append(probe)
+        return expired
+
+    def ping(self, dest_ip: str, dest_port: int, timeout: float) -> float:
+        """Send one probe and wait for it.
+         Return duration of handshake; if port is closed or
+         reply was not received, return -1."""
+
+        probe = self.send(dest_ip, dest_port, timeout)
+        while probe.rtt is None:
+            remaining = probe.deadline - time.perf_counter()
+            if remaining <= 0:
+                self.expire()
+                break
+            self.receive(remaining)
+        if not probe.is_open:
+            return -1
+        return probe.rtt
+
+    def close(self):
+        """Close sockets of prober."""
+
+        self.send_socket.close()
+        self.recv_socket.close()
+
+    def __get_seq(self) -> int:
+        seq = (self.__cookie + self.__counter) & 0xffffffff
+        self.__counter += 1
+        while seq in self.in_flight:
+            seq = (self.__cookie + self.__counter) & 0xffffffff
+            self.__counter += 1
+        return seq
+
+
+# probers of every address family, shared by pings with raw socket
+default_probers = {}
+
+
+def get_default_prober(family: int = socket.AF_INET) -> SynProber:
+    """Return shared prober of family, making it on the first call."""
+
+    prober = default_probers.get(family)
+    if prober is None:
+        prober = SynProber(family=family)
+        default_probers[family] = prober
+    return prober
@@ -1,15 +1,54 @@
 import struct
 import socket
 import enum
+from typing import Optional
+
+# precompiled formats of headers
+IPV4_HEADER = struct.Struct('!BBHHHBBH4s4s')
+IPV6_HEADER = struct.Struct('!LHBB16s16s')
+TCP_HEADER = struct.Struct('!HHLLBBHHH')
+PSEUDO_HEADER_IPV4 = struct.Struct('!4s4sBBH')
+PSEUDO_HEADER_IPV6 = struct.Struct('!16s16sL3xB')
+WORD = struct.Struct('!H')
+LONG = struct.Struct('!L')
+# ports, seq, ack_seq and flags of tcp header
+TCP_REPLY = struct.Struct('!HHLLxB')
+# protocol and source address of IPv4 header without options
+# and fields of TCP_REPLY, unpacked by one pass
+IPV4_TCP_REPLY = struct.Struct('!9xB2xL4xHHLLxB')
+
+IPV4_HEADER_SIZE = IPV4_HEADER.size
+IPV6_HEADER_SIZE = IPV6_HEADER.size
+IPV4_ID_OFFSET = 4
+IPV4_CHECKSUM_OFFSET = 10
+TCP_SEQ_OFFSET = 4
+TCP_CHECKSUM_OFFSET = 16
+
+
+def internet_checksum(data) -> int:
+    """Return Internet checksum (RFC 1071) of bytes, bytearray
+     or memoryview. Data is read as one wide integer:
+     2 ** 16 equals 1 modulo 0xffff, so the integer modulo 0xffff
+     equals ones' complement sum of its 16-bit words
+     with all carries folded."""
+
+    if len(data) & 1:
+        data = bytes(data) + b'\x00'
+    value = int.from_bytes(data, 'big')
+    sum = value % 0xffff
+    if sum == 0 and value != 0:
+        # ones' complement sum of non-zero words is 0xffff, not 0
+        sum = 0xffff
+    return ~sum & 0xffff
 
 
 class TCPPackageType(enum.IntFlag):
-    URG = 1
-    ACK = 2
-    PSH = 4
-    RST = 8
-    SYN = 16
-    FIN = 32
+    FIN = 1
+    SYN = 2
+    RST = 4
+    PSH = 8
+    ACK = 16
+    URG = 32
 
 
 class TCPPackage:
@@ -44,23 +83,17 @@ class TCPPackage:
 
     # checksum functions needed for calculation checksum
     @staticmethod
-    def calculate_checksum(message: str) -> int:
-        sum = 0
-        # loop taking 2 characters at a time
-        for i in range(0, len(message), 2):
-            sum += (ord(message[i]) << 8) + (ord(message[i + 1]))
+    def calculate_checksum(message) -> int:
+        """Return Internet checksum of message;
+         str is treated as latin-1 encoded bytes."""
 
-        sum = (sum >> 16) + (sum & 0xffff)
-        # s = s + (s >> 16);
-        # complement and mask to 4 byte short
-        sum = ~sum & 0xffff
-
-        return sum
+        if isinstance(message, str):
+            message = message.encode("latin-1")
+        return internet_checksum(message)
 
     def __bytes__(self) -> bytes:
-        package = 0
         if self.use_ipv6:
-            pass
+            package = self.get_ipv6_headers() + self.get_tcp_headers()
         else:
             package = self.get_ipv4_headers() + self.get_tcp_headers()
         return package
@@ -68,48 +101,54 @@ class TCPPackage:
     def get_tcp_headers(self) -> bytes:
         doff = 5  # 4 bit field, size of tcp header, 5 * 4 = 20 bytes
         offset_res = (doff << 4) + 0
-        window = socket.htons(self.window_size)
-        tcp_flags = self.flags
-        # pre-build to calculate checksum
-        tcp_headers = struct.pack('!HHLLBBHHH',
-                                  self.source_port,
-                                  self.dest_port,
-                                  self.seq,
-                                  self.ack_seq,
-                                  offset_res,
-                                  tcp_flags,
-                                  window,
-                                  self.check,
-                                  self.urg_ptr)
-
-        # pseudo header fields
-        source_address = socket.inet_aton(self.source_ip)
-        dest_address = socket.inet_aton(self.dest_ip)
-        placeholder = 0
-        protocol = socket.IPPROTO_TCP
-        tcp_length = len(tcp_headers)
-
-        pseudo_headers = struct.pack('!4s4sBBH',
-                                     source_address,
-                                     dest_address,
-                                     placeholder,
-                                     protocol,
-                                     tcp_length)
+        # pre-build with zero checksum to calculate checksum
+        tcp_headers = bytearray(TCP_HEADER.pack(self.source_port,
+                                                self.dest_port,
+                                                self.seq,
+                                                self.ack_seq,
+                                                offset_res,
+                                                self.flags,
+                                                self.window_size,
+                                                0,
+                                                self.urg_ptr))
+        pseudo_headers = self.get_pseudo_headers(len(tcp_headers))
         pseudo_headers += tcp_headers
 
-        self.check = TCPPackage \
-            .calculate_checksum(pseudo_headers.decode("1251"))
-        # get tcp headers with checksum
-        tcp_headers = struct.pack('!HHLLBBHHH',
-                                  self.source_port,
-                                  self.dest_port,
-                                  self.seq,
-                                  self.ack_seq,
-                                  offset_res,
-                                  tcp_flags,
-                                  window, self.check,
-                                  self.urg_ptr)
-        return tcp_headers
+        self.check = internet_checksum(pseudo_headers)
+        # put checksum into tcp headers
+        WORD.pack_into(tcp_headers, TCP_CHECKSUM_OFFSET, self.check)
+        return bytes(tcp_headers)
+
+    def get_pseudo_headers(self, tcp_length: int) -> bytes:
+        """Return pseudo header for checksum of tcp segment."""
+
+        if self.use_ipv6:
+            return PSEUDO_HEADER_IPV6.pack(
+                socket.inet_pton(socket.AF_INET6, self.source_ip),
+                socket.inet_pton(socket.AF_INET6, self.dest_ip),
+                tcp_length,
+                socket.IPPROTO_TCP)
+        return PSEUDO_HEADER_IPV4.pack(
+            socket.inet_aton(self.source_ip),
+            socket.inet_aton(self.dest_ip),
+            0,
+            socket.IPPROTO_TCP,
+            tcp_length)
+
+    def get_ipv6_headers(self) -> bytes:
+        version = 6
+        traffic_class = 0
+        flow_label = 0
+        payload_len = TCP_HEADER.size
+        return IPV6_HEADER.pack((version << 28) + (traffic_class << 20) +
+                                flow_label,
+                                payload_len,
+                                socket.IPPROTO_TCP,
+                                self.ttl,
+                                socket.inet_pton(socket.AF_INET6,
+                                                 self.source_ip),
+                                socket.inet_pton(socket.AF_INET6,
+                                                 self.dest_ip))
 
     def get_ipv4_headers(self) -> bytes:
         ihl = 5
@@ -118,34 +157,53 @@ class TCPPackage:
         tot_len = 20 + 20
         frag_off = 0
         protocol = socket.IPPROTO_TCP
-        check = 10
+        check = 0
         source_addr = socket.inet_aton(self.source_ip)
         dest_addr = socket.inet_aton(self.dest_ip)
         ihl_version = (version << 4) + ihl
-        ip_header = struct.pack('!BBHHHBBH4s4s',
-                                ihl_version,
-                                tos,
-                                tot_len,
-                                self.id,
-                                frag_off,
-                                self.ttl,
-                                protocol,
-                                check,
-                                source_addr,
-                                dest_addr)
-        return ip_header
+        ip_header = bytearray(IPV4_HEADER.pack(ihl_version,
+                                               tos,
+                                               tot_len,
+                                               self.id,
+                                               frag_off,
+                                               self.ttl,
+                                               protocol,
+                                               check,
+                                               source_addr,
+                                               dest_addr))
+        WORD.pack_into(ip_header, IPV4_CHECKSUM_OFFSET,
+                       internet_checksum(ip_header))
+        return bytes(ip_header)
 
     @staticmethod
     # не получается сделать тайпинг на обьект текущего класса
     def parse_tcp_ipv4_package(raw_data):
         package = TCPPackage("", "")
-        TCPPackage.parse_ipv4_headers(package, raw_data[:40])
-        TCPPackage.parse_tcp_headers(package, raw_data[:40])
+        TCPPackage.parse_ipv4_headers(package, raw_data)
+        ihl = (raw_data[0] & 0xf) * 4
+        TCPPackage.parse_tcp_headers(package, raw_data, ihl)
         return package
 
+    @staticmethod
+    def parse_tcp_ipv6_package(raw_data):
+        package = TCPPackage("", "", use_ipv6=True)
+        TCPPackage.parse_ipv6_headers(package, raw_data)
+        TCPPackage.parse_tcp_headers(package, raw_data, IPV6_HEADER_SIZE)
+        return package
+
+    @staticmethod
+    def parse_ipv6_headers(tcp_pack, raw_data: bytes):
+        headers = IPV6_HEADER.unpack_from(raw_data)
+        # version_class_flow = headers[0]
+        # payload_len = headers[1]
+        # next_header = headers[2]
+        tcp_pack.ttl = headers[3]
+        tcp_pack.source_ip = socket.inet_ntop(socket.AF_INET6, headers[4])
+        tcp_pack.dest_ip = socket.inet_ntop(socket.AF_INET6, headers[5])
+
     @staticmethod
     def parse_ipv4_headers(tcp_pack, raw_data: bytes):
-        headers = struct.unpack('!BBHHHBBH4s4sHHLLBBHHH', raw_data)
+        headers = IPV4_HEADER.unpack_from(raw_data)
         # ipv4
         # ihl_version = headers[0]
         # tos = headers[1]
@@ -161,15 +219,124 @@ class TCPPackage:
         tcp_pack.dest_ip = socket.inet_ntoa(dest_addr)
 
     @staticmethod
-    def parse_tcp_headers(tcp_pack, raw_data: bytes):
-        headers = struct.unpack('!BBHHHBBH4s4sHHLLBBHHH', raw_data)
+    def parse_tcp_headers(tcp_pack, raw_data: bytes,
+                          offset: int = IPV4_HEADER_SIZE):
+        headers = TCP_HEADER.unpack_from(raw_data, offset)
         # tcp
-        tcp_pack.source_port = headers[10]
-        tcp_pack.dest_port = headers[11]
-        tcp_pack.seq = headers[12]
-        tcp_pack.ack_seq = headers[13]
-        tcp_pack.offset_res = headers[14]
-        tcp_pack.flags = headers[15]
-        tcp_pack.window = socket.ntohs(headers[16])
-        tcp_pack.check = headers[17]
-        tcp_pack.urg_ptr = headers[18]
+        tcp_pack.source_port = headers[0]
+        tcp_pack.dest_port = headers[1]
+        tcp_pack.seq = headers[2]
+        tcp_pack.ack_seq = headers[3]
+        tcp_pack.offset_res = headers[4]
+        tcp_pack.flags = headers[5]
+        tcp_pack.window_size = headers[6]
+        tcp_pack.check = headers[7]
+        tcp_pack.urg_ptr = headers[8]
+
+
+def unpack_ipv4_reply(raw_data, size: int) -> Optional[tuple]:
+    """Return tuple (source address as int, source port,
+     destination port, seq, ack_seq, flags) of IPv4 TCP segment
+     from the first size bytes of buffer raw_data, without copying it;
+     fields are unpacked by one pass, if IPv4 header has no options.
+     If raw_data is not a TCP segment, return None."""
+
+    if size < IPV4_HEADER_SIZE + TCP_HEADER.size:
+        return None
+    ihl_version = raw_data[0]
+    if ihl_version == 0x45:
+        reply = IPV4_TCP_REPLY.unpack_from(raw_data)
+        if reply[0] != socket.IPPROTO_TCP:
+            return None
+        return reply[1:]
+    ihl = (ihl_version & 0xf) * 4
+    if ihl_version >> 4 != 4 or ihl < IPV4_HEADER_SIZE \
+            or size < ihl + TCP_HEADER.size \
+            or raw_data[9] != socket.IPPROTO_TCP:
+        return None
+    return LONG.unpack_from(raw_data, 12) + \
+        TCP_REPLY.unpack_from(raw_data, ihl)
+
+
+def unpack_tcp_reply(raw_data, size: int) -> Optional[tuple]:
+    """Return tuple (source port, destination port, seq, ack_seq, flags)
+     of TCP segment without IP header, like it is received
+     by raw IPv6 socket, from the first size bytes of buffer raw_data.
+     If raw_data is too short, return None."""
+
+    if size < TCP_HEADER.size:
+        return None
+    return TCP_REPLY.unpack_from(raw_data)
+
+
+def update_checksum(checksum: int, old_words: tuple, new_words: tuple) -> int:
+    """Return checksum, updated incrementally after replacing
+     16-bit words old_words by new_words, HC' = ~(~HC + ~m + m')
+     from RFC 1624."""
+
+    sum = ~checksum & 0xffff
+    for old_word, new_word in zip(old_words, new_words):
+        sum += (~old_word & 0xffff) + new_word
+    sum = (sum >> 16) + (sum & 0xffff)
+    sum += sum >> 16
+    return ~sum & 0xffff
+
+
+class SynTemplate:
+    """Prebuilt SYN packet to dest_ip:dest_port from source_ip.
+     Only sequence number, source port and id of packet differ
+     between probes: build patches them in place and
+     updates checksums incrementally, so packet is not packed again.
+     IPv6 template contains only TCP header, because IPv6 header
+     is built by kernel for raw IPv6 socket."""
+
+    def __init__(self, source_ip: str,
+                 dest_ip: str,
+                 dest_port: int,
+                 window_size: int = 5840,
+                 ttl: int = 255,
+                 use_ipv6: bool = False):
+        package = TCPPackage(flags=TCPPackageType.SYN,
+                             source_ip=source_ip,
+                             dest_ip=dest_ip,
+                             dest_port=dest_port,
+                             window_size=window_size,
+                             ttl=ttl,
+                             pack_id=0,
+                             use_ipv6=use_ipv6)
+        if use_ipv6:
+            self.packet = bytearray(package.get_tcp_headers())
+            self.__tcp_offset = 0
+        else:
+            self.packet = bytearray(bytes(package))
+            self.__tcp_offset = IPV4_HEADER_SIZE
+        self.use_ipv6 = use_ipv6
+        self.__tcp_words = (0, 0, 0)
+        self.__pack_id = 0
+
+    def build(self, seq: int, source_port: int, pack_id: int = 0) -> bytearray:
+        """Return SYN packet with given seq, source port and id;
+         id is ignored for IPv6. Returned bytearray is reused
+         by the next build, so it must be sent before it."""
+
+        packet = self.packet
+        tcp_offset = self.__tcp_offset
+        tcp_words = (source_port, seq >> 16, seq & 0xffff)
+        tcp_check_offset = tcp_offset + TCP_CHECKSUM_OFFSET
+        tcp_check = WORD.unpack_from(packet, tcp_check_offset)[0]
+        WORD.pack_into(packet, tcp_check_offset,
+                       update_checksum(tcp_check,
+                                       self.__tcp_words,
+                                       tcp_words))
+        WORD.pack_into(packet, tcp_offset, source_port)
+        LONG.pack_into(packet, tcp_offset + TCP_SEQ_OFFSET, seq)
+        self.__tcp_words = tcp_words
+        if pack_id != self.__pack_id and not self.use_ipv6:
+            ip_check = WORD.unpack_from(packet, IPV4_CHECKSUM_OFFSET)[0]
+            WORD.pack_into(packet, IPV4_CHECKSUM_OFFSET,
+                           update_checksum(ip_check,
+                                           (self.__pack_id,),
+                                           (pack_id,)))
+            WORD.pack_into(packet, IPV4_ID_OFFSET, pack_id)
+            self.__pack_id = pack_id
+        return packet
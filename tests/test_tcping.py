@@ -1,10 +1,31 @@
+import asyncio
+import errno
+import os
+import socket
+import tempfile
+import time
 import unittest
+import urllib.error
+import urllib.request
 from tcping import ping
 from tcping import __main__ as tcping
 from tcping import errors
 from tcping import statistics
 from tcping import tcp_package
+from tcping import sketch
+from tcping import measures
+from tcping import resolver
+from tcping import syn_prober
+from tcping import bpf
+from tcping import batch_io
+from tcping import pacing
+from tcping import socket_pool
+from tcping import sample_log
 from watchdog import watchdog_ping
+from watchdog import scheduler
+from watchdog import metrics
+from watchdog import render
+from watchdog import targets
 from unittest import mock
 
 
@@ -58,6 +79,14 @@ class TestCorrectPings(unittest.TestCase):
             with self.assertRaises(errors.InvalidIpOrDomain):
                 tcp_ping.do_ping()
 
+    def test_ping_unreachable(self):
+        tcp_ping = ping.TCPing(destination='127.0.0.1', port=80, timeout=1)
+        with mock.patch('socket.socket') as mock_socket:
+            mock_socket.return_value.connect.side_effect = \
+                OSError(errno.EHOSTUNREACH, 'No route to host')
+            measure = tcp_ping.do_ping()
+        self.assertTrue(measure.is_failed)
+
 
 class TestParsing(unittest.TestCase):
     def test_parsing_with_args(self):
@@ -89,6 +118,16 @@ class TestParsing(unittest.TestCase):
         self.assertEqual(tcp_ping.timeout, 0)
         self.assertEqual(tcp_ping.port, 80)
 
+    def test_parsing_overrun(self):
+        cmd_parser = tcping.create_cmd_parser()
+        args = cmd_parser.parse_args(['google.com'])
+        self.assertEqual(args.overrun, 'skip')
+        args = cmd_parser.parse_args(['google.com', '--overrun', 'catchup'])
+        self.assertEqual(args.overrun, 'catchup')
+        with mock.patch('sys.stderr'):
+            with self.assertRaises(SystemExit):
+                cmd_parser.parse_args(['google.com', '--overrun', 'late'])
+
 
 class TestStatistics(unittest.TestCase):
     def test_prepare_ping_info(self):
@@ -157,6 +196,157 @@ class TestStatistics(unittest.TestCase):
         statstics = statistics.Statistics(measures, '127.0.0.1', '123')
         self.assertEqual(expected, statstics.__str__())
 
+    def test_streaming_statistics_same_as_statistics(self):
+        times = [0.051, 0.049, -1, 0.049, 0.050, -1]
+        measures = [ping.StatisticsData(time, ip='127.0.0.1', port=123)
+                    for time in times]
+        stat = statistics.Statistics(measures, '127.0.0.1', 123)
+        streaming_stat = statistics.StreamingStatistics()
+        for measure in measures:
+            streaming_stat.add(measure)
+        self.assertEqual(streaming_stat.ip, '127.0.0.1')
+        self.assertEqual(streaming_stat.benchmarks_count, 6)
+        self.assertEqual(streaming_stat.failed_pings_count, 2)
+        self.assertAlmostEqual(streaming_stat.average_time,
+                               stat.average_time)
+        self.assertAlmostEqual(streaming_stat.min_time, stat.min_time)
+        self.assertAlmostEqual(streaming_stat.max_time, stat.max_time)
+        self.assertAlmostEqual(streaming_stat.looses_percentage,
+                               stat.looses_percentage)
+
+    def test_streaming_statistics_deviation_and_jitter(self):
+        streaming_stat = statistics.StreamingStatistics('127.0.0.1', 123)
+        for sample_time in (0.010, 0.012, 0.010, 0.012):
+            streaming_stat.add(ping.StatisticsData(sample_time,
+                                                   ip='127.0.0.1',
+                                                   port=123))
+        self.assertAlmostEqual(streaming_stat.variance, 4 / 3)
+        # J = J + (|D| - J) / 16 for three differences of 2ms
+        self.assertAlmostEqual(streaming_stat.jitter,
+                               2 * (1 - (15 / 16) ** 3))
+        self.assertIn("Standard deviation: 1.155ms", str(streaming_stat))
+
+    def test_streaming_statistics_percentiles(self):
+        streaming_stat = statistics.StreamingStatistics('127.0.0.1', 123)
+        for i in range(1, 1001):
+            streaming_stat.add(ping.StatisticsData(i / 1000,
+                                                   ip='127.0.0.1',
+                                                   port=123))
+        for percent in statistics.PERCENTILES:
+            expected = (1 + percent / 100 * 999)
+            self.assertAlmostEqual(streaming_stat.percentile(percent),
+                                   expected, delta=expected * 0.01)
+        self.assertIn("Percentiles: p50: ", str(streaming_stat))
+
+    def test_streaming_statistics_empty(self):
+        with self.assertRaises(errors.StatisticsError):
+            str(statistics.StreamingStatistics())
+
+    def test_ping_without_keeping_measures(self):
+        with mock.patch('socket.socket'):
+            tcp_ping = ping.TCPing(destination='127.0.0.1',
+                                   keep_measures=False)
+            tcp_ping.do_ping()
+            tcp_ping.do_ping()
+        self.assertEqual(len(tcp_ping.measures), 0)
+        self.assertEqual(tcp_ping.statistics.benchmarks_count, 2)
+
+    def test_sketch_merge(self):
+        first_sketch = sketch.QuantileSketch()
+        second_sketch = sketch.QuantileSketch()
+        whole_sketch = sketch.QuantileSketch()
+        for i in range(1000):
+            value = (i % 97 + 1) / 1000
+            whole_sketch.add(value)
+            if i % 2:
+                first_sketch.add(value)
+            else:
+                second_sketch.add(value)
+        first_sketch.merge(second_sketch)
+        self.assertEqual(first_sketch.count, 1000)
+        self.assertEqual(first_sketch.buckets, whole_sketch.buckets)
+        with self.assertRaises(errors.IncompatibleSketches):
+            first_sketch.merge(sketch.QuantileSketch(relative_accuracy=0.05))
+
+    def test_sketch_bounded_memory(self):
+        values_sketch = sketch.QuantileSketch(max_buckets=16)
+        for i in range(1, 10001):
+            values_sketch.add(i)
+        self.assertLessEqual(len(values_sketch.buckets), 16)
+        self.assertAlmostEqual(values_sketch.quantile(0.999), 9991,
+                               delta=9991 * 0.01)
+        self.assertEqual(sketch.QuantileSketch().quantile(0.5), 0.0)
+
+    def test_measure_store(self):
+        store = measures.MeasureStore()
+        for i in range(10):
+            time = -1 if i % 3 == 0 else i / 1000
+            store.append(ping.StatisticsData(time,
+                                             ip='127.0.0.1',
+                                             port=123,
+                                             timestamp=i))
+        self.assertEqual(len(store), 10)
+        self.assertEqual(store.failed_count, 4)
+        self.assertEqual(len(store.failures), 2)
+        self.assertEqual(list(store.successful_times()),
+                         [0.001, 0.002, 0.004, 0.005, 0.007, 0.008])
+        measure = store[-1]
+        self.assertEqual(measure, -1)
+        self.assertTrue(measure.is_failed)
+        self.assertEqual((measure.ip, measure.port, measure.timestamp),
+                         ('127.0.0.1', 123, 9))
+        self.assertFalse(store[8].is_failed)
+        with self.assertRaises(IndexError):
+            store[10]
+        stat = statistics.Statistics(store, '127.0.0.1', 123)
+        self.assertEqual(stat.failed_pings_count, 4)
+        self.assertAlmostEqual(stat.average_time, 4.5)
+        self.assertEqual(len(stat.successful_benchmarks), 6)
+        store.append(ping.StatisticsData(0.010, ip='127.0.0.1', port=123))
+        self.assertAlmostEqual(stat.max_time, 10)
+
+    def test_statistics_phases(self):
+        store = measures.MeasureStore()
+        store.append(ping.StatisticsData(0.001, ip='127.0.0.1', port=123))
+        for connect in (0.010, 0.020):
+            phases = {'resolve': 0.001, 'connect': connect}
+            store.append(ping.StatisticsData(connect,
+                                             ip='127.0.0.1',
+                                             port=123,
+                                             phases=phases))
+        self.assertIsNone(store[0].phases)
+        self.assertEqual(store[2].phases, {'resolve': 0.001,
+                                           'connect': 0.020})
+        stat = statistics.Statistics(store, '127.0.0.1', 123)
+        self.assertEqual(stat.phases, ['resolve', 'connect'])
+        self.assertAlmostEqual(stat.phase_average('connect'), 15)
+        self.assertEqual(stat.phase_average('close'), 0)
+        self.assertTrue(str(stat).endswith(
+            "Phases average: resolve 1.0ms, connect 15.0ms\n"))
+
+    def test_statistics_without_numpy(self):
+        times = (0.004, -1, 0.001, 0.003, 0.002, -1)
+        results = []
+        for numpy_module in (statistics.numpy, None):
+            with mock.patch.object(statistics, 'numpy', numpy_module):
+                store = measures.MeasureStore.from_measures(
+                    ping.StatisticsData(time, ip='127.0.0.1', port=123)
+                    for time in times)
+                stat = statistics.Statistics(store, '127.0.0.1', 123)
+                results.append((str(stat),
+                                stat.percentile(50),
+                                stat.percentile(90),
+                                stat.percentile(100)))
+                # store can grow after statistics was calculated
+                store.append(ping.StatisticsData(0.001,
+                                                 ip='127.0.0.1',
+                                                 port=123))
+                self.assertEqual(stat.successful_pings_count, 5)
+        self.assertEqual(results[0], results[1])
+        self.assertAlmostEqual(results[1][1], 2.5)
+        self.assertAlmostEqual(results[1][2], 3.7)
+        self.assertAlmostEqual(results[1][3], 4)
+
     def test_statistics_data_is_float(self):
         single_stat = ping.StatisticsData(0.051, ip='127.0.0.1', port=123)
         self.assertEqual(single_stat, 0.051)
@@ -262,6 +452,17 @@ class TestWatchdog(unittest.TestCase):
         self.assertEqual(measures_to_print_expected,
                          measures_to_print.__str__())
 
+    def test_get_measures_to_print_with_percentiles(self):
+        streaming_stat = statistics.StreamingStatistics()
+        measure = ping.StatisticsData(0.050, ip='127.0.0.1', port=123)
+        streaming_stat.add(measure)
+        table = watchdog_ping \
+            .WatchdogPingData \
+            .get_measures_to_print([(measure, 'hemlo.com')],
+                                   [streaming_stat])
+        self.assertEqual(table.field_names[-2:], ['p50 ms', 'p99 ms'])
+        self.assertAlmostEqual(table.rows[0][-1], 50, delta=0.5)
+
     def test_min_max(self):
         measures_with_dest = []
         single_stat = ping.StatisticsData(0.050,
@@ -281,13 +482,1278 @@ class TestWatchdog(unittest.TestCase):
         self.assertEqual(max, 0.059)
         self.assertEqual(min, -1)
 
+    def test_scheduler_keeps_history(self):
+        listener = open_loopback_listener()
+        port = listener.getsockname()[1]
+        parsed_destinations = watchdog_ping \
+            .WatchdogPingData \
+            .parse_destinations(['127.0.0.1:{}'.format(port),
+                                 'localhost:{}'.format(port)])
+        pings = watchdog_ping \
+            .WatchdogPingData(destinations=parsed_destinations, timeout=1) \
+            .get_pings(ping.AsyncTCPing)
+        with scheduler.ProbeScheduler(pings, concurrency=1) as wd_scheduler:
+            wd_scheduler.run_round()
+            measures_with_dest = wd_scheduler.run_round()
+        listener.close()
+        self.assertEqual([dest for _, dest in measures_with_dest],
+                         ['127.0.0.1', 'localhost'])
+        for tcp_ping in pings:
+            self.assertEqual(tcp_ping.statistics.benchmarks_count, 2)
+            self.assertEqual(len(tcp_ping.measures), 0)
+
+    def test_parse_destinations_invalid_port(self):
+        for raw_destination in ('google.com:http', 'google.com:0',
+                                'google.com:70000', 'google.com:'):
+            with self.assertRaises(errors.InvalidPort):
+                watchdog_ping.WatchdogPingData \
+                    .parse_destinations([raw_destination])
+
+    def test_parse_destinations_with_ranges(self):
+        parsed_destinations = watchdog_ping \
+            .WatchdogPingData \
+            .parse_destinations(['10.0.0.0/30:22,80-81@5'])
+        self.assertEqual(parsed_destinations,
+                         [('10.0.0.1', '22', '5'),
+                          ('10.0.0.1', '80', '5'),
+                          ('10.0.0.1', '81', '5'),
+                          ('10.0.0.2', '22', '5'),
+                          ('10.0.0.2', '80', '5'),
+                          ('10.0.0.2', '81', '5')])
+
+    def test_get_targets(self):
+        watchdog_ping_object = watchdog_ping.WatchdogPingData(
+            destinations=[targets.parse_target('127.0.0.1:1-3@0.5'),
+                          ('localhost', '80')])
+        ping_targets = watchdog_ping_object.get_targets(ping.AsyncTCPing, 2)
+        self.assertEqual(len(ping_targets), 4)
+        self.assertEqual([ping_targets.get_interval(index)
+                          for index in range(4)], [0.5, 0.5, 0.5, 2])
+        self.assertEqual(ping_targets.get_destination(2), '127.0.0.1')
+        self.assertEqual(ping_targets.get_destination(3), 'localhost')
+        with self.assertRaises(IndexError):
+            ping_targets.get_destination(4)
+        self.assertEqual(ping_targets.pings, {})
+        self.assertEqual([tcp_ping.port for tcp_ping in ping_targets],
+                         [1, 2, 3, 80])
+        self.assertIs(ping_targets[0], ping_targets[0])
+        self.assertIsInstance(ping_targets[0], ping.AsyncTCPing)
+        self.assertFalse(ping_targets[0].keep_measures)
+
+    def test_scheduler_without_kept_pings(self):
+        listener = open_loopback_listener()
+        port = listener.getsockname()[1]
+        watchdog_ping_object = watchdog_ping.WatchdogPingData(
+            destinations=targets.parse_target(
+                '127.0.0.1:{}@0.02'.format(port)),
+            timeout=1)
+        ping_targets = watchdog_ping_object \
+            .get_targets(ping.AsyncTCPing, keep_pings=False)
+        self.assertIsNot(ping_targets[0], ping_targets[0])
+        with scheduler.ProbeScheduler(ping_targets) as wd_scheduler:
+            wd_scheduler.start()
+            completed = wd_scheduler.poll(0.2)
+        listener.close()
+        self.assertGreater(len(completed), 3)
+        self.assertEqual(completed[0][1], '127.0.0.1')
+        self.assertFalse(any(measure.is_failed for measure, _ in completed))
+        self.assertIsNone(wd_scheduler.latest)
+        self.assertEqual(wd_scheduler.get_latest(), [])
+
+    def test_results_channel(self):
+        channel = scheduler.ResultsChannel(3)
+        for item in range(5):
+            channel.publish(item)
+        self.assertEqual(channel.dropped, 2)
+        self.assertEqual(channel.drain(), [2, 3, 4])
+        self.assertEqual(channel.drain(), [])
+
+    def test_scheduler_in_thread(self):
+        listener = open_loopback_listener()
+        port = listener.getsockname()[1]
+        pings = [ping.AsyncTCPing(destination='127.0.0.1',
+                                  port=port,
+                                  timeout=1),
+                 ping.AsyncTCPing(destination='127.0.0.1',
+                                  port=get_closed_loopback_port(),
+                                  timeout=1)]
+        wd_scheduler = scheduler.ProbeScheduler(
+            pings, intervals=[0.02, 0.02],
+            summarize=lambda tcp_ping, measure: tcp_ping.port)
+        wd_scheduler.start_thread()
+        results = []
+        for _ in range(50):
+            time.sleep(0.02)
+            results += wd_scheduler.drain()
+        wd_scheduler.close()
+        # pings, which finish while scheduler closes, are published too
+        results += wd_scheduler.drain()
+        listener.close()
+        self.assertIsNone(wd_scheduler.thread)
+        self.assertTrue(wd_scheduler.loop.is_closed())
+        self.assertEqual(len(results), sum(len(tcp_ping.measures)
+                                           for tcp_ping in pings))
+        self.assertGreater(len(pings[1].measures), 3)
+        for index, measure, summary in results:
+            self.assertEqual(summary, pings[index].port)
+            self.assertEqual(measure.is_failed, index == 1)
+
+    def test_scheduler_survives_unresolved_destination(self):
+        listener = open_loopback_listener()
+        port = listener.getsockname()[1]
+        fake_resolver = resolver.Resolver(resolve_func=FakeResolveFunc())
+        pings = [ping.AsyncTCPing(destination=destination,
+                                  port=port,
+                                  timeout=1,
+                                  resolver=fake_resolver)
+                 for destination in ('localhost', 'host.invalid')]
+        with scheduler.ProbeScheduler(pings,
+                                      intervals=[0.02, 0.02]) \
+                as wd_scheduler:
+            wd_scheduler.start()
+            completed = wd_scheduler.poll(0.3)
+        listener.close()
+        failed = [measure.is_failed for measure, _ in completed]
+        self.assertGreater(failed.count(True), 3)
+        self.assertGreater(failed.count(False), 3)
+        self.assertTrue(wd_scheduler.latest[1].is_failed)
+
+    def test_scheduler_observes_dropped_results(self):
+        listener = open_loopback_listener()
+        port = listener.getsockname()[1]
+        pings = [ping.AsyncTCPing(destination='127.0.0.1',
+                                  port=port,
+                                  timeout=1)
+                 for _ in range(3)]
+        observed = []
+        wd_scheduler = scheduler.ProbeScheduler(
+            pings, intervals=[0.01] * 3,
+            observe=lambda measure, destination: observed.append(
+                destination),
+            results_size=2)
+        wd_scheduler.start_thread()
+        time.sleep(0.3)
+        wd_scheduler.close()
+        listener.close()
+        self.assertGreater(wd_scheduler.results.dropped, 0)
+        self.assertEqual(len(wd_scheduler.drain()), 2)
+        self.assertEqual(len(observed), sum(len(tcp_ping.measures)
+                                            for tcp_ping in pings))
+
+    def test_scheduler_limits_running_pings(self):
+        listener = open_loopback_listener()
+        port = listener.getsockname()[1]
+        pings = [CountingPing(destination='127.0.0.1',
+                              port=port,
+                              timeout=1)
+                 for _ in range(50)]
+        CountingPing.running = CountingPing.peak = 0
+        CountingPing.peak_tasks = 0
+        with scheduler.ProbeScheduler(pings,
+                                      concurrency=3,
+                                      intervals=[10] * 50) \
+                as wd_scheduler:
+            wd_scheduler.start()
+            completed = wd_scheduler.poll(0.5)
+        listener.close()
+        self.assertEqual(len(completed), 50)
+        self.assertEqual(CountingPing.peak, 3)
+        # tasks of running pings, of their connects and of poll
+        self.assertLessEqual(CountingPing.peak_tasks, 2 * 3 + 1)
+
+    def test_deadline_heap(self):
+        deadlines = scheduler.DeadlineHeap(5, 5.0)
+        self.assertEqual(sorted(deadlines.pop() for _ in range(5)),
+                         [(5.0, index) for index in range(5)])
+        for index, deadline in enumerate((7.0, 1.0, 9.0, 3.0, 1.5)):
+            deadlines.push(index, deadline)
+        self.assertEqual(deadlines.peek(), 1.0)
+        self.assertEqual([deadlines.pop() for _ in range(len(deadlines))],
+                         [(1.0, 1), (1.5, 4), (3.0, 3), (7.0, 0), (9.0, 2)])
+
+    def test_deadline_heap_order(self):
+        count = 200
+        deadlines = scheduler.DeadlineHeap(count, 0.0)
+        popped = []
+        for step in range(count * 5):
+            deadline, index = deadlines.pop()
+            popped.append(deadline)
+            deadlines.push(index, deadline + (index * 7919 + step) % 97)
+        self.assertEqual(popped, sorted(popped))
+        self.assertEqual(len(deadlines), count)
+
+    def test_parse_destinations_with_intervals(self):
+        parsed_destinations = watchdog_ping \
+            .WatchdogPingData \
+            .parse_destinations(['google.com:443@0.1', 'meow.org@30'])
+        self.assertEqual(parsed_destinations,
+                         [('google.com', '443', '0.1'),
+                          ('meow.org', '80', '30')])
+        watchdog_ping_object = watchdog_ping \
+            .WatchdogPingData(destinations=parsed_destinations + [('a', '1')])
+        self.assertEqual(watchdog_ping_object.get_intervals(5),
+                         [0.1, 30.0, 5.0])
+
+    def test_scheduler_independent_intervals(self):
+        listener = open_loopback_listener()
+        port = listener.getsockname()[1]
+        pings = [ping.AsyncTCPing(destination='127.0.0.1',
+                                  port=port,
+                                  timeout=1),
+                 ping.AsyncTCPing(destination='127.0.0.1',
+                                  port=get_closed_loopback_port(),
+                                  timeout=1),
+                 ping.AsyncTCPing(destination='127.0.0.1',
+                                  port=port,
+                                  timeout=1)]
+        with scheduler.ProbeScheduler(pings,
+                                      intervals=[0.02, 0.02, 10]) \
+                as wd_scheduler:
+            wd_scheduler.start()
+            completed = wd_scheduler.poll(0.5)
+            latest = wd_scheduler.get_latest()
+            # pings, which finish while scheduler closes, are not polled
+            measure_counts = [len(tcp_ping.measures) for tcp_ping in pings]
+        listener.close()
+        self.assertEqual(len(latest), 3)
+        self.assertTrue(latest[1][0].is_failed)
+        self.assertGreater(len(pings[0].measures), 3)
+        self.assertGreater(len(pings[1].measures), 3)
+        self.assertEqual(len(pings[2].measures), 1)
+        self.assertEqual(len(completed), sum(measure_counts))
+
+
+class CountingPing(ping.AsyncTCPing):
+    """AsyncTCPing, which counts the peaks of concurrently running pings
+     and of tasks of event loop."""
+
+    running = 0
+    peak = 0
+    peak_tasks = 0
+
+    async def do_ping_async(self, lateness=None):
+        cls = type(self)
+        cls.running += 1
+        cls.peak = max(cls.peak, cls.running)
+        cls.peak_tasks = max(cls.peak_tasks, len(asyncio.all_tasks()))
+        try:
+            return await super().do_ping_async(lateness)
+        finally:
+            cls.running -= 1
+
+
+class FakeResolveFunc:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, host, port, family, type):
+        self.calls.append(host)
+        if host.endswith('.invalid'):
+            raise socket.gaierror
+        return [(family, type, 6, '', ('127.0.0.1', port))]
+
+
+class TestResolver(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.resolve_func = FakeResolveFunc()
+        self.resolver = resolver.Resolver(ttl=10,
+                                          maxsize=2,
+                                          resolve_func=self.resolve_func,
+                                          clock=lambda: self.now)
+
+    def test_cache_hits_and_ttl(self):
+        self.assertEqual(self.resolver.resolve('a.test', 80),
+                         ('127.0.0.1', 80))
+        self.resolver.resolve('a.test', 80)
+        self.assertEqual((self.resolver.hits, self.resolver.misses), (1, 1))
+        self.now = 10
+        self.resolver.resolve('a.test', 80)
+        self.assertEqual(self.resolve_func.calls, ['a.test', 'a.test'])
+        self.assertEqual(self.resolver.misses, 2)
+
+    def test_lru_eviction(self):
+        self.resolver.resolve('a.test', 80)
+        self.resolver.resolve('b.test', 80)
+        self.resolver.resolve('a.test', 80)
+        self.resolver.resolve('c.test', 80)
+        self.assertEqual(len(self.resolver), 2)
+        self.resolver.resolve('a.test', 80)
+        self.resolver.resolve('b.test', 80)
+        self.assertEqual(self.resolve_func.calls,
+                         ['a.test', 'b.test', 'c.test', 'b.test'])
+
+    def test_invalid_domain(self):
+        with self.assertRaises(errors.InvalidIpOrDomain):
+            self.resolver.resolve('a.invalid', 80)
+        self.assertEqual(len(self.resolver), 0)
+
+    def test_pings_resolve_once(self):
+        listener = open_loopback_listener()
+        port = listener.getsockname()[1]
+        tcp_ping = ping.TCPing(destination='a.test',
+                               port=port,
+                               timeout=1,
+                               resolver=self.resolver)
+        tcp_ping.do_ping()
+        tcp_ping.do_ping()
+        async_ping = ping.AsyncTCPing(destination='a.test',
+                                      port=port,
+                                      timeout=1,
+                                      resolver=self.resolver)
+        measure = async_ping.do_ping()
+        listener.close()
+        self.assertEqual(measure.ip, '127.0.0.1')
+        self.assertFalse(measure.is_failed)
+        self.assertEqual(self.resolve_func.calls, ['a.test'])
+        self.assertEqual(self.resolver.hits, 2)
+
+
+def open_loopback_listener() -> socket.socket:
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1024)
+    return listener
+
+
+def get_closed_loopback_port() -> int:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class TestAsyncPing(unittest.TestCase):
+    def setUp(self):
+        self.listener = open_loopback_listener()
+        self.port = self.listener.getsockname()[1]
+
+    def tearDown(self):
+        self.listener.close()
+
+    def test_do_ping_wrapper(self):
+        tcp_ping = ping.AsyncTCPing(destination='127.0.0.1',
+                                    port=self.port,
+                                    timeout=1)
+        measure = tcp_ping.do_ping()
+        self.assertFalse(measure.is_failed)
+        self.assertEqual(measure.ip, '127.0.0.1')
+        self.assertEqual(len(tcp_ping.measures), 1)
+
+    def test_closed_port(self):
+        tcp_ping = ping.AsyncTCPing(destination='127.0.0.1',
+                                    port=get_closed_loopback_port(),
+                                    timeout=1)
+        measure = tcp_ping.do_ping()
+        self.assertTrue(measure.is_failed)
+
+    def test_incorrect_domain(self):
+        tcp_ping = ping.AsyncTCPing(destination='64.233.165.101.123.214')
+        with self.assertRaises(errors.InvalidIpOrDomain):
+            tcp_ping.do_ping()
+
+    def test_measure_phases(self):
+        tcp_ping = ping.AsyncTCPing(destination='127.0.0.1',
+                                    port=self.port,
+                                    timeout=1,
+                                    measure_phases=True)
+        measure = tcp_ping.do_ping()
+        sync_ping = ping.TCPing(destination='127.0.0.1',
+                                port=self.port,
+                                timeout=1,
+                                measure_phases=True)
+        sync_measure = sync_ping.do_ping()
+        for single_measure in (measure, sync_measure):
+            self.assertEqual(sorted(single_measure.phases),
+                             sorted(measures.PHASES))
+            self.assertEqual(single_measure.phases['connect'],
+                             single_measure)
+            self.assertIn('Phases: resolve ', str(single_measure))
+        self.assertIsNone(sync_ping.measures[0].phases.get('missing'))
+        self.assertIn('Phases average: resolve ',
+                      str(sync_ping.statistics))
+
+    def test_kernel_rtt(self):
+        tcp_ping = ping.AsyncTCPing(destination='127.0.0.1',
+                                    port=self.port,
+                                    timeout=1,
+                                    kernel_rtt=True)
+        sync_ping = ping.TCPing(destination='127.0.0.1',
+                                port=self.port,
+                                timeout=1,
+                                kernel_rtt=True)
+        expected = {'kernel_rtt': 0.001, 'kernel_rttvar': 0.0005}
+        with mock.patch.object(ping, 'get_kernel_info',
+                               return_value=expected):
+            measure = tcp_ping.do_ping()
+            sync_ping.do_ping()
+        self.assertEqual(measure.kernel_rtt, 0.001)
+        self.assertIn('Kernel RTT: 1.0ms;', str(measure))
+        self.assertEqual(sync_ping.measures[0].kernel_rttvar, 0.0005)
+        self.assertIn('Kernel RTT: average 1.0ms, rttvar 0.5ms',
+                      str(sync_ping.statistics))
+        stat = statistics.Statistics(sync_ping.measures, '127.0.0.1', 80)
+        self.assertIn('Kernel RTT: average 1.0ms, rttvar 0.5ms', str(stat))
+
+    @unittest.skipUnless(hasattr(socket, 'TCP_INFO'), 'requires TCP_INFO')
+    def test_get_kernel_info(self):
+        sock = socket.create_connection(('127.0.0.1', self.port))
+        kernel_info = ping.get_kernel_info(sock)
+        sock.close()
+        self.assertGreater(kernel_info['kernel_rtt'], 0)
+        self.assertIn('kernel_rttvar', kernel_info)
+
+    def test_lateness(self):
+        sync_ping = ping.TCPing(destination='127.0.0.1', port=self.port,
+                                timeout=1)
+        sync_ping.do_ping(lateness=0.002)
+        sync_ping.do_ping(lateness=0.004)
+        sync_ping.do_ping()
+        self.assertEqual(sync_ping.measures[1].lateness, 0.004)
+        self.assertIsNone(sync_ping.measures[2].lateness)
+        self.assertIn('Schedule lateness: average 3.0ms, max 4.0ms',
+                      str(sync_ping.statistics))
+        stat = statistics.Statistics(sync_ping.measures, '127.0.0.1', 80)
+        self.assertIn('Schedule lateness: average 3.0ms, max 4.0ms',
+                      str(stat))
+
+    def test_run_pings_with_pacer(self):
+        pings = [ping.AsyncTCPing(destination='127.0.0.1',
+                                  port=self.port,
+                                  timeout=1)
+                 for _ in range(5)]
+        pacer = pacing.Pacer(rate=50)
+        measures = ping.do_pings(pings, pacer=pacer)
+        self.assertEqual(len(measures), 5)
+        self.assertEqual(pacer.count, 5)
+        self.assertLess(pacer.achieved_rate, 55)
+
+    def test_run_pings_concurrently(self):
+        pings = [ping.AsyncTCPing(destination='127.0.0.1',
+                                  port=self.port,
+                                  timeout=1)
+                 for _ in range(20)]
+        measures = ping.do_pings(pings, count=3, concurrency=8)
+        self.assertEqual(len(measures), 60)
+        self.assertFalse(any(measure.is_failed for measure in measures))
+        for tcp_ping in pings:
+            self.assertEqual(len(tcp_ping.measures), 3)
+
+    def test_run_pings_with_unresolved_destination(self):
+        fake_resolver = resolver.Resolver(resolve_func=FakeResolveFunc())
+        pings = [ping.AsyncTCPing(destination=destination,
+                                  port=self.port,
+                                  timeout=1,
+                                  resolver=fake_resolver)
+                 for destination in ('localhost', 'host.invalid')]
+        measures = ping.do_pings(pings, count=2)
+        self.assertEqual([measure.is_failed for measure in measures],
+                         [False, False, True, True])
+        self.assertEqual(measures[2].port, self.port)
+        self.assertEqual(pings[1].statistics.benchmarks_count, 2)
+
+
+class TestSocketPool(unittest.TestCase):
+    def setUp(self):
+        self.listener = open_loopback_listener()
+        self.port = self.listener.getsockname()[1]
+
+    def tearDown(self):
+        self.listener.close()
+
+    def get_free_ports(self, count: int) -> tuple:
+        for first in range(42000, 60000, count):
+            probes = []
+            try:
+                for port in range(first, first + count):
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    probes.append(sock)
+                    sock.bind(('127.0.0.1', port))
+            except OSError:
+                continue
+            finally:
+                for sock in probes:
+                    sock.close()
+            return first, first + count
+        self.skipTest('no free range of source ports')
+
+    def test_socket_options(self):
+        pool = socket_pool.SocketPool(size=2)
+        self.addCleanup(pool.close)
+        self.assertEqual(len(pool), 2)
+        sock = pool.acquire()
+        self.assertEqual(sock.getsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                                         len(socket_pool.LINGER_RESET)),
+                         socket_pool.LINGER_RESET)
+        self.assertTrue(sock.getsockopt(socket.IPPROTO_TCP,
+                                        socket.TCP_NODELAY))
+        self.assertTrue(sock.getsockopt(socket.SOL_SOCKET,
+                                        socket.SO_REUSEADDR))
+        sock.close()
+        self.assertEqual(len(pool), 1)
+        pool.fill()
+        self.assertEqual(len(pool), 2)
+
+    def test_source_ports_rotation(self):
+        source_ports = self.get_free_ports(3)
+        pool = socket_pool.SocketPool(size=2, source_ports=source_ports,
+                                      source_ip='127.0.0.1')
+        self.addCleanup(pool.close)
+        ports = []
+        for _ in range(4):
+            sock = pool.acquire()
+            ports.append(sock.getsockname()[1])
+            sock.close()
+            pool.fill()
+        first = source_ports[0]
+        self.assertEqual(ports, [first, first + 1, first + 2, first])
+
+    def test_source_ports_in_use(self):
+        source_ports = self.get_free_ports(2)
+        busy = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        busy.bind(('127.0.0.1', source_ports[0]))
+        busy.listen()
+        self.addCleanup(busy.close)
+        pool = socket_pool.SocketPool(size=2, source_ports=source_ports,
+                                      source_ip='127.0.0.1')
+        self.addCleanup(pool.close)
+        sock = pool.acquire()
+        self.assertEqual(sock.getsockname()[1], source_ports[0] + 1)
+        sock.close()
+        pool.close()
+        # bound sockets with SO_REUSEADDR share port, listening one does not
+        other = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        other.bind(('127.0.0.1', source_ports[0] + 1))
+        other.listen()
+        self.addCleanup(other.close)
+        with self.assertRaises(errors.SourcePortsExhausted):
+            pool.fill()
+
+    def test_parse_port_range(self):
+        self.assertEqual(socket_pool.parse_port_range('40000-40999'),
+                         (40000, 41000))
+        self.assertEqual(socket_pool.parse_port_range('40000'),
+                         (40000, 40001))
+        for text in ('9-3', 'a-b', '0-10', '1-70000'):
+            with self.assertRaises(errors.InvalidPort):
+                socket_pool.parse_port_range(text)
+
+    def test_ping_with_socket_pool(self):
+        pool = socket_pool.SocketPool(size=2)
+        self.addCleanup(pool.close)
+        for ping_type in (ping.TCPing, ping.AsyncTCPing):
+            tcp_ping = ping_type(destination='127.0.0.1', port=self.port,
+                                 timeout=1, socket_pool=pool)
+            for _ in range(3):
+                self.assertFalse(tcp_ping.do_ping().is_failed)
+            self.assertEqual(len(pool), 2)
+
+
+class TestSampleLog(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'samples.log')
+
+    def write_samples(self):
+        with sample_log.SampleWriter(self.path) as writer:
+            for i in range(10):
+                ip = '127.0.0.1' if i % 2 == 0 else '::1'
+                writer.write(measures.StatisticsData(
+                    -1 if i == 4 else i / 1000, ip=ip, port=80,
+                    timestamp=1000.0 + i))
+
+    def test_write_and_read(self):
+        self.write_samples()
+        self.assertEqual(os.path.getsize(self.path),
+                         sample_log.HEADER.size + 10 * sample_log.RECORD.size)
+        with sample_log.SampleReader(self.path) as reader:
+            self.assertEqual(len(reader), 10)
+            measure = reader[3]
+            self.assertEqual((float(measure), measure.ip, measure.port,
+                              measure.timestamp), (0.003, '::1', 80, 1003.0))
+            self.assertTrue(reader[4].is_failed)
+            self.assertEqual(reader[-1].timestamp, 1009.0)
+            self.assertEqual(len(list(reader)), 10)
+
+    def test_statistics_of_window(self):
+        self.write_samples()
+        with sample_log.SampleReader(self.path) as reader:
+            self.assertEqual(reader.find_window(1002.5, 1006), range(3, 6))
+            self.assertEqual(reader.find_window(2000), range(10, 10))
+            stat = reader.get_statistics(1002, 1006)
+            self.assertEqual(stat.benchmarks_count, 4)
+            self.assertEqual(stat.failed_pings_count, 1)
+            stat = reader.get_statistics(ip='127.0.0.1', port=80)
+            self.assertEqual(stat.benchmarks_count, 5)
+            self.assertEqual(stat.max_time, 8)
+            with self.assertRaises(errors.StatisticsError):
+                reader.get_statistics(2000)
+
+    def test_append_and_refresh(self):
+        self.write_samples()
+        with sample_log.SampleReader(self.path) as reader:
+            self.write_samples()
+            self.assertEqual(len(reader), 10)
+            reader.refresh()
+            self.assertEqual(len(reader), 20)
+
+    def test_invalid_log(self):
+        with open(self.path, 'wb') as file:
+            file.write(b'From: [127.0.0.1:80]; Time: 1.0ms;')
+        with self.assertRaises(errors.InvalidSampleLog):
+            sample_log.SampleReader(self.path)
+        with self.assertRaises(errors.InvalidSampleLog):
+            sample_log.SampleWriter(self.path)
+
+
+class TestMetrics(unittest.TestCase):
+    def observe_measures(self, registry):
+        for sample_time in (0.0004, 0.001, 0.02, -1):
+            registry.observe(measures.StatisticsData(sample_time,
+                                                     ip='127.0.0.1',
+                                                     port=80), 'localhost')
+
+    def test_render(self):
+        registry = metrics.MetricsRegistry()
+        self.observe_measures(registry)
+        registry.observe(measures.StatisticsData(0.3, ip='::1', port=443),
+                         'say "hi"')
+        lines = registry.render().splitlines()
+        labels = 'destination="localhost",port="80"'
+        self.assertIn('tcping_probes_total{%s} 4' % labels, lines)
+        self.assertIn('tcping_probe_failures_total{%s} 1' % labels, lines)
+        self.assertIn('tcping_loss_ratio{%s} 0.25' % labels, lines)
+        self.assertIn('tcping_latency_seconds_bucket{%s,le="0.001"} 2'
+                      % labels, lines)
+        self.assertIn('tcping_latency_seconds_bucket{%s,le="0.025"} 3'
+                      % labels, lines)
+        self.assertIn('tcping_latency_seconds_bucket{%s,le="+Inf"} 3'
+                      % labels, lines)
+        self.assertIn('tcping_latency_seconds_count{%s} 3' % labels, lines)
+        self.assertIn('tcping_probes_total'
+                      '{destination="say \\"hi\\"",port="443"} 1', lines)
+        self.assertEqual(lines.count('# TYPE tcping_latency_seconds '
+                                     'histogram'), 1)
+
+    def test_render_after_observe(self):
+        registry = metrics.MetricsRegistry()
+        self.observe_measures(registry)
+        registry.render()
+        registry.observe(measures.StatisticsData(-1, ip='127.0.0.1',
+                                                 port=80), 'localhost')
+        self.assertIn('tcping_probes_total{destination="localhost",'
+                      'port="80"} 5', registry.render())
+
+    def test_server(self):
+        registry = metrics.MetricsRegistry()
+        self.observe_measures(registry)
+        server = metrics.MetricsServer(registry, '127.0.0.1', 0)
+        self.addCleanup(server.close)
+        server.start()
+        url = 'http://127.0.0.1:{}'.format(server.address[1])
+        with urllib.request.urlopen(url + '/metrics', timeout=5) as response:
+            self.assertEqual(response.headers['Content-Type'],
+                             metrics.CONTENT_TYPE)
+            self.assertEqual(response.read().decode('utf-8'),
+                             registry.render())
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            urllib.request.urlopen(url + '/other', timeout=5)
+        context.exception.close()
+        self.assertEqual(context.exception.code, 404)
+
+
+class TestTargets(unittest.TestCase):
+    def test_parse_ports(self):
+        self.assertEqual(targets.parse_ports('22,80,443,8000-8100'),
+                         [(22, 23), (80, 81), (443, 444), (8000, 8101)])
+        with self.assertRaises(errors.InvalidPort):
+            targets.parse_ports('22,,80')
+
+    def test_split_target(self):
+        self.assertEqual(targets.split_target('host:22,80@1'),
+                         ('host', '22,80', '1'))
+        self.assertEqual(targets.split_target('[::1]:22'),
+                         ('::1', '22', ''))
+        self.assertEqual(targets.split_target('2001:db8::/120'),
+                         ('2001:db8::/120', None, ''))
+        with self.assertRaises(errors.InvalidTarget):
+            targets.split_target('[::1]22')
+        self.assertEqual(targets.split_target(' h : 80 @ 5 '),
+                         ('h', '80', '5'))
+        self.assertEqual(targets.split_target('[ ::1 ] : 22'),
+                         ('::1', '22', ''))
+        self.assertEqual(list(targets.parse_target(' h : 80')),
+                         [('h', '80')])
+        with self.assertRaises(errors.InvalidIpOrDomain):
+            targets.parse_target('a b:80')
+
+    def test_parse_target(self):
+        self.assertEqual(list(targets.parse_target('10.0.0.7/32')),
+                         [('10.0.0.7', '80')])
+        self.assertEqual(list(targets.parse_target('[2001:db8::/127]:443')),
+                         [('2001:db8::', '443'), ('2001:db8::1', '443')])
+        for target, error in (('10.0.0.0/33', errors.InvalidTarget),
+                              ('host:1-x', errors.InvalidPort),
+                              ('host@-1', errors.InvalidInterval),
+                              (':80', errors.InvalidIpOrDomain)):
+            with self.assertRaises(error):
+                targets.parse_target(target)
+
+    def test_targets_are_not_expanded(self):
+        spec = targets.parse_target('10.0.0.0/8:1-200')
+        self.assertEqual(len(spec), 16777214 * 200)
+        self.assertEqual(spec[0], ('10.0.0.1', 1))
+        self.assertEqual(spec[len(spec) - 1], ('10.255.255.254', 200))
+        destinations = iter(spec)
+        self.assertEqual(next(destinations), ('10.0.0.1', '1'))
+        self.assertEqual(next(destinations), ('10.0.0.1', '2'))
+        with self.assertRaises(errors.InvalidTarget):
+            targets.parse_target('10.0.0.0/8:1-65535')
+        with self.assertRaises(errors.InvalidTarget):
+            targets.parse_target('2001:db8::/64')
+
+    def test_target_indices(self):
+        spec = targets.parse_target('[2001:db8::/126]:22,80-81,9@7')
+        destinations = list(spec)
+        self.assertEqual(len(destinations), len(spec))
+        self.assertEqual(destinations[4], ('2001:db8::2', '22', '7'))
+        self.assertEqual([destination[:2] for destination in destinations],
+                         [(host, str(port)) for host, port
+                          in (spec[index] for index in range(len(spec)))])
+        with self.assertRaises(IndexError):
+            spec[len(spec)]
+
+    def test_loader(self):
+        loader = targets.TargetLoader(['127.0.0.1:22 # ssh\n',
+                                       '\n',
+                                       '# comment\n',
+                                       'host:99999\n',
+                                       'example.com@30\n'])
+        self.assertEqual([destination
+                          for spec in loader
+                          for destination in spec],
+                         [('127.0.0.1', '22'),
+                          ('example.com', '80', '30')])
+        self.assertEqual(len(loader.errors), 1)
+        number, line, error = loader.errors[0]
+        self.assertEqual((number, line), (4, 'host:99999'))
+        self.assertIsInstance(error, errors.InvalidPort)
+
+
+class FakeScreen:
+    def __init__(self, height: int = 5, width: int = 80):
+        self.dimensions = (height, width)
+        self.printed = []
+
+    def print_at(self, text, x, y):
+        self.printed.append((text, x, y))
+
+    def clear_buffer(self, fg, attr, bg):
+        self.printed = []
+
+    def refresh(self):
+        pass
+
+
+class TestRender(unittest.TestCase):
+    def setUp(self):
+        self.screen = FakeScreen()
+        self.model = render.RowModel(['destination', 'time ms'], 5)
+        self.renderer = render.TableRenderer(self.screen, self.model)
+        for index in range(5):
+            self.model.update(index, ['host{}'.format(index), 5 - index])
+
+    def test_redraw_only_changed_cells(self):
+        self.renderer.draw()
+        self.assertIn(('host2      ', 0, 3), self.screen.printed)
+        self.screen.printed = []
+        self.renderer.draw()
+        self.assertEqual(self.screen.printed, [])
+        self.model.update(1, ['host1', '-'])
+        self.model.update(4, ['host4', 7])
+        self.renderer.draw()
+        self.assertEqual(self.screen.printed, [('-      ', 13, 2)])
+
+    def test_scroll(self):
+        self.renderer.draw()
+        self.assertEqual(self.renderer.page_size, 3)
+        self.renderer.handle_key(render.Screen.KEY_PAGE_DOWN)
+        self.assertEqual(self.renderer.offset, 2)
+        self.screen.printed = []
+        self.renderer.draw()
+        self.assertIn(('host4      ', 0, 3), self.screen.printed)
+        self.assertIn('Rows 3-5 of 5. ', self.screen.printed[-1][0])
+        self.renderer.handle_key(render.Screen.KEY_UP)
+        self.assertEqual(self.renderer.offset, 1)
+        self.assertFalse(self.renderer.handle_key(ord('x')))
+
+    def test_sort(self):
+        self.model.sort_by(1)
+        self.assertEqual(self.model.get_order(), [4, 3, 2, 1, 0])
+        self.model.update(0, ['host0', '-'])
+        self.model.update(2, ['host2', 0.5])
+        self.assertEqual(self.model.get_order(), [2, 4, 3, 1, 0])
+        self.renderer.handle_key(ord('r'))
+        self.assertEqual(self.model.get_order(), [0, 1, 3, 4, 2])
+        self.assertEqual(self.model.get_header(),
+                         ('destination', 'time ms v'))
+        self.model.next_sort()
+        self.assertIsNone(self.model.sort_column)
+        self.assertEqual(self.model.get_order(), [4, 3, 2, 1, 0])
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+class TestPacing(unittest.TestCase):
+    def test_global_rate(self):
+        clock = FakeClock()
+        pacer = pacing.Pacer(rate=10, clock=clock)
+        delays = [pacer.reserve() for _ in range(4)]
+        for delay, expected in zip(delays, (0, 0.1, 0.2, 0.3)):
+            self.assertAlmostEqual(delay, expected)
+
+    def test_burst(self):
+        clock = FakeClock()
+        pacer = pacing.Pacer(rate=10, burst=3, clock=clock)
+        delays = [pacer.reserve() for _ in range(5)]
+        for delay, expected in zip(delays, (0, 0, 0, 0.1, 0.2)):
+            self.assertAlmostEqual(delay, expected)
+
+    def test_schedule_does_not_drift(self):
+        clock = FakeClock()
+        pacer = pacing.Pacer(rate=10, clock=clock)
+        for i in range(100):
+            pacer.wait(sleep=clock.sleep)
+            # time of work between sends is less than interval
+            clock.now += 0.03
+        self.assertAlmostEqual(clock.now, 100 + 9.9 + 0.03)
+        self.assertAlmostEqual(pacer.achieved_rate, 10)
+        self.assertIn('requested 10.0/s, achieved 10.0/s', str(pacer))
+
+    def test_late_caller_is_not_bursting(self):
+        clock = FakeClock()
+        pacer = pacing.Pacer(rate=10, clock=clock)
+        pacer.reserve()
+        clock.now += 5
+        self.assertEqual(pacer.reserve(), 0)
+        self.assertAlmostEqual(pacer.reserve(), 0.1)
+
+    def test_per_destination_rate(self):
+        clock = FakeClock()
+        pacer = pacing.Pacer(per_destination_rate=2, clock=clock)
+        self.assertEqual(pacer.reserve_destination('a'), 0)
+        self.assertEqual(pacer.reserve_destination('b'), 0)
+        self.assertAlmostEqual(pacer.reserve_destination('a'), 0.5)
+        self.assertAlmostEqual(pacer.reserve_destination('b'), 0.5)
+        self.assertEqual(pacer.reserve_destination(None), 0)
+        self.assertEqual(pacer.reserve(), 0)
+
+    def test_global_and_per_destination_rate(self):
+        clock = FakeClock()
+        pacer = pacing.Pacer(rate=10, per_destination_rate=2, clock=clock)
+        sent = []
+        for destination in ('a', 'b', 'a', 'c'):
+            pacer.wait(destination, sleep=clock.sleep)
+            sent.append(clock.now - 100)
+        for at, expected in zip(sent, (0, 0.1, 0.5, 0.6)):
+            self.assertAlmostEqual(at, expected)
+
+    def test_destination_does_not_hold_global_slots(self):
+        clock = FakeClock()
+        pacer = pacing.Pacer(rate=1000, per_destination_rate=1, clock=clock)
+        # ten concurrent probes to 'a' wait for their slots
+        delays = [pacer.reserve_destination('a') for _ in range(10)]
+        for delay, expected in zip(delays, range(10)):
+            self.assertAlmostEqual(delay, expected)
+        self.assertEqual(pacer.reserve(), 0)
+        # probe to 'b' is sent right after the first probe to 'a'
+        self.assertEqual(pacer.reserve_destination('b'), 0)
+        self.assertAlmostEqual(pacer.reserve(), 0.001)
+        clock.now += 1
+        self.assertEqual(pacer.reserve(), 0)
+
+    def test_idle_buckets_are_removed(self):
+        clock = FakeClock()
+        pacer = pacing.Pacer(per_destination_rate=1, clock=clock)
+        for i in range(pacing.MAX_BUCKETS):
+            pacer.reserve_destination(i)
+        clock.now += 2
+        pacer.reserve_destination('new')
+        self.assertEqual(list(pacer.buckets), ['new'])
+
+    def test_deadline_schedule(self):
+        clock = FakeClock()
+        schedule = pacing.DeadlineSchedule(1, clock=clock)
+        starts = []
+        for work_time in (0.3, 0.9, 0.1):
+            self.assertEqual(schedule.wait(clock.sleep), 0)
+            starts.append(clock.now)
+            clock.now += work_time
+        self.assertEqual(starts, [100, 101, 102])
+
+    def test_deadline_schedule_skip(self):
+        clock = FakeClock()
+        schedule = pacing.DeadlineSchedule(1, 'skip', clock=clock)
+        schedule.wait(clock.sleep)
+        clock.now += 2.5
+        self.assertAlmostEqual(schedule.wait(clock.sleep), 0.5)
+        self.assertEqual(schedule.wait(clock.sleep), 0)
+        self.assertEqual(clock.now, 103)
+
+    def test_deadline_schedule_catchup(self):
+        clock = FakeClock()
+        schedule = pacing.DeadlineSchedule(1, 'catchup', clock=clock)
+        schedule.wait(clock.sleep)
+        clock.now += 2.5
+        self.assertAlmostEqual(schedule.wait(clock.sleep), 1.5)
+        self.assertAlmostEqual(schedule.wait(clock.sleep), 0.5)
+        self.assertEqual(schedule.wait(clock.sleep), 0)
+        self.assertEqual(clock.now, 103)
+
+    def test_deadline_schedule_policy(self):
+        with self.assertRaises(ValueError):
+            pacing.DeadlineSchedule(1, 'late')
+
+    def test_unlimited(self):
+        pacer = pacing.Pacer()
+        self.assertEqual(pacer.reserve_destination('a'), 0)
+        self.assertEqual(pacer.reserve(), 0)
+        self.assertIsNone(pacer.achieved_rate)
+        self.assertIn('requested unlimited, achieved unknown', str(pacer))
+
+
+class LoopbackStandIn:
+    """Stand-in for raw sockets: replies to every sent SYN
+     with SYN-ACK from open ports or with RST from other ports."""
+
+    def __init__(self, open_ports: tuple = ()):
+        self.open_ports = open_ports
+        self.recv_socket, self.reply_socket = \
+            socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sent = []
+        self.auto_reply = True
+
+    def sendto(self, packet: bytes, addr: tuple):
+        self.sent.append(bytes(packet))
+        if not self.auto_reply:
+            return
+        syn = tcp_package.TCPPackage.parse_tcp_ipv4_package(packet)
+        if syn.dest_port in self.open_ports:
+            flags = tcp_package.TCPPackageType.SYN | \
+                tcp_package.TCPPackageType.ACK
+        else:
+            flags = tcp_package.TCPPackageType.RST | \
+                tcp_package.TCPPackageType.ACK
+        self.reply(flags, syn, ack_seq=syn.seq + 1)
+
+    def reply(self, flags, syn, ack_seq: int):
+        self.reply_socket.send(bytes(tcp_package.TCPPackage(
+            flags=flags,
+            source_ip=syn.dest_ip,
+            dest_ip=syn.source_ip,
+            source_port=syn.dest_port,
+            dest_port=syn.source_port,
+            ack_seq=ack_seq & 0xffffffff)))
+
+    def close(self):
+        self.recv_socket.close()
+        self.reply_socket.close()
+
+
+class TestSynProber(unittest.TestCase):
+    def setUp(self):
+        self.stand_in = LoopbackStandIn(open_ports=(80,))
+        self.prober = syn_prober.SynProber(
+            source_ports=(50000, 50002),
+            send_socket=self.stand_in,
+            recv_socket=self.stand_in.recv_socket)
+
+    def tearDown(self):
+        self.stand_in.close()
+
+    def test_open_and_closed_ports(self):
+        self.assertGreaterEqual(self.prober.ping('127.0.0.1', 80, 1), 0)
+        self.assertEqual(self.prober.ping('127.0.0.1', 81, 1), -1)
+        self.assertEqual(self.prober.in_flight, {})
+
+    def test_many_probes_in_flight(self):
+        self.stand_in.auto_reply = False
+        probes = [self.prober.send('127.0.0.1', 80, 1) for _ in range(100)]
+        self.assertEqual(len(self.prober.in_flight), 100)
+        self.assertEqual(len({probe.seq for probe in probes}), 100)
+        self.assertEqual({probe.source_port for probe in probes},
+                         {50000, 50001})
+        for packet in reversed(self.stand_in.sent):
+            syn = tcp_package.TCPPackage.parse_tcp_ipv4_package(packet)
+            self.stand_in.reply(tcp_package.TCPPackageType.SYN |
+                                tcp_package.TCPPackageType.ACK,
+                                syn, ack_seq=syn.seq + 1)
+        completed = self.prober.receive(1)
+        self.assertEqual(len(completed), 100)
+        self.assertTrue(all(probe.is_open for probe in probes))
+
+    def test_unmatched_reply(self):
+        self.stand_in.auto_reply = False
+        probe = self.prober.send('127.0.0.1', 80, 1)
+        syn = tcp_package.TCPPackage.parse_tcp_ipv4_package(
+            self.stand_in.sent[0])
+        syn_ack = tcp_package.TCPPackageType.SYN | \
+            tcp_package.TCPPackageType.ACK
+        self.stand_in.reply(syn_ack, syn, ack_seq=syn.seq + 2)
+        self.stand_in.reply(tcp_package.TCPPackageType.ACK,
+                            syn, ack_seq=syn.seq + 1)
+        syn.dest_port = 443
+        self.stand_in.reply(syn_ack, syn, ack_seq=syn.seq + 1)
+        self.assertEqual(self.prober.receive(0.1), [])
+        self.assertIsNone(probe.rtt)
+        syn.dest_port = 80
+        self.stand_in.reply(syn_ack, syn, ack_seq=syn.seq + 1)
+        self.assertEqual(self.prober.receive(1), [probe])
+
+    @unittest.skipUnless(hasattr(os, 'geteuid') and os.geteuid() == 0,
+                         'requires root for raw sockets')
+    def test_raw_socket_ping_on_loopback(self):
+        listener = open_loopback_listener()
+        tcp_ping = ping.TCPing(destination='127.0.0.1',
+                               port=listener.getsockname()[1],
+                               timeout=1)
+        measure = tcp_ping.do_ping(ping.ConnectionType.RAW_SOCKET)
+        listener.close()
+        self.assertFalse(measure.is_failed)
+        tcp_ping.port = get_closed_loopback_port()
+        measure = tcp_ping.do_ping(ping.ConnectionType.RAW_SOCKET)
+        self.assertTrue(measure.is_failed)
+
+    @unittest.skipUnless(hasattr(os, 'geteuid') and os.geteuid() == 0,
+                         'requires root for raw sockets')
+    def test_raw_socket_ping_on_ipv6_loopback(self):
+        try:
+            listener = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+            listener.bind(('::1', 0))
+        except OSError:
+            self.skipTest('IPv6 loopback is not available')
+        listener.listen()
+        tcp_ping = ping.TCPing(destination='::1',
+                               port=listener.getsockname()[1],
+                               timeout=1,
+                               use_ipv6=True)
+        measure = tcp_ping.do_ping(ping.ConnectionType.RAW_SOCKET)
+        listener.close()
+        self.assertFalse(measure.is_failed)
+        measure = tcp_ping.do_ping(ping.ConnectionType.RAW_SOCKET)
+        self.assertTrue(measure.is_failed)
+
+    def test_probe_many(self):
+        self.prober = syn_prober.SynProber(
+            source_ports=(50000, 50002),
+            send_socket=self.stand_in,
+            recv_socket=self.stand_in.recv_socket,
+            batch_size=8)
+        targets = [('127.0.0.1', 80 + i % 2, 1) for i in range(20)]
+        probes = self.prober.probe_many(targets)
+        self.assertEqual(len(self.stand_in.sent), 20)
+        self.assertEqual([probe.is_open for probe in probes],
+                         [i % 2 == 0 for i in range(20)])
+        self.assertTrue(all(probe.rtt >= 0 for probe in probes))
+        self.assertEqual(self.prober.in_flight, {})
+
+    def test_probe_many_with_pacer(self):
+        pacer = pacing.Pacer(rate=200)
+        probes = self.prober.probe_many([('127.0.0.1', 80, 1)] * 10, pacer)
+        self.assertTrue(all(probe.is_open for probe in probes))
+        self.assertEqual(pacer.count, 10)
+        self.assertLess(pacer.achieved_rate, 220)
+
+    @unittest.skipUnless(hasattr(os, 'geteuid') and os.geteuid() == 0,
+                         'requires root for raw sockets')
+    def test_do_raw_pings_on_loopback(self):
+        listener = open_loopback_listener()
+        pings = [ping.TCPing(destination='127.0.0.1',
+                             port=listener.getsockname()[1],
+                             timeout=1),
+                 ping.TCPing(destination='127.0.0.1',
+                             port=get_closed_loopback_port(),
+                             timeout=1)]
+        measures = ping.do_raw_pings(pings, count=3)
+        listener.close()
+        self.assertEqual([measure.is_failed for measure in measures],
+                         [False] * 3 + [True] * 3)
+        self.assertEqual(len(pings[0].measures), 3)
+
+    def test_do_raw_pings_with_unresolved_destination(self):
+        fake_resolver = resolver.Resolver(resolve_func=FakeResolveFunc())
+        pings = [ping.TCPing(destination=destination,
+                             port=80,
+                             timeout=1,
+                             resolver=fake_resolver)
+                 for destination in ('localhost', 'host.invalid')]
+        with mock.patch.dict(syn_prober.default_probers,
+                             {socket.AF_INET: self.prober}):
+            measures = ping.do_raw_pings(pings, count=2)
+        self.assertEqual([measure.is_failed for measure in measures],
+                         [False, False, True, True])
+        self.assertEqual(len(self.stand_in.sent), 2)
+        self.assertEqual(len(pings[1].measures), 2)
+
+    def test_expire(self):
+        self.stand_in.auto_reply = False
+        probe = self.prober.send('127.0.0.1', 80, 0.5)
+        self.assertEqual(self.prober.expire(probe.deadline - 0.1), [])
+        self.assertEqual(self.prober.expire(probe.deadline), [probe])
+        self.assertEqual(probe.rtt, -1)
+        self.assertEqual(self.prober.in_flight, {})
+
+
+class TestBatchIO(unittest.TestCase):
+    def check_batches(self, family, host, use_mmsg):
+        try:
+            receiver = socket.socket(family, socket.SOCK_DGRAM)
+            receiver.bind((host, 0))
+        except OSError:
+            self.skipTest('loopback of family is not available')
+        sender = socket.socket(family, socket.SOCK_DGRAM)
+        sender.bind((host, 0))
+        self.addCleanup(receiver.close)
+        self.addCleanup(sender.close)
+        batch_sender = batch_io.BatchSender(sender, batch_size=4,
+                                            use_mmsg=use_mmsg)
+        batch_receiver = batch_io.BatchReceiver(receiver, batch_size=3,
+                                                use_mmsg=use_mmsg)
+        datagrams = [b'x' * i + b'y' for i in range(4)]
+        for datagram in datagrams:
+            batch_sender.add(datagram, receiver.getsockname())
+        self.assertTrue(batch_sender.is_full)
+        with self.assertRaises(BufferError):
+            batch_sender.add(b'z', receiver.getsockname())
+        self.assertEqual(batch_sender.flush(), 4)
+        received = []
+        for _ in range(10):
+            batch = batch_receiver.receive()
+            self.assertLessEqual(len(batch), 3)
+            for buffer, size, address in batch:
+                received.append(bytes(buffer[:size]))
+                self.assertEqual(address[:2], sender.getsockname()[:2])
+            if len(received) == 4:
+                break
+        self.assertEqual(received, datagrams)
+        self.assertEqual(batch_receiver.receive(), [])
+
+    def test_ipv4_batches(self):
+        for use_mmsg in (True, False):
+            self.check_batches(socket.AF_INET, '127.0.0.1', use_mmsg)
+
+    def test_ipv6_batches(self):
+        for use_mmsg in (True, False):
+            self.check_batches(socket.AF_INET6, '::1', use_mmsg)
+
+
+class TestBPF(unittest.TestCase):
+    def get_packet(self, flags, dest_port, options=b''):
+        packet = bytes(tcp_package.TCPPackage(flags=flags,
+                                              source_ip="10.0.0.2",
+                                              dest_ip="10.0.0.1",
+                                              source_port=443,
+                                              dest_port=dest_port))
+        ihl_version = 0x45 + len(options) // 4
+        return bytes([ihl_version]) + packet[1:20] + options + packet[20:]
+
+    def test_reply_filter(self):
+        flags = tcp_package.TCPPackageType
+        sender, receiver = socket.socketpair(socket.AF_UNIX,
+                                             socket.SOCK_DGRAM)
+        self.addCleanup(sender.close)
+        self.addCleanup(receiver.close)
+        if not bpf.attach_filter(receiver,
+                                 bpf.get_reply_filter(40000, 40010, 32)):
+            self.skipTest('socket filters are not supported')
+        passed = (self.get_packet(flags.SYN | flags.ACK, 40000),
+                  self.get_packet(flags.RST | flags.ACK, 40009),
+                  self.get_packet(flags.RST, 40005),
+                  self.get_packet(flags.SYN | flags.ACK, 40001,
+                                  options=b'\x01' * 8))
+        rejected = (self.get_packet(flags.SYN | flags.ACK, 39999),
+                    self.get_packet(flags.SYN | flags.ACK, 40010),
+                    self.get_packet(flags.SYN, 40001),
+                    self.get_packet(flags.ACK, 40001),
+                    self.get_packet(flags.SYN | flags.ACK, 40012,
+                                    options=b'\x01' * 8))
+        for packet in rejected + passed:
+            sender.send(packet)
+        receiver.setblocking(False)
+        for packet in passed:
+            self.assertEqual(receiver.recv(100), packet[:32])
+        with self.assertRaises(BlockingIOError):
+            receiver.recv(100)
+
+    def test_reply_filter_ipv6(self):
+        flags = tcp_package.TCPPackageType
+        sender, receiver = socket.socketpair(socket.AF_UNIX,
+                                             socket.SOCK_DGRAM)
+        self.addCleanup(sender.close)
+        self.addCleanup(receiver.close)
+        if not bpf.attach_filter(receiver,
+                                 bpf.get_reply_filter(40000, 40010,
+                                                      use_ipv6=True)):
+            self.skipTest('socket filters are not supported')
+        # raw IPv6 socket receives segments without IP header
+        passed = self.get_packet(flags.SYN | flags.ACK, 40003)[20:]
+        sender.send(self.get_packet(flags.SYN, 40003)[20:])
+        sender.send(self.get_packet(flags.SYN | flags.ACK, 40011)[20:])
+        sender.send(passed)
+        receiver.setblocking(False)
+        self.assertEqual(receiver.recv(100), passed)
+        with self.assertRaises(BlockingIOError):
+            receiver.recv(100)
+
+    def test_reply_filter_default_source_ports(self):
+        flags = tcp_package.TCPPackageType
+        sender, receiver = socket.socketpair(socket.AF_UNIX,
+                                             socket.SOCK_DGRAM)
+        self.addCleanup(sender.close)
+        self.addCleanup(receiver.close)
+        first, stop = syn_prober.DEFAULT_SOURCE_PORTS
+        if not bpf.attach_filter(receiver, bpf.get_reply_filter(first, stop)):
+            self.skipTest('socket filters are not supported')
+        passed = self.get_packet(flags.SYN | flags.ACK, 65535)
+        sender.send(self.get_packet(flags.SYN | flags.ACK, first - 1))
+        sender.send(passed)
+        receiver.setblocking(False)
+        self.assertEqual(receiver.recv(100), passed)
+        with self.assertRaises(BlockingIOError):
+            receiver.recv(100)
+
+    def test_reject_filter(self):
+        sender, receiver = socket.socketpair(socket.AF_UNIX,
+                                             socket.SOCK_DGRAM)
+        self.addCleanup(sender.close)
+        self.addCleanup(receiver.close)
+        queued = self.get_packet(tcp_package.TCPPackageType.RST, 40000)
+        sender.send(queued)
+        if not bpf.attach_filter(receiver, bpf.get_reject_filter()):
+            self.skipTest('socket filters are not supported')
+        sender.send(self.get_packet(tcp_package.TCPPackageType.RST, 40001))
+        # packet, queued before filter, is discarded by drain
+        self.assertEqual(syn_prober.drain_socket(receiver), 1)
+        self.assertEqual(syn_prober.drain_socket(receiver), 0)
+
 
 class TestTCPPackage(unittest.TestCase):
     expected_headers_ipv4 = b'E\x00\x00(\xd41\x00\x00' + \
-                            b'\xff\x06\x00\n\x7f\x00\x00\x01{{{{'
+                            b'\xff\x06q\xa6\x7f\x00\x00\x01{{{{'
     expected_headers_tcp = b'\x00\x00\x01\xbb\x00' + \
                            b'\x00\x00\x19\x00\x00' + \
-                           b'\x004P\x10\xd0\x16\x17\xbb\x00\x00'
+                           b'\x004P\x02\x16\xd0\x21\x13\x00\x00'
 
     def test_compilating_ipv4_headers(self):
         pack = tcp_package.TCPPackage(flags=tcp_package.TCPPackageType.SYN,
@@ -320,6 +1786,110 @@ class TestTCPPackage(unittest.TestCase):
         self.assertEqual(self.expected_headers_ipv4 +
                          self.expected_headers_tcp, tcp_pack)
 
+    def test_syn_template(self):
+        template = tcp_package.SynTemplate("10.0.0.1", "192.168.200.7", 443)
+        for seq, source_port, pack_id in ((25, 40000, 0),
+                                          (0xfffffffe, 65535, 54321),
+                                          (0x80000000, 1, 7)):
+            pack = tcp_package.TCPPackage(
+                flags=tcp_package.TCPPackageType.SYN,
+                source_ip="10.0.0.1",
+                dest_ip="192.168.200.7",
+                dest_port=443,
+                seq=seq,
+                source_port=source_port,
+                pack_id=pack_id)
+            packet = template.build(seq, source_port, pack_id)
+            self.assertEqual(packet, bytes(pack))
+
+    def test_internet_checksum_vectors(self):
+        vectors = (
+            # RFC 1071, 3. Numerical Examples
+            ('0001f203f4f5f6f7', 0x220d),
+            # IPv4 header with zero checksum field
+            ('450000730000400040110000c0a80001c0a800c7', 0xb861),
+            # sum overflows twice: 0x1ffff -> 0x10000 -> 0x1
+            ('ffffffff0001', 0xfffe),
+            # odd length is padded with zero byte
+            ('0102ab', 0x53fd),
+            ('ffff', 0x0000),
+            ('0000', 0xffff),
+            ('', 0xffff))
+        for data, expected in vectors:
+            data = bytes.fromhex(data)
+            self.assertEqual(tcp_package.internet_checksum(data), expected)
+            self.assertEqual(tcp_package.internet_checksum(
+                memoryview(bytearray(data))), expected)
+
+    def test_checksum_of_headers_is_valid(self):
+        pack = tcp_package.TCPPackage(flags=tcp_package.TCPPackageType.SYN,
+                                      source_ip="192.168.200.7",
+                                      dest_ip="10.250.0.1",
+                                      dest_port=443,
+                                      seq=0xdeadbeef)
+        packet = bytes(pack)
+        self.assertEqual(tcp_package.internet_checksum(packet[:20]), 0)
+        pseudo_headers = tcp_package.PSEUDO_HEADER_IPV4.pack(
+            packet[12:16], packet[16:20], 0, socket.IPPROTO_TCP, 20)
+        self.assertEqual(tcp_package.internet_checksum(
+            pseudo_headers + packet[20:]), 0)
+        self.assertEqual(tcp_package.TCPPackage.calculate_checksum(
+            (pseudo_headers + packet[20:]).decode('latin-1')), 0)
+
+    def test_ipv6_package(self):
+        pack = tcp_package.TCPPackage(flags=tcp_package.TCPPackageType.SYN,
+                                      source_ip="2001:db8::1",
+                                      dest_ip="2001:db8::2:1",
+                                      dest_port=443,
+                                      seq=0xdeadbeef,
+                                      use_ipv6=True)
+        packet = bytes(pack)
+        self.assertEqual(len(packet), 60)
+        self.assertEqual(packet[:8], b'\x60\x00\x00\x00\x00\x14\x06\xff')
+        pseudo_headers = tcp_package.PSEUDO_HEADER_IPV6.pack(
+            packet[8:24], packet[24:40], 20, socket.IPPROTO_TCP)
+        self.assertEqual(tcp_package.internet_checksum(
+            pseudo_headers + packet[40:]), 0)
+        parsed = tcp_package.TCPPackage.parse_tcp_ipv6_package(packet)
+        self.assertEqual(parsed.source_ip, "2001:db8::1")
+        self.assertEqual(parsed.dest_ip, "2001:db8::2:1")
+        self.assertEqual(parsed.dest_port, 443)
+        self.assertEqual(parsed.seq, 0xdeadbeef)
+        self.assertEqual(bytes(parsed), packet)
+
+    def test_syn_template_ipv6(self):
+        template = tcp_package.SynTemplate("2001:db8::1", "2001:db8::2", 80,
+                                           use_ipv6=True)
+        for seq, source_port in ((25, 40000), (0xfffffffe, 65535)):
+            pack = tcp_package.TCPPackage(
+                flags=tcp_package.TCPPackageType.SYN,
+                source_ip="2001:db8::1",
+                dest_ip="2001:db8::2",
+                dest_port=80,
+                seq=seq,
+                source_port=source_port,
+                use_ipv6=True)
+            self.assertEqual(template.build(seq, source_port, 7),
+                             pack.get_tcp_headers())
+
+    def test_unpack_tcp_reply(self):
+        pack = tcp_package.TCPPackage(flags=tcp_package.TCPPackageType.RST,
+                                      source_ip="::1",
+                                      dest_ip="::1",
+                                      source_port=443,
+                                      dest_port=40001,
+                                      seq=7,
+                                      ack_seq=26,
+                                      use_ipv6=True)
+        segment = pack.get_tcp_headers()
+        self.assertEqual(tcp_package.unpack_tcp_reply(segment, len(segment)),
+                         (443, 40001, 7, 26, 0x04))
+        self.assertIsNone(tcp_package.unpack_tcp_reply(segment, 12))
+
+    def test_update_checksum(self):
+        self.assertEqual(tcp_package.update_checksum(0xdd2f, (0x5555,),
+                                                     (0x3285,)), 0x0000)
+
     def test_parse_tcp_pack(self):
         pack = tcp_package.TCPPackage(flags=tcp_package.TCPPackageType.SYN,
                                       source_ip="127.0.0.1",
@@ -331,6 +1901,31 @@ class TestTCPPackage(unittest.TestCase):
         tcp_parsed = tcp_package.TCPPackage.parse_tcp_ipv4_package(tcp_pack)
         self.assertEqual(tcp_pack[38], tcp_parsed.__bytes__()[38])
 
+    def test_unpack_ipv4_reply(self):
+        pack = tcp_package.TCPPackage(flags=tcp_package.TCPPackageType.SYN |
+                                      tcp_package.TCPPackageType.ACK,
+                                      source_ip="10.0.0.2",
+                                      dest_ip="10.0.0.1",
+                                      source_port=443,
+                                      dest_port=40001,
+                                      seq=7,
+                                      ack_seq=26)
+        packet = bytes(pack)
+        expected = (0x0a000002, 443, 40001, 7, 26, 0x12)
+        buffer = bytearray(128)
+        buffer[:len(packet)] = packet
+        self.assertEqual(tcp_package.unpack_ipv4_reply(buffer, len(packet)),
+                         expected)
+        # IPv4 header with 4 bytes of options
+        with_options = bytes([0x46]) + packet[1:20] + b'\x01' * 4 + \
+            packet[20:]
+        self.assertEqual(tcp_package.unpack_ipv4_reply(with_options,
+                                                       len(with_options)),
+                         expected)
+        self.assertIsNone(tcp_package.unpack_ipv4_reply(buffer, 30))
+        udp_packet = packet[:9] + bytes([socket.IPPROTO_UDP]) + packet[10:]
+        self.assertIsNone(tcp_package.unpack_ipv4_reply(udp_packet, 40))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,21 +1,58 @@
 from watchdog import watchdog_ping
+from watchdog import scheduler
+from watchdog import metrics
+from watchdog import render
+from watchdog import targets
 import argparse
+import itertools
+import sys
 from tcping import errors
+from tcping import pacing
 from tcping import ping
+from tcping import sample_log
 import logging
-import time
 from asciimatics.screen import Screen
-from concurrent.futures import ProcessPoolExecutor
+
+# seconds between frames of the table
+REFRESH_PERIOD = 0.1
 
 
 def create_cmd_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument('destinations', default=None, nargs="*",
-                        help='IP\'s, Domain\'s or URL\'s with ports')
+                        help='IP\'s, Domain\'s or URL\'s with ports and '
+                             'optional intervals between pings in seconds, '
+                             'like host:port@interval')
+    parser.add_argument('--targets', default=None, dest='targets',
+                        help='file with destinations, one per line, '
+                             'like host_or_cidr[:ports][@interval], '
+                             'where ports are like 22,80,8000-8100; '
+                             '- to read from stdin')
     parser.add_argument('-t', '--timeout', default='0', dest='timeout',
                         help='to set timeout')
     parser.add_argument('-d', '--delay', default='0.5', dest='delay',
-                        help='delay between pings in seconds')
+                        help='delay between pings in seconds '
+                             'for destinations without interval')
+    parser.add_argument('-w', '--workers', default='100', dest='workers',
+                        help='maximum count of pings at the same time')
+    parser.add_argument('-r', '--rate', default='0', dest='rate',
+                        help='maximum count of pings per second, '
+                             '0 is unlimited')
+    parser.add_argument('--per-destination-rate', default='0',
+                        dest='per_destination_rate',
+                        help='maximum count of pings per second '
+                             'to one destination, 0 is unlimited')
+    parser.add_argument('--export', default=None, dest='export',
+                        help='file to append every ping to, '
+                             'in binary log of fixed-size records')
+    parser.add_argument('--metrics-port', default=None, dest='metrics_port',
+                        help='port to serve Prometheus metrics '
+                             'on /metrics')
+    parser.add_argument('--metrics-host', default='', dest='metrics_host',
+                        help='address to serve metrics on, default - all')
+    parser.add_argument('--headless', action='store_true', dest='headless',
+                        help='to ping without table, '
+                             'only serving metrics and exporting pings')
     parser.add_argument('-6', '--ipv6', action='store_true', dest="use_ipv6",
                         help='to use ipv6')
     parser.add_argument('-o', '--output-level',
@@ -27,59 +64,188 @@ def create_cmd_parser():
     return parser
 
 
-def show_watchdog_tui(screen):
+def load_targets(path: str):
+    """Yield TargetSpec of every line of file of targets or stdin,
+     if path is '-'; invalid lines are logged."""
+
+    file = sys.stdin if path == '-' else open(path)
+    try:
+        loader = targets.TargetLoader(file)
+        yield from loader
+    finally:
+        if file is not sys.stdin:
+            file.close()
+    for number, line, error in loader.errors:
+        logging.warning('%s:%s: %s: %s', path, number, error.message, line)
+
+
+class Watchdog:
+    """Scheduler of pings of destinations from command line arguments
+     with consumers of finished pings: metrics and export.
+     Consumers are called by probing thread, so they see every ping,
+     even if display drops some; summarize is passed to ProbeScheduler."""
+
+    def __init__(self, args, summarize=None):
+        destinations = [targets.parse_target(destination)
+                        for destination in args.destinations]
+        if args.targets is not None:
+            destinations = itertools.chain(destinations,
+                                           load_targets(args.targets))
+        watchdog_ping_data = watchdog_ping \
+            .WatchdogPingData(destinations=destinations,
+                              timeout=args.timeout,
+                              use_ipv6=args.use_ipv6)
+        # table shows statistics of every target, so pings are kept for it;
+        # in headless mode a target costs only its deadline between probes
+        pings = watchdog_ping_data.get_targets(
+            ping.AsyncTCPing, float(args.delay), not args.headless)
+        if len(pings) == 0:
+            raise errors.InvalidTarget
+        self.pacer = pacing.Pacer(float(args.rate),
+                                  float(args.per_destination_rate))
+        self.registry = None
+        self.metrics_server = None
+        self.writer = None
+        self.probe_scheduler = scheduler.ProbeScheduler(
+            pings, args.workers,
+            pacer=self.pacer,
+            summarize=summarize,
+            observe=self.__consume)
+        try:
+            if args.metrics_port is not None:
+                self.registry = metrics.MetricsRegistry()
+                self.metrics_server = metrics.MetricsServer(
+                    self.registry, args.metrics_host, args.metrics_port)
+                self.metrics_server.start()
+            if args.export is not None:
+                self.writer = sample_log.SampleWriter(args.export)
+        except BaseException:
+            self.close()
+            raise
+
+    def start(self):
+        self.probe_scheduler.start()
+
+    def start_thread(self):
+        self.probe_scheduler.start_thread()
+
+    def poll(self, duration: float) -> list:
+        """Run pings for duration seconds and return finished pings."""
+
+        return self.probe_scheduler.poll(duration)
+
+    def drain(self) -> list:
+        """Return list of tuples (index, measure, summary)
+         of pings, finished by probing thread."""
+
+        return self.probe_scheduler.drain()
+
+    def __consume(self, measure, destination: str):
+        if self.registry is not None:
+            self.registry.observe(measure, destination)
+        if self.writer is not None:
+            self.writer.write(measure)
+
+    def close(self):
+        self.probe_scheduler.close()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        if self.writer is not None:
+            self.writer.close()
+
+
+def get_row(tcp_ping: ping.AsyncTCPing, measure) -> list:
+    """Return row of table for measure, finished by tcp_ping;
+     it is called by probing thread."""
+
+    return watchdog_ping.WatchdogPingData.get_row(measure,
+                                                  tcp_ping.destination,
+                                                  tcp_ping.statistics)
+
+
+def get_summary_table(probe_scheduler: scheduler.ProbeScheduler) -> str:
+    """Return table of the latest measures of all pings."""
+
+    table = watchdog_ping \
+        .WatchdogPingData \
+        .get_measures_to_print(probe_scheduler.get_latest(),
+                               probe_scheduler.get_latest_statistics())
+    return str(table)
+
+
+def show_watchdog_tui(screen, watchdog: Watchdog):
+    """Show table of pings, which run in background thread.
+     Table is drawn and keys are read every REFRESH_PERIOD,
+     however long pings take."""
+
+    probe_scheduler = watchdog.probe_scheduler
+    model = render.RowModel(
+        watchdog_ping.WatchdogPingData.get_field_names(True),
+        len(probe_scheduler.pings))
+    renderer = render.TableRenderer(screen, model)
+    frames = pacing.DeadlineSchedule(REFRESH_PERIOD)
+    interrupted = False
+    try:
+        watchdog.start_thread()
+        while True:
+            frames.wait()
+            for index, _, row in watchdog.drain():
+                model.update(index, row)
+            ev = screen.get_key()
+            while ev is not None:
+                if ev in (ord('Q'), ord('q')):
+                    return
+                renderer.handle_key(ev)
+                ev = screen.get_key()
+            status = str(watchdog.pacer)
+            dropped = probe_scheduler.results.dropped
+            if dropped:
+                status += ', dropped results: {}'.format(dropped)
+            renderer.draw(status)
+    except KeyboardInterrupt:
+        interrupted = True
+    finally:
+        watchdog.close()
+    if interrupted:
+        print(get_summary_table(probe_scheduler) + "\n" + str(watchdog.pacer))
+
+
+def run_headless(watchdog: Watchdog):
+    """Ping destinations without screen, until interrupted."""
+
+    if watchdog.metrics_server is not None:
+        logging.info('serving metrics on %s:%s',
+                     *watchdog.metrics_server.address[:2])
+    try:
+        watchdog.start()
+        while True:
+            watchdog.poll(REFRESH_PERIOD)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watchdog.close()
+
+
+def main():
     cmd_parser = create_cmd_parser()
     args = cmd_parser.parse_args()
-    if len(args.destinations) == 0:
+    if len(args.destinations) == 0 and args.targets is None:
         cmd_parser.print_help()
+        return
+    logging.basicConfig(level=logging.INFO)
+    try:
+        watchdog = Watchdog(args, None if args.headless else get_row)
+    except errors.PingError as e:
+        logging.error(e.message)
+        exit(1)
+    except OSError as e:
+        logging.error(e)
+        exit(1)
+    if args.headless:
+        run_headless(watchdog)
     else:
-        last_info = ""
-        try:
-            destinations = watchdog_ping \
-                .WatchdogPingData.parse_destinations(args.destinations)
-            watchdog_ping_data = watchdog_ping \
-                .WatchdogPingData(destinations=destinations,
-                                  timeout=args.timeout,
-                                  use_ipv6=args.use_ipv6)
-            delay = float(args.delay)
-            pings = watchdog_ping_data.get_pings()
-            while True:
-                measures_to_print = []
-                futures = []
-                with ProcessPoolExecutor(max_workers=2) as executor:
-                    for tcp_ping in pings:
-                        future = executor.submit(ping.TCPing.do_ping, tcp_ping)
-                        futures.append(future)
-                measures = [future.result() for future in futures]
-                for measure in measures:
-                    measure_with_destination = measure, tcp_ping.destination
-                    measures_to_print.append(measure_with_destination)
-                table = watchdog_ping \
-                    .WatchdogPingData \
-                    .get_measures_to_print(measures_to_print)
-                screen.clear()
-                last_info = str(table)
-                lines = str(table).split("\n")
-                i = 0
-                for line in lines:
-                    i += 1
-                    screen.print_at(line, 0, i)
-                ev = screen.get_key()
-                if ev in (ord('Q'), ord('q')):
-                    return
-                screen.refresh()
-                max_time, min_time = watchdog_ping \
-                    .WatchdogPingData \
-                    .get_max_and_min_time(measures_to_print)
-                if max_time < delay and min_time > 0:
-                    time.sleep(delay - max_time)
-        except errors.PingError as e:
-            logging.basicConfig(level=logging.INFO)
-            logging.error(e.message)
-            exit(1)
-        except KeyboardInterrupt:
-            print(last_info)
+        Screen.wrapper(show_watchdog_tui, arguments=[watchdog])
 
 
 if __name__ == '__main__':
-    Screen.wrapper(show_watchdog_tui)
+    main()
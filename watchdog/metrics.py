@@ -0,0 +1,183 @@
+import bisect
+import http.server
+import threading
+
+# upper bounds of buckets of latency histogram in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# name, type and help of every metric family
+FAMILIES = (
+    ('tcping_probes_total', 'counter', 'Count of finished probes.'),
+    ('tcping_probe_failures_total', 'counter', 'Count of failed probes.'),
+    ('tcping_loss_ratio', 'gauge', 'Ratio of failed probes.'),
+    ('tcping_latency_seconds', 'histogram',
+     'Duration of successful handshakes.'),
+)
+
+
+def escape_label(value) -> str:
+    """Escape value of label for text exposition format."""
+
+    return str(value).replace('\\', '\\\\') \
+        .replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_bound(bound: float) -> str:
+    """Return upper bound of bucket like Prometheus clients do."""
+
+    return repr(float(bound))
+
+
+class DestinationMetrics:
+    """Counters and latency histogram of one destination.
+     They are updated by observe, when probe finishes;
+     text of every metric family is formatted again only
+     if destination was observed since previous scrape."""
+
+    def __init__(self, destination: str, port: int):
+        self.labels = 'destination="{}",port="{}"'.format(
+            escape_label(destination), escape_label(port))
+        self.probes = 0
+        self.failures = 0
+        self.latency_sum = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.__version = 0
+        self.__rendered_version = -1
+        self.__rendered = ()
+
+    def observe(self, measure):
+        """Account finished probe."""
+
+        self.probes += 1
+        if measure.is_failed:
+            self.failures += 1
+        else:
+            value = float(measure)
+            self.latency_sum += value
+            self.buckets[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.__version += 1
+
+    @property
+    def loss_ratio(self) -> float:
+        """Return ratio of failed probes."""
+
+        if self.probes == 0:
+            return 0.0
+        return self.failures / self.probes
+
+    def render(self) -> tuple:
+        """Return tuple with text of every metric family
+         of destination, in order of FAMILIES."""
+
+        version = self.__version
+        if version != self.__rendered_version:
+            self.__rendered = self.__format()
+            self.__rendered_version = version
+        return self.__rendered
+
+    def __format(self) -> tuple:
+        labels = self.labels
+        histogram = []
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            cumulative += count
+            histogram.append('tcping_latency_seconds_bucket{{{},le="{}"}} {}'
+                             .format(labels, format_bound(bound),
+                                     cumulative))
+        successful = self.probes - self.failures
+        histogram.append('tcping_latency_seconds_bucket{{{},le="+Inf"}} {}'
+                         .format(labels, successful))
+        histogram.append('tcping_latency_seconds_sum{{{}}} {}'
+                         .format(labels, repr(self.latency_sum)))
+        histogram.append('tcping_latency_seconds_count{{{}}} {}'
+                         .format(labels, successful))
+        return ('tcping_probes_total{{{}}} {}'.format(labels, self.probes),
+                'tcping_probe_failures_total{{{}}} {}'
+                .format(labels, self.failures),
+                'tcping_loss_ratio{{{}}} {}'
+                .format(labels, repr(self.loss_ratio)),
+                '\n'.join(histogram))
+
+
+class MetricsRegistry:
+    """Metrics of all destinations in Prometheus text format.
+     observe is called by probing thread and render by HTTP thread
+     without locks: every update is a single assignment and
+     render iterates over snapshot of destinations,
+     so scrape costs O(destinations) and does not stop probing."""
+
+    def __init__(self):
+        self.destinations = {}
+
+    def observe(self, measure, destination: str):
+        """Account finished probe of destination."""
+
+        key = (destination, measure.port)
+        metrics = self.destinations.get(key)
+        if metrics is None:
+            metrics = DestinationMetrics(destination, measure.port)
+            self.destinations[key] = metrics
+        metrics.observe(measure)
+
+    def render(self) -> str:
+        """Return all metrics in text exposition format."""
+
+        rendered = [metrics.render()
+                    for metrics in list(self.destinations.values())]
+        lines = []
+        for i, (name, metric_type, help_text) in enumerate(FAMILIES):
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            lines.extend(families[i] for families in rendered)
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """Serves metrics of registry of server on /metrics."""
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """HTTP server of /metrics endpoint, which runs in daemon thread."""
+
+    def __init__(self, registry: MetricsRegistry,
+                 host: str = '', port: int = 9100):
+        self.server = http.server.ThreadingHTTPServer((host, int(port)),
+                                                      MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.registry = registry
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+
+    @property
+    def address(self) -> tuple:
+        """Return address, which server listens on."""
+
+        return self.server.server_address
+
+    def start(self):
+        """Start serving in background thread."""
+
+        self.thread.start()
+
+    def close(self):
+        """Stop serving and close listening socket."""
+
+        if self.thread.is_alive():
+            self.server.shutdown()
+        self.server.server_close()
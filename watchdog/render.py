@@ -0,0 +1,212 @@
+import bisect
+from asciimatics.screen import Screen
+
+# spaces between columns of table
+COLUMN_GAP = 2
+# keys, which scroll viewport, and count of pages or lines they scroll
+SCROLL_LINES = {Screen.KEY_UP: -1, Screen.KEY_DOWN: 1}
+SCROLL_PAGES = {Screen.KEY_PAGE_UP: -1, Screen.KEY_PAGE_DOWN: 1}
+SORT_KEYS = (ord('s'), ord('S'))
+REVERSE_KEYS = (ord('r'), ord('R'))
+
+
+def get_sort_key(value) -> tuple:
+    """Return key, which orders numbers before strings,
+     so column with '-' for failed pings can be sorted."""
+
+    if isinstance(value, (int, float)):
+        return 0, value, ''
+    return 1, 0, str(value)
+
+
+class RowModel:
+    """Rows of table, kept between frames.
+     Row is formatted to cells only when it is updated,
+     and gets new version, so renderer redraws only changed rows.
+     Only rows, which were updated at least once, are shown;
+     order of them is sorted again only after sort key of some row
+     changed, and sort of almost sorted order takes linear time."""
+
+    def __init__(self, field_names: list, size: int):
+        self.field_names = list(field_names)
+        self.widths = [len(name) for name in self.field_names]
+        self.values = [None] * size
+        self.cells = [None] * size
+        self.versions = [0] * size
+        self.order = []
+        self.sort_column = None
+        self.reverse = False
+        self.__unsorted = False
+
+    def update(self, index: int, row: list):
+        """Set values of row with index."""
+
+        cells = tuple('' if value is None else str(value) for value in row)
+        if cells == self.cells[index]:
+            return
+        previous = self.values[index]
+        self.values[index] = row
+        self.cells[index] = cells
+        self.versions[index] += 1
+        for column, cell in enumerate(cells):
+            if len(cell) > self.widths[column]:
+                self.widths[column] = len(cell)
+        if previous is None:
+            if self.sort_column is None:
+                bisect.insort(self.order, index)
+            else:
+                self.order.append(index)
+                self.__unsorted = True
+        elif self.sort_column is not None and \
+                previous[self.sort_column] != row[self.sort_column]:
+            self.__unsorted = True
+
+    def sort_by(self, column, reverse: bool = False):
+        """Sort rows by values of column; None is order of rows."""
+
+        self.sort_column = column
+        self.reverse = reverse
+        self.__unsorted = True
+
+    def next_sort(self):
+        """Sort by the next column, after the last one by order of rows."""
+
+        if self.sort_column is None:
+            self.sort_by(0, self.reverse)
+        elif self.sort_column + 1 < len(self.field_names):
+            self.sort_by(self.sort_column + 1, self.reverse)
+        else:
+            self.sort_by(None, self.reverse)
+
+    def get_order(self) -> list:
+        """Return indices of shown rows in the current order."""
+
+        if self.__unsorted:
+            if self.sort_column is None:
+                self.order.sort(reverse=self.reverse)
+            else:
+                column = self.sort_column
+                values = self.values
+                self.order.sort(
+                    key=lambda index: get_sort_key(values[index][column]),
+                    reverse=self.reverse)
+            self.__unsorted = False
+        return self.order
+
+    def get_header(self) -> tuple:
+        """Return names of columns, with mark of sort column."""
+
+        names = list(self.field_names)
+        if self.sort_column is not None:
+            names[self.sort_column] += ' v' if self.reverse else ' ^'
+        return tuple(names)
+
+
+class TableRenderer:
+    """Draws RowModel on asciimatics screen without clearing it.
+     For every line of viewport it remembers row and version,
+     which were drawn there, so frame costs a check per visible line,
+     and only cells, which differ from drawn ones, are printed.
+     Screen is drawn again fully only after resize
+     or after width of some column grew."""
+
+    def __init__(self, screen, model: RowModel):
+        self.screen = screen
+        self.model = model
+        self.offset = 0
+        self.__drawn = {}
+        self.__drawn_cells = {}
+        self.__header = None
+        self.__status = None
+        self.__widths = None
+        self.__dimensions = None
+
+    @property
+    def page_size(self) -> int:
+        """Return count of rows, which fit between header and status."""
+
+        return max(1, self.screen.dimensions[0] - 2)
+
+    def handle_key(self, key) -> bool:
+        """Scroll or sort table by key; return False,
+         if key is not handled."""
+
+        if key in SCROLL_LINES:
+            self.scroll(SCROLL_LINES[key])
+        elif key in SCROLL_PAGES:
+            self.scroll(SCROLL_PAGES[key] * self.page_size)
+        elif key == Screen.KEY_HOME:
+            self.offset = 0
+        elif key == Screen.KEY_END:
+            self.scroll(len(self.model.order))
+        elif key in SORT_KEYS:
+            self.model.next_sort()
+        elif key in REVERSE_KEYS:
+            self.model.sort_by(self.model.sort_column,
+                               not self.model.reverse)
+        else:
+            return False
+        return True
+
+    def scroll(self, lines: int):
+        """Move viewport by lines, keeping it inside table."""
+
+        last = max(0, len(self.model.order) - self.page_size)
+        self.offset = min(max(0, self.offset + lines), last)
+
+    def invalidate(self):
+        """Forget drawn lines, so the next frame draws all of them."""
+
+        self.__drawn = {}
+        self.__drawn_cells = {}
+        self.__header = None
+        self.__status = None
+
+    def draw(self, status: str = ''):
+        """Draw changed lines of viewport and status line."""
+
+        screen = self.screen
+        dimensions = screen.dimensions
+        if dimensions != self.__dimensions or \
+                self.model.widths != self.__widths:
+            screen.clear_buffer(Screen.COLOUR_WHITE, 0, Screen.COLOUR_BLACK)
+            self.invalidate()
+            self.__dimensions = dimensions
+            self.__widths = list(self.model.widths)
+        order = self.model.get_order()
+        self.scroll(0)
+        header = self.model.get_header()
+        if header != self.__header:
+            self.__print_cells(0, header, self.__header)
+            self.__header = header
+        page_size = self.page_size
+        visible = order[self.offset:self.offset + page_size]
+        for line, index in enumerate(visible, 1):
+            drawn = (index, self.model.versions[index])
+            if self.__drawn.get(line) == drawn:
+                continue
+            cells = self.model.cells[index]
+            self.__print_cells(line, cells, self.__drawn_cells.get(line))
+            self.__drawn[line] = drawn
+            self.__drawn_cells[line] = cells
+        for line in range(len(visible) + 1, page_size + 1):
+            if line in self.__drawn:
+                screen.print_at(' ' * dimensions[1], 0, line)
+                del self.__drawn[line]
+                del self.__drawn_cells[line]
+        status = 'Rows {}-{} of {}. {}'.format(
+            min(self.offset + 1, len(order)),
+            self.offset + len(visible), len(order), status)
+        if status != self.__status:
+            screen.print_at(status.ljust(dimensions[1])[:dimensions[1]],
+                            0, page_size + 1)
+            self.__status = status
+        screen.refresh()
+
+    def __print_cells(self, line: int, cells: tuple, drawn_cells):
+        x = 0
+        for column, (cell, width) in enumerate(zip(cells,
+                                                   self.__widths)):
+            if drawn_cells is None or drawn_cells[column] != cell:
+                self.screen.print_at(cell.ljust(width), x, line)
+            x += width + COLUMN_GAP
@@ -0,0 +1,308 @@
+import asyncio
+import math
+import threading
+from array import array
+from collections import deque
+from tcping import errors
+from tcping import pacing
+from tcping import ping
+from watchdog import watchdog_ping
+
+# count of results, which probing thread can publish ahead of consumer
+RESULTS_BUFFER_SIZE = 1 << 16
+
+
+class ResultsChannel:
+    """Bounded ring buffer of results, published by probing thread
+     and drained by consumer thread at its own rate.
+     append and popleft of deque are atomic, so neither side
+     takes a lock; if consumer lags behind by size results,
+     the oldest ones are dropped and counted, so it is meant
+     for consumers like display, which need only recent results."""
+
+    def __init__(self, size: int = RESULTS_BUFFER_SIZE):
+        self.buffer = deque(maxlen=size)
+        self.dropped = 0
+
+    def publish(self, item):
+        """Append item, dropping the oldest one, if buffer is full."""
+
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append(item)
+
+    def drain(self) -> list:
+        """Return list of items, published since previous drain."""
+
+        items = []
+        buffer = self.buffer
+        while True:
+            try:
+                items.append(buffer.popleft())
+            except IndexError:
+                return items
+
+
+class DeadlineHeap:
+    """Binary heap of indices of targets, ordered by their deadlines.
+     Deadlines are kept in array by index of target, and heap
+     is array of indices, so scheduled target costs 12 bytes
+     instead of tuple (deadline, index) with its float and int."""
+
+    def __init__(self, count: int = 0, deadline: float = 0.0):
+        self.deadlines = array('d', [deadline]) * count
+        # equal deadlines are heap in any order
+        self.heap = array('I', range(count))
+
+    def peek(self) -> float:
+        """Return the nearest deadline."""
+
+        return self.deadlines[self.heap[0]]
+
+    def push(self, index: int, deadline: float):
+        """Schedule target with index on deadline."""
+
+        self.deadlines[index] = deadline
+        heap = self.heap
+        heap.append(index)
+        position = len(heap) - 1
+        while position:
+            parent = (position - 1) >> 1
+            if self.deadlines[heap[parent]] <= deadline:
+                break
+            heap[position] = heap[parent]
+            position = parent
+        heap[position] = index
+
+    def pop(self) -> tuple:
+        """Remove target with the nearest deadline
+         and return tuple (deadline, index)."""
+
+        heap = self.heap
+        deadlines = self.deadlines
+        first = heap[0]
+        index = heap.pop()
+        if heap:
+            deadline = deadlines[index]
+            size = len(heap)
+            position = 0
+            child = 1
+            while child < size:
+                right = child + 1
+                if right < size \
+                        and deadlines[heap[right]] < deadlines[heap[child]]:
+                    child = right
+                if deadlines[heap[child]] >= deadline:
+                    break
+                heap[position] = heap[child]
+                position = child
+                child = 2 * position + 1
+            heap[position] = index
+        return deadlines[first], first
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class ProbeScheduler:
+    """Owns group of AsyncTCPing objects and pings them concurrently
+     on one long-lived event loop.
+     Measures stay in the current process,
+     so every ping keeps statistics of its measures.
+     pings are list of AsyncTCPing objects with intervals
+     or PingTargets with their own intervals, which create pings
+     on demand; if PingTargets do not keep pings, the latest measures
+     are not kept either, so target costs only its deadline.
+
+     Every destination can be pinged on its own interval:
+     deadlines are kept in DeadlineHeap, and one timer of the event loop
+     is armed on the nearest deadline, so due pings are dispatched
+     without scanning of all destinations.
+     At most concurrency pings run at once: due deadlines stay
+     in the heap, until running pings finish, so tasks exist only
+     for running pings, however many destinations are due.
+     If pacer is given, pings are also started at its rate.
+     Ping, which raised PingError, gets failed measure
+     and is scheduled again like others.
+
+     Event loop runs either in poll or in background thread,
+     started by start_thread. Finished pings are published into
+     ResultsChannel as tuples (index, measure, summary), where summary
+     is result of summarize(tcp_ping, measure), computed in probing
+     thread, so consumer does not read statistics, while they change.
+     Consumers, which must see every ping, like export, are passed
+     as observe(measure, destination) and called in probing thread
+     before publishing, so they do not lose pings, dropped by channel."""
+
+    def __init__(self, pings,
+                 concurrency: int = 100,
+                 intervals: list = None,
+                 pacer: pacing.Pacer = None,
+                 summarize=None,
+                 observe=None,
+                 results_size: int = RESULTS_BUFFER_SIZE):
+        if not isinstance(pings, watchdog_ping.PingTargets):
+            pings = watchdog_ping.PingTargets.from_pings(pings, intervals)
+        self.pings = pings
+        self.concurrency = int(concurrency)
+        self.latest = [None] * len(pings) if pings.keep_pings else None
+        self.pacer = pacer
+        self.summarize = summarize
+        self.observe = observe
+        self.results = ResultsChannel(results_size)
+        self.loop = asyncio.new_event_loop()
+        self.thread = None
+        self.__deadlines = DeadlineHeap()
+        self.__timer = None
+        self.__tasks = set()
+        self.__closing = False
+
+    def run_round(self) -> list:
+        """Ping every destination once and return list
+         of tuples (measure, destination)."""
+
+        measures = self.loop.run_until_complete(
+            ping.run_pings(self.pings, 1, self.concurrency, self.pacer))
+        for index, measure in enumerate(measures):
+            if self.latest is not None:
+                self.latest[index] = measure
+            if self.observe is not None:
+                self.observe(measure, self.pings.get_destination(index))
+        return [(measure, self.pings.get_destination(index))
+                for index, measure in enumerate(measures)]
+
+    def start(self):
+        """Schedule first ping of every destination right now."""
+
+        self.__deadlines = DeadlineHeap(len(self.pings), self.loop.time())
+        self.__arm_timer()
+
+    def poll(self, duration: float) -> list:
+        """Run scheduled pings for duration seconds and
+         return list of tuples (measure, destination),
+         completed since previous poll."""
+
+        self.loop.run_until_complete(asyncio.sleep(duration))
+        return [(measure, self.pings.get_destination(index))
+                for index, measure, _ in self.drain()]
+
+    def start_thread(self):
+        """Ping in background thread, which runs event loop
+         of scheduler, until close; results are taken by drain."""
+
+        self.thread = threading.Thread(target=self.__run_thread,
+                                       daemon=True)
+        self.thread.start()
+
+    def drain(self) -> list:
+        """Return list of tuples (index, measure, summary) of pings,
+         finished since previous drain."""
+
+        return self.results.drain()
+
+    def get_latest(self) -> list:
+        """Return list of tuples (measure, destination) with
+         the last measure of every destination, which was pinged."""
+
+        if self.latest is None:
+            return []
+        return [(measure, self.pings.get_destination(index))
+                for index, measure in enumerate(self.latest)
+                if measure is not None]
+
+    def get_latest_statistics(self) -> list:
+        """Return list of StreamingStatistics of every destination,
+         which was pinged, in the same order as get_latest."""
+
+        if self.latest is None:
+            return []
+        return [self.pings[index].statistics
+                for index, measure in enumerate(self.latest)
+                if measure is not None]
+
+    def __run_thread(self):
+        asyncio.set_event_loop(self.loop)
+        self.start()
+        self.loop.run_forever()
+
+    def __arm_timer(self):
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+        # at full concurrency, finished pings dispatch due ones
+        if self.__deadlines and len(self.__tasks) < self.concurrency:
+            self.__timer = self.loop.call_at(self.__deadlines.peek(),
+                                             self.__dispatch)
+
+    def __dispatch(self):
+        self.__timer = None
+        now = self.loop.time()
+        while self.__deadlines and self.__deadlines.peek() <= now \
+                and len(self.__tasks) < self.concurrency:
+            deadline, index = self.__deadlines.pop()
+            task = self.loop.create_task(self.__ping(index, deadline))
+            self.__tasks.add(task)
+            task.add_done_callback(self.__finish)
+        self.__arm_timer()
+
+    def __finish(self, task: asyncio.Task):
+        self.__tasks.discard(task)
+        if not self.__closing:
+            self.__dispatch()
+
+    async def __ping(self, index: int, deadline: float):
+        tcp_ping = self.pings[index]
+        if self.pacer is not None:
+            await self.pacer.wait_async(tcp_ping.destination)
+        lateness = max(0.0, self.loop.time() - deadline)
+        try:
+            measure = await tcp_ping.do_ping_async(lateness)
+        except errors.PingError:
+            # like unresolved name, which can be fixed later
+            measure = tcp_ping.add_failed_measure(lateness)
+        if self.latest is not None:
+            self.latest[index] = measure
+        if self.observe is not None:
+            self.observe(measure, tcp_ping.destination)
+        summary = None
+        if self.summarize is not None:
+            summary = self.summarize(tcp_ping, measure)
+        self.results.publish((index, measure, summary))
+        self.__schedule(index, deadline)
+
+    def __schedule(self, index: int, deadline: float):
+        interval = self.pings.get_interval(index)
+        now = self.loop.time()
+        if interval > 0:
+            # missed deadlines are skipped, so schedule does not drift
+            missed = max(0, math.ceil((now - deadline) / interval))
+            deadline += interval * max(1, missed)
+        else:
+            deadline = now
+        self.__deadlines.push(index, deadline)
+        if self.__deadlines.peek() == deadline:
+            self.__arm_timer()
+
+    def close(self):
+        """Cancel scheduled pings, stop probing thread
+         and close event loop of scheduler."""
+
+        self.__closing = True
+        if self.thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.thread = None
+        if self.__timer is not None:
+            self.__timer.cancel()
+        for task in list(self.__tasks):
+            task.cancel()
+        if self.__tasks:
+            self.loop.run_until_complete(
+                asyncio.gather(*self.__tasks, return_exceptions=True))
+        self.loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
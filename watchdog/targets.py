@@ -0,0 +1,172 @@
+import bisect
+import ipaddress
+import itertools
+from tcping import errors
+from tcping import socket_pool
+
+# port of targets without ports
+DEFAULT_PORT = 80
+# count of targets of one line, above which it is rejected,
+# so IPv6 network like '2001:db8::/64' is not taken for targets
+MAX_TARGETS = 1 << 32
+
+
+def parse_ports(text: str) -> list:
+    """Return list of tuples (first port, stop port) of ports
+     like '22,80,443,8000-8100'. Raise InvalidPort, if some is invalid."""
+
+    return [socket_pool.parse_port_range(part.strip())
+            for part in text.split(',')]
+
+
+def parse_hosts(text: str) -> tuple:
+    """Return tuple (first host, count of hosts) of target:
+     first address and count of addresses of CIDR block
+     like '10.0.0.0/16', which are the same as network.hosts(),
+     or the host itself and 1."""
+
+    if not text or len(text.split()) != 1:
+        raise errors.InvalidIpOrDomain
+    if '/' not in text:
+        return text, 1
+    try:
+        network = ipaddress.ip_network(text, strict=False)
+    except ValueError:
+        raise errors.InvalidTarget
+    count = network.num_addresses
+    if count <= 2:
+        return network.network_address, count
+    # network address is not host; IPv4 broadcast address either
+    if network.version == 4:
+        return network.network_address + 1, count - 2
+    return network.network_address + 1, count - 1
+
+
+def split_target(text: str) -> tuple:
+    """Return tuple (hosts, ports, interval) of target like
+     'host_or_cidr[:ports][@interval]'; IPv6 address with ports
+     is written in brackets: '[::1]:80'. Parts are stripped of spaces;
+     missing ports are None, missing interval is empty."""
+
+    text, _, interval = text.strip().partition('@')
+    text = text.strip()
+    interval = interval.strip()
+    if text.startswith('['):
+        hosts, bracket, rest = text[1:].partition(']')
+        rest = rest.strip()
+        if not bracket or rest and not rest.startswith(':'):
+            raise errors.InvalidTarget
+        return hosts.strip(), rest[1:].strip() if rest else None, interval
+    if text.count(':') == 1:
+        hosts, _, ports = text.partition(':')
+        return hosts.strip(), ports.strip(), interval
+    return text, None, interval
+
+
+def parse_target(text: str) -> 'TargetSpec':
+    """Check target like 'host_or_cidr[:ports][@interval]' and
+     return TargetSpec of it, which is iterated lazily into
+     destinations (host, port[, interval]), like
+     WatchdogPingData.parse_destinations does, for every host
+     and port of it. Raise PingError, if target is invalid."""
+
+    hosts, ports, interval = split_target(text)
+    first_host, host_count = parse_hosts(hosts)
+    port_ranges = [(DEFAULT_PORT, DEFAULT_PORT + 1)] if ports is None \
+        else parse_ports(ports)
+    if interval:
+        try:
+            if float(interval) < 0:
+                raise ValueError
+        except ValueError:
+            raise errors.InvalidInterval
+    if host_count * sum(stop - first for first, stop in port_ranges) \
+            > MAX_TARGETS:
+        raise errors.InvalidTarget
+    return TargetSpec(first_host, host_count, port_ranges, interval or None)
+
+
+class TargetSpec:
+    """Parsed target: first host and count of hosts, port ranges
+     and interval text or None. Targets are not expanded:
+     (host, port) of target is computed from its index,
+     hosts are major and ports are minor, so target of
+     '10.0.0.0/16:8000-8100' costs nothing but the spec.
+     Iterating yields destinations (host, port[, interval])."""
+
+    __slots__ = ('first_host', 'host_count', 'port_ranges',
+                 'port_ends', 'interval')
+
+    def __init__(self, first_host, host_count: int,
+                 port_ranges: list, interval: str = None):
+        self.first_host = first_host
+        self.host_count = host_count
+        self.port_ranges = port_ranges
+        # count of ports up to the end of every range
+        self.port_ends = list(itertools.accumulate(
+            stop - first for first, stop in port_ranges))
+        self.interval = interval
+
+    @staticmethod
+    def from_destination(destination: tuple) -> 'TargetSpec':
+        """Make spec of destination (host, port[, interval])."""
+
+        port = int(destination[1])
+        interval = destination[2] if len(destination) > 2 else None
+        return TargetSpec(destination[0], 1, [(port, port + 1)], interval)
+
+    def get_host(self, index: int) -> str:
+        """Return host of target with index."""
+
+        return self.__get_host(index // self.port_ends[-1])
+
+    def __get_host(self, host_index: int) -> str:
+        if not host_index:
+            return str(self.first_host)
+        return str(self.first_host + host_index)
+
+    def __len__(self):
+        return self.host_count * self.port_ends[-1]
+
+    def __getitem__(self, index: int) -> tuple:
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        host_index, port_index = divmod(index, self.port_ends[-1])
+        range_index = bisect.bisect_right(self.port_ends, port_index)
+        first, stop = self.port_ranges[range_index]
+        if range_index:
+            port_index -= self.port_ends[range_index - 1]
+        return self.__get_host(host_index), first + port_index
+
+    def __iter__(self):
+        suffix = () if self.interval is None else (self.interval,)
+        for host_index in range(self.host_count):
+            host = self.__get_host(host_index)
+            for first, stop in self.port_ranges:
+                for port in range(first, stop):
+                    yield (host, str(port)) + suffix
+
+
+class TargetLoader:
+    """Reads targets from lines of file, one target per line
+     like 'host_or_cidr[:ports][@interval]', where ports are like
+     '22,80,443,8000-8100', and yields TargetSpec of every line.
+     Empty lines and comments after '#' are skipped.
+     Invalid line is skipped, and tuple (line number, line, error)
+     is added to errors."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.errors = []
+
+    def __iter__(self):
+        for number, line in enumerate(self.lines, 1):
+            text = line.split('#', 1)[0].strip()
+            if not text:
+                continue
+            try:
+                spec = parse_target(text)
+            except errors.PingError as e:
+                self.errors.append((number, text, e))
+                continue
+            yield spec
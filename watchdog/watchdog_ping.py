@@ -1,47 +1,95 @@
-from tcping import errors
+import bisect
+from array import array
 from tcping import ping
+from watchdog import targets
 from prettytable import PrettyTable
 
+# percentiles of time, shown in table of measures
+PERCENTILES_TO_PRINT = (50, 99)
+
 
 class WatchdogPingData:
     """Contains methods  to get asyncio tasks,
      group of Ping objects and
-         table with information about group of pings."""
+         table with information about group of pings.
+         Pings keep only streaming statistics of their measures,
+         unless keep_measures is set, so memory does not grow with time."""
 
     def __init__(self, destinations: list = None,
                  timeout: float = 0,
-                 use_ipv6: bool = False):
+                 use_ipv6: bool = False,
+                 keep_measures: bool = False):
         self.destinations = destinations or []
         self.timeout = timeout
         self.use_ipv6 = use_ipv6
+        self.keep_measures = keep_measures
 
     @staticmethod
     def parse_destinations(raw_destinations: list) -> list:
         """Method, parse from group of strings lke
-                'domain_or_port:[port]' and return tuple."""
+                'domain_or_port:[port][@interval]' and return tuple.
+                Interval is added to tuple only if it was set.
+                Ports can be given as list of ranges like '22,8000-8100'
+                and IP's as CIDR block like '10.0.0.0/24',
+                then tuple is returned for every port of every IP."""
 
         destinations_result = []
         for destination in raw_destinations:
-            parts = destination.split(":")
-            if len(parts) > 1:
-                try:
-                    destinations_result.append((parts[0], parts[1]))
-                except Exception:
-                    raise errors.InvalidPort
-            else:
-                destinations_result.append((parts[0], "80"))
+            destinations_result.extend(targets.parse_target(destination))
         return destinations_result
 
-    def get_pings(self) -> list:
-        """Method, make ping objects from destinations
+    def get_intervals(self, default_interval: float = 0) -> list:
+        """Method, return list of intervals between pings
+         for every destination; if interval of destination
+         was not set, default_interval is used."""
+
+        intervals = []
+        for destination in self.destinations:
+            if len(destination) > 2:
+                intervals.append(float(destination[2]))
+            else:
+                intervals.append(float(default_interval))
+        return intervals
+
+    def get_targets(self, ping_type: type = ping.TCPing,
+                    default_interval: float = 0,
+                    keep_pings: bool = True) -> 'PingTargets':
+        """Method, return PingTargets of destinations, which are
+         tuples or TargetSpec objects, iterating them once,
+         so they can be generator. Targets without interval
+         get default_interval. Pings of ping_type are created
+         by PingTargets on demand."""
+
+        def make_ping(destination: str, port: int) -> ping.TCPing:
+            return ping_type(destination=destination,
+                             port=port,
+                             timeout=self.timeout,
+                             use_ipv6=self.use_ipv6,
+                             keep_measures=self.keep_measures)
+
+        ping_targets = PingTargets(make_ping, keep_pings)
+        for destination in self.destinations:
+            if not isinstance(destination, targets.TargetSpec):
+                destination = targets.TargetSpec.from_destination(
+                    destination)
+            if destination.interval is not None:
+                interval = float(destination.interval)
+            else:
+                interval = float(default_interval)
+            ping_targets.append(destination, interval)
+        return ping_targets
+
+    def get_pings(self, ping_type: type = ping.TCPing) -> list:
+        """Method, make ping objects of ping_type from destinations
          and return list of pings."""
 
         pings = []
         for destination in self.destinations:
-            wd_ping = ping.TCPing(destination=destination[0],
-                                  port=destination[1],
-                                  timeout=self.timeout,
-                                  use_ipv6=self.use_ipv6)
+            wd_ping = ping_type(destination=destination[0],
+                                port=destination[1],
+                                timeout=self.timeout,
+                                use_ipv6=self.use_ipv6,
+                                keep_measures=self.keep_measures)
             pings.append(wd_ping)
         return pings
 
@@ -60,27 +108,137 @@ class WatchdogPingData:
         return max, min
 
     @staticmethod
-    def get_measures_to_print(meaures: list) -> PrettyTable:
+    def get_field_names(with_percentiles: bool = False) -> list:
+        """Method, return names of columns of table of measures."""
+
+        field_names = ['destination',
+                       'ip',
+                       'port',
+                       'time ms',
+                       'condition']
+        if with_percentiles:
+            field_names += ['p{} ms'.format(percent)
+                            for percent in PERCENTILES_TO_PRINT]
+        return field_names
+
+    @staticmethod
+    def get_row(measure, destination: str,
+                ping_statistics=None) -> list:
+        """Method, return row of table of measures with
+         time, ip and port status of measure of destination.
+         If StreamingStatistics of destination is given,
+         percentiles of time are added to row."""
+
+        time = round(measure, 3)
+        if measure.is_failed:
+            condition = "Closed"
+        else:
+            condition = "Open"
+        if time < 0:
+            time = "-"
+        row = [destination, measure.ip, measure.port, time, condition]
+        if ping_statistics is not None:
+            row += [round(ping_statistics.percentile(percent), 3)
+                    for percent in PERCENTILES_TO_PRINT]
+        return row
+
+    @staticmethod
+    def get_measures_to_print(meaures: list,
+                              pings_statistics: list = None) -> PrettyTable:
         """Method, takes list of tuples (measure, destination) and
                  return table with information about
-                  time, ip and port status for group of measures."""
+                  time, ip and port status for group of measures.
+                  If list of StreamingStatistics of destinations is given,
+                  percentiles of time are added to table."""
 
         table = PrettyTable()
-        table.field_names = ['destination',
-                             'ip',
-                             'port',
-                             'time ms',
-                             'condition']
-        for measure_with_destination in meaures:
-            destination = measure_with_destination[1]
-            port = measure_with_destination[0].port
-            time = round(measure_with_destination[0], 3)
-            ip = measure_with_destination[0].ip
-            if measure_with_destination[0].is_failed:
-                condition = "Closed"
-            else:
-                condition = "Open"
-            if time < 0:
-                time = "-"
-            table.add_row([destination, ip, port, time, condition])
+        table.field_names = WatchdogPingData.get_field_names(
+            pings_statistics is not None)
+        for i, (measure, destination) in enumerate(meaures):
+            table.add_row(WatchdogPingData.get_row(
+                measure, destination,
+                None if pings_statistics is None else pings_statistics[i]))
         return table
+
+
+class PingTargets:
+    """Sequence of pings of targets, which are kept as TargetSpec
+     with interval of its targets, so (destination, port) of target
+     is computed from its index, and target costs nothing, however
+     many targets spec has. Ping of target is created by
+     make_ping(destination, port), when it is taken by index.
+     If keep_pings is set, created ping is kept and taken again,
+     so it accumulates statistics, and every pinged target costs
+     its ping object, about 1.5 KB; otherwise every probe gets new ping."""
+
+    def __init__(self, make_ping=None, keep_pings: bool = True):
+        self.specs = []
+        # count of targets up to the end of every spec
+        self.ends = []
+        self.intervals = array('d')
+        self.make_ping = make_ping
+        self.pings = {} if keep_pings else None
+
+    @staticmethod
+    def from_pings(pings: list, intervals: list = None) -> 'PingTargets':
+        """Make targets of pings, which are already created,
+         with intervals of them; intervals are 0 by default."""
+
+        ping_targets = PingTargets()
+        for index, tcp_ping in enumerate(pings):
+            ping_targets.append(
+                targets.TargetSpec.from_destination((tcp_ping.destination,
+                                                     tcp_ping.port)),
+                intervals[index] if intervals else 0)
+            ping_targets.pings[index] = tcp_ping
+        return ping_targets
+
+    @property
+    def keep_pings(self) -> bool:
+        return self.pings is not None
+
+    def append(self, spec: targets.TargetSpec, interval: float = 0):
+        """Add targets of spec, pinged every interval seconds."""
+
+        self.specs.append(spec)
+        self.ends.append(len(self) + len(spec))
+        self.intervals.append(interval)
+
+    def get_destination(self, index: int) -> str:
+        """Return destination of target without creating its ping."""
+
+        spec_index, offset = self.__locate(index)
+        return self.specs[spec_index].get_host(offset)
+
+    def get_interval(self, index: int) -> float:
+        """Return interval between pings of target."""
+
+        return self.intervals[self.__locate(index)[0]]
+
+    def __locate(self, index: int) -> tuple:
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        spec_index = bisect.bisect_right(self.ends, index)
+        if spec_index:
+            index -= self.ends[spec_index - 1]
+        return spec_index, index
+
+    def __make_ping(self, index: int) -> ping.TCPing:
+        spec_index, offset = self.__locate(index)
+        return self.make_ping(*self.specs[spec_index][offset])
+
+    def __len__(self):
+        return self.ends[-1] if self.ends else 0
+
+    def __getitem__(self, index: int) -> ping.TCPing:
+        if self.pings is None:
+            return self.__make_ping(index)
+        tcp_ping = self.pings.get(index)
+        if tcp_ping is None:
+            tcp_ping = self.__make_ping(index)
+            self.pings[index] = tcp_ping
+        return tcp_ping
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]